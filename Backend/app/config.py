@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class Settings(BaseSettings):
     # Hugging Face token for accessing private models
@@ -18,22 +18,185 @@ class Settings(BaseSettings):
         "https://nlp-project-f223i81vf-yuhuengs-projects.vercel.app"
     ]
 
+    # Inference backend: "remote" (HF Spaces via gradio_client) or "local"
+    # (in-process base model with per-persona LoRA adapters)
+    inference_backend: str = "remote"
+
+    # Override the HF Space each remote persona calls, keyed by persona slug
+    # ("*" applies to all), e.g. {"*": "http://127.0.0.1:7860/"} for the
+    # local stub in benchmarks/stub_space.py
+    persona_space_urls: Dict[str, str] = {}
+
+    # Equivalent backends for remote personas, keyed by persona slug ("*" applies
+    # to all), e.g. {"xmm": ["yuhueng/xmm-persona", "http://127.0.0.1:7861/"]}.
+    # Calls go to the replica with the fewest outstanding requests, then the best
+    # recent latency. With hedging on, a call still running at the persona's
+    # recent hedge_quantile latency is also sent to another replica, and the
+    # slower of the two is cancelled
+    persona_replicas: Dict[str, List[str]] = {}
+    hedging_enabled: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    replica_latency_window: int = 200
+
     # Hugging Face Model Configuration (hardcoded)
     base_model_name: str = "yuhueng/qwen3-4b-singlish-base"
     adapter_repo_name: Optional[str] = None
 
+    # LoRA adapters served by the local backend, keyed by persona slug.
+    # Personas without an entry run on the base model.
+    local_adapters: Dict[str, str] = {
+        "xmm": "Birthright00/singlish_adapter_4B-XMM-on-Singlish_no_system_prompt",
+        "nsf": "Birthright00/singlish_adapter_4B-NSF-on-Singlish_no_system_prompt",
+        "ahbeng": "JithinBathula/ah-beng-singlish-no-system-prompt",
+    }
+
+    # System prompts for local personas, keyed by persona slug. Their attention
+    # state is computed once per adapter and reused, as is the state of each
+    # conversation's previous turn, up to the token budget below
+    local_system_prompts: Dict[str, str] = {}
+    local_prefix_cache_enabled: bool = True
+    local_prefix_cache_max_tokens: int = 32768
+    local_prefix_cache_min_tokens: int = 16
+
+    # Dynamic batching for the local backend: requests for the same adapter that
+    # arrive within the wait window are generated together
+    local_batching_enabled: bool = True
+    local_batch_max_size: int = 8
+    local_batch_max_wait_ms: float = 10.0
+
+    # Longest wait for the next token of a local stream (prefill included)
+    # before the stream fails instead of holding the model
+    local_stream_token_timeout_seconds: float = 120.0
+
     # Model loading configuration (hardcoded)
     device: str = "auto"
     torch_dtype: str = "float16"
     load_in_8bit: bool = False
     load_in_4bit: bool = False
 
+    # Longest raw model output that is parsed; anything longer is passed through
+    model_output_max_chars: int = 16384
+
     # Generation parameters (hardcoded)
     max_new_tokens: int = 512
     temperature: float = 0.7
     top_p: float = 0.9
     do_sample: bool = True
 
+    # Inference worker pool, applied to each persona separately
+    inference_max_concurrency: int = 4
+    inference_max_queue_depth: int = 32
+
+    # Exact-match response cache (opt-in), one per persona. Personas listed by
+    # slug in response_cache_excluded_personas always go upstream
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: float = 600.0
+    response_cache_excluded_personas: List[str] = []
+
+    # Semantic response cache (opt-in, needs sentence-transformers): paraphrased
+    # messages are answered from a reply to a similar earlier message once the
+    # cosine similarity of their embeddings reaches the threshold. Personas
+    # listed by slug in semantic_cache_excluded_personas always go upstream
+    semantic_cache_enabled: bool = False
+    semantic_cache_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_max_entries: int = 2048
+    semantic_cache_ttl_seconds: float = 1800.0
+    semantic_cache_excluded_personas: List[str] = []
+
+    # Local safety pre-filter (opt-in): messages with clear-cut profanity or
+    # self-harm phrases get a templated persona reply, labelled "Unsafe" or
+    # "SelfHarm", without a model call. Personas listed by slug in
+    # safety_prefilter_excluded_personas skip it
+    safety_prefilter_enabled: bool = False
+    safety_prefilter_excluded_personas: List[str] = []
+
+    # Admission control: per-persona token buckets (requests per second and burst;
+    # a rate of 0 disables the limit) and the deadline assumed for requests that
+    # do not send X-Request-Timeout (matches the frontend's 30s axios timeout)
+    rate_limit_per_second: float = 5.0
+    rate_limit_burst: int = 20
+    bulk_rate_limit_per_second: float = 2.0
+    bulk_rate_limit_burst: int = 10
+    request_timeout_seconds: float = 30.0
+    request_max_timeout_seconds: float = 300.0
+
+    # Batch / fan-out chat API: items per request, items generated at once per
+    # batch (persona pools still apply), and the default deadline for a batch
+    batch_max_items: int = 500
+    batch_max_concurrency: int = 8
+    batch_timeout_seconds: float = 600.0
+
+    # Share one upstream call between identical concurrent requests
+    request_coalescing_enabled: bool = True
+
+    # Per-persona circuit breaker and retries for transient upstream errors
+    circuit_failure_threshold: int = 5
+    circuit_recovery_seconds: float = 30.0
+    retry_max_attempts: int = 3
+    retry_base_delay_seconds: float = 0.5
+    retry_max_delay_seconds: float = 4.0
+
+    # Server-side conversation sessions and the history budget for each prompt
+    session_max_sessions: int = 10000
+    session_idle_ttl_seconds: float = 1800.0
+    session_max_messages: int = 50
+    history_token_budget: int = 1024
+
+    # Persona client startup: connect concurrently, wait at most this long before
+    # serving, and keep retrying failed personas in the background with backoff.
+    # Connected personas are checked every supervisor_check_interval_seconds and
+    # reconnected when their circuit opens on connection errors
+    startup_connect_timeout_seconds: float = 30.0
+    reconnect_initial_delay_seconds: float = 5.0
+    reconnect_max_delay_seconds: float = 300.0
+    supervisor_check_interval_seconds: float = 10.0
+
+    # Keep-warm probes for remote personas, so idle HF Spaces do not fall asleep.
+    # Probe "config" fetches the Space's Gradio config (no GPU quota); "inference"
+    # sends keep_warm_probe_message through /inference. Quiet personas are probed
+    # less often the longer they stay idle, and not at all after max_idle; probes
+    # slower than the cold threshold count as cold starts
+    keep_warm_enabled: bool = True
+    keep_warm_probe: str = "config"
+    keep_warm_probe_message: str = "hi"
+    keep_warm_probe_timeout_seconds: float = 120.0
+    keep_warm_interval_seconds: float = 300.0
+    keep_warm_max_interval_seconds: float = 1800.0
+    keep_warm_traffic_window_seconds: float = 3600.0
+    keep_warm_max_idle_seconds: float = 43200.0
+    keep_warm_max_probes_per_hour: int = 12
+    keep_warm_cold_threshold_seconds: float = 5.0
+    keep_warm_excluded_personas: List[str] = []
+
+    # Opt-in traffic capture for benchmarks/replay.py. Mode "scrubbed" keeps
+    # message text with personal data masked, "shape" keeps only lengths
+    capture_enabled: bool = False
+    capture_path: str = "captures/traffic.jsonl"
+    capture_mode: str = "scrubbed"
+    capture_max_bytes: int = 100_000_000
+    capture_sample_rate: float = 1.0
+
+    # Logging: per-request lines are sampled (1.0 keeps all of them); warnings
+    # and errors are always logged
+    log_level: str = "INFO"
+    log_request_sample_rate: float = 1.0
+
+    # Per-request trace spans (validation, admission, queue, upstream, parse, ...).
+    # Server-Timing headers are opt-in; requests slower than the threshold are
+    # kept in a ring buffer served by /api/admin/slow-requests
+    tracing_enabled: bool = True
+    server_timing_enabled: bool = False
+    slow_request_threshold_seconds: float = 5.0
+    slow_request_log_size: int = 100
+
+    # Admin endpoints (slow requests, sampling profiler) are only served when a
+    # token is set; clients send it in the X-Admin-Token header
+    admin_token: Optional[str] = None
+    profiler_max_seconds: float = 60.0
+
     # Legacy fields (kept for compatibility)
     model_name: str = "yuhueng/qwen3-4b-singlish-base"
     model_path: str = "yuhueng/qwen3-4b-singlish-base"
@@ -0,0 +1,75 @@
+from app.config import settings
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import copy
+import logging
+import queue
+import random
+
+# Per-request lines (timings, generated responses) are logged here and sampled
+REQUEST_LOGGER = "app.requests"
+
+_listener: Optional[QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Let through a `rate` fraction of records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DeferredFormatQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the whole record (including any traceback) on
+    the calling thread. Here only %-style args are merged into the message,
+    since they may refer to objects that change before the listener gets to
+    them; exc_info is passed through and the traceback formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging():
+    """
+    Route all log records through a queue, so formatting (tracebacks included)
+    and writing to stderr happen on a background thread instead of in request
+    handlers. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    root.addHandler(DeferredFormatQueueHandler(log_queue))
+
+    logging.getLogger(REQUEST_LOGGER).addFilter(SamplingFilter(settings.log_request_sample_rate))
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
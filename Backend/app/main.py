@@ -1,13 +1,37 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import chat
+from app.routers import chat, admin
 from app.config import settings
+from app.services.lifecycle import supervisor, keep_warm
+from app.services.capture import traffic_capture
+from app.services.metrics import PersonaStatsCollector
+from app.services.tracing import TracingMiddleware
+from app.services.model import persona_services
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect persona clients concurrently; failures keep retrying in the background
+    await supervisor.start()
+    # Probe idle Spaces so they do not fall asleep between users
+    if keep_warm is not None:
+        await keep_warm.start()
+    yield
+    if keep_warm is not None:
+        await keep_warm.stop()
+    await supervisor.stop()
+    if traffic_capture is not None:
+        traffic_capture.close()
 
 app = FastAPI(
     title=settings.api_title,
     description="API for Singlish conversational AI chatbot",
     version=settings.api_version,
-    debug=settings.debug
+    debug=settings.debug,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -19,8 +43,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time each request's stages; added last so it wraps everything else
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(chat.router, prefix="/api", tags=["chat"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+
+# Pool, cache and circuit state is read from the services at scrape time
+REGISTRY.register(PersonaStatsCollector(persona_services))
 
 @app.get("/")
 async def root():
@@ -29,6 +60,8 @@ async def root():
         "version": settings.api_version,
         "model_status": "/api/model-status",
         "health": "/api/health",
+        "ready": "/api/ready",
+        "metrics": "/metrics",
         "chat": "/api/chat"
     }
 
@@ -36,6 +69,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.host, port=settings.port)
\ No newline at end of file
@@ -14,11 +14,27 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[ChatMessage]] = []
+    # Client-chosen id for a server-side session; when set, history is kept on the
+    # server and conversation_history is only used to seed a new session
+    session_id: Optional[str] = None
+
+class BatchChatItem(BaseModel):
+    # Optional client reference echoed back with the result
+    id: Optional[str] = None
+    persona: str = "singlish"
+    message: str
+    conversation_history: Optional[List[ChatMessage]] = []
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = []
+    # "Ask all personas": send this one message to every persona
+    ask_all: Optional[ChatRequest] = None
 
 class ChatResponse(BaseModel):
     response: str
     safety: str
     timestamp: datetime
+    session_id: Optional[str] = None
 
 class HealthCheck(BaseModel):
     status: str
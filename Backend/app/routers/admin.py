@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException, Header, Depends, Query
+from fastapi.responses import PlainTextResponse
+from app.services.tracing import slow_requests
+from app.services.profiler import profiler, ProfilerBusyError
+from app.config import settings
+from typing import Optional
+import asyncio
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need ADMIN_TOKEN to be configured and sent back in X-Admin-Token."""
+    if not settings.admin_token:
+        raise HTTPException(
+            status_code=404,
+            detail="Admin endpoints are disabled"
+        )
+    if not hmac.compare_digest(x_admin_token or "", settings.admin_token):
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid admin token"
+        )
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/slow-requests")
+async def get_slow_requests(limit: Optional[int] = Query(None, ge=1)):
+    """
+    Most recent requests slower than SLOW_REQUEST_THRESHOLD_SECONDS, newest
+    first, with the timed spans of each (validation, admission, queue,
+    upstream, parse, ...).
+    """
+    return {
+        **slow_requests.get_status(),
+        "requests": slow_requests.get_recent(limit)
+    }
+
+@router.post("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Sample the stacks of every thread of the live process for `seconds` and
+    return them in the collapsed-stack format ("frame;frame;... count" per
+    line), ready for flamegraph.pl, inferno or speedscope. `limit` keeps only
+    the most frequent stacks. Returns 409 while another profile is running.
+    """
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profiles are limited to {settings.profiler_max_seconds} seconds"
+        )
+
+    logger.info(f"Profiling for {seconds} seconds every {interval_ms} ms")
+    try:
+        # Sample from a helper thread so the event loop keeps serving (and shows up in the profile)
+        result = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e)
+        )
+
+    return PlainTextResponse(
+        profiler.collapse(result["stacks"], limit),
+        headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Seconds": f"{result['seconds']:.3f}"
+        }
+    )
@@ -1,133 +1,397 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import ChatRequest, ChatResponse, HealthCheck, ErrorResponse
-from app.services.model import model_service, singlish_service, xmm_service, ahbeng_service, nsf_service
+from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi.responses import StreamingResponse, JSONResponse
+from app.models.schemas import ChatRequest, ChatResponse, ChatMessage, HealthCheck, ErrorResponse, BatchChatItem, BatchChatRequest
+from app.services.model import model_service, singlish_service, xmm_service, ahbeng_service, nsf_service, persona_services
+from app.services.pool import QueueFullError, DeadlineExceededError, BULK
+from app.services.admission import (
+    RateLimitedError, RequestContext, admission, parse_priority, deadline_from_timeout
+)
+from app.services.sessions import Session, session_store
+from app.services.capture import traffic_capture
+from app.config import settings
+from app.logging_config import REQUEST_LOGGER
+from app.services import metrics, tracing
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import logging
-import json
+import math
+import orjson
+import time
 
 
 router = APIRouter()
+request_logger = logging.getLogger(REQUEST_LOGGER)
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+def _session_history(persona: str, request: ChatRequest) -> Tuple[Optional[Session], List[ChatMessage]]:
+    """Resolve the history for a request: the server-side session if one is named, else the payload."""
+    if not request.session_id:
+        return None, request.conversation_history or []
+    session = session_store.get_or_create(persona, request.session_id, request.conversation_history)
+    return session, session_store.snapshot(session)
+
+def _record_turn(session: Optional[Session], message: str, response_data: Dict[str, str]):
+    # System replies (quota / connection apologies) are not part of the conversation
+    if session is not None and response_data["safety"] != "System":
+        session_store.append_turn(session, message, response_data["response"])
+
+def request_context(
+    x_request_timeout: Optional[float] = Header(None),
+    x_request_priority: Optional[str] = Header(None)
+) -> RequestContext:
     """
-    Default chat endpoint - uses Singlish persona for backward compatibility.
+    Admission details from the request headers: X-Request-Timeout is the time in
+    seconds the client will still wait for an answer, X-Request-Priority is
+    "interactive" (default) or "bulk".
     """
-    try:
-        response_data = model_service.generate_response(
-            message=request.message,
-            conversation_history=request.conversation_history
-        )
-
-        logging.info(f"Generated response: {json.dumps(response_data)}")
+    return RequestContext(
+        priority=parse_priority(x_request_priority),
+        deadline=deadline_from_timeout(x_request_timeout)
+    )
 
-        return ChatResponse(
-            response=response_data["response"],
-            safety=response_data["safety"],
-            timestamp=datetime.now()
+def _admission_error(persona: str, e: Exception) -> Optional[HTTPException]:
+    """Map admission-control failures to fast HTTP errors with a Retry-After hint."""
+    if isinstance(e, RateLimitedError):
+        metrics.record_outcome(persona, metrics.RATE_LIMITED)
+        return HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
+    if isinstance(e, QueueFullError):
+        metrics.record_outcome(persona, metrics.QUEUE_FULL)
+        return HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    if isinstance(e, DeadlineExceededError):
+        metrics.record_outcome(persona, metrics.DEADLINE_EXCEEDED)
+        return HTTPException(
+            status_code=504,
             detail=str(e)
         )
+    return None
 
-@router.post("/chat/singlish", response_model=ChatResponse)
-async def chat_singlish(request: ChatRequest):
-    """
-    Chat endpoint for Singlish persona.
-    """
+def _capture(endpoint: str, persona: str, message: str, history: List[ChatMessage], status: int,
+             start_time: float, upstream: List[float], response_data: Optional[Dict[str, str]],
+             session_id: Optional[str], context: RequestContext):
+    """Hand one finished request to the traffic capture log, if capture is on."""
+    if traffic_capture is None:
+        return
+    with tracing.span("capture"):
+        traffic_capture.record(
+            endpoint=endpoint,
+            persona=persona,
+            message=message,
+            history=history,
+            status=status,
+            latency=time.perf_counter() - start_time,
+            upstream=upstream,
+            safety=response_data["safety"] if response_data else None,
+            session_id=session_id,
+            priority=context.priority_name
+        )
+
+async def _chat(persona: str, request: ChatRequest, context: RequestContext, log_prefix: str) -> ChatResponse:
+    """Shared implementation of the per-persona chat endpoints."""
+    # Routing, body parsing and validation all happen before the handler runs
+    tracing.span_since_start("validation")
+    tracing.annotate(persona=persona, endpoint="chat")
+    service = persona_services[persona]
+    start_time = time.perf_counter()
+    upstream = metrics.track_upstream()
+    status_code, history, response_data = 200, [], None
     try:
-        response_data = singlish_service.generate_response(
+        with tracing.span("admission"):
+            admission.admit(persona, context)
+        with tracing.span("session"):
+            session, history = _session_history(persona, request)
+        response_data = await service.generate_response_async(
             message=request.message,
-            conversation_history=request.conversation_history
+            conversation_history=history,
+            priority=context.priority,
+            deadline=context.deadline
         )
+        with tracing.span("session"):
+            _record_turn(session, request.message, response_data)
 
-        logging.info(f"[Singlish] Generated response: {json.dumps(response_data)}")
+        with tracing.span("logging"):
+            request_logger.info(f"{log_prefix}Generated response ({response_data['safety']}, {len(response_data['response'])} chars)")
 
         return ChatResponse(
             response=response_data["response"],
             safety=response_data["safety"],
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            session_id=request.session_id
         )
+    except (RateLimitedError, QueueFullError, DeadlineExceededError) as e:
+        error = _admission_error(persona, e)
+        status_code = error.status_code
+        raise error
     except Exception as e:
+        status_code = 500
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
+    finally:
+        metrics.observe_request(persona, "chat", time.perf_counter() - start_time)
+        _capture("chat", persona, request.message, history, status_code, start_time,
+                 upstream, response_data, request.session_id, context)
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, context: RequestContext = Depends(request_context)):
+    """
+    Default chat endpoint - uses Singlish persona for backward compatibility.
+    """
+    return await _chat("singlish", request, context, "")
+
+@router.post("/chat/singlish", response_model=ChatResponse)
+async def chat_singlish(request: ChatRequest, context: RequestContext = Depends(request_context)):
+    """
+    Chat endpoint for Singlish persona.
+    """
+    return await _chat("singlish", request, context, "[Singlish] ")
 
 @router.post("/chat/xmm", response_model=ChatResponse)
-async def chat_xmm(request: ChatRequest):
+async def chat_xmm(request: ChatRequest, context: RequestContext = Depends(request_context)):
     """
     Chat endpoint for XMM persona.
     """
-    try:
-        response_data = xmm_service.generate_response(
-            message=request.message,
-            conversation_history=request.conversation_history
-        )
+    return await _chat("xmm", request, context, "[XMM] ")
 
-        logging.info(f"[XMM] Generated response: {json.dumps(response_data)}")
+@router.post("/chat/ahbeng", response_model=ChatResponse)
+async def chat_ahbeng(request: ChatRequest, context: RequestContext = Depends(request_context)):
+    """
+    Chat endpoint for Ah Beng persona.
+    """
+    return await _chat("ahbeng", request, context, "[Ah Beng] ")
 
-        return ChatResponse(
+@router.post("/chat/nsf", response_model=ChatResponse)
+async def chat_nsf(request: ChatRequest, context: RequestContext = Depends(request_context)):
+    """
+    Chat endpoint for NSF persona.
+    """
+    return await _chat("nsf", request, context, "[NSF] ")
+
+def batch_request_context(
+    x_request_timeout: Optional[float] = Header(None),
+    x_request_priority: Optional[str] = Header(None)
+) -> RequestContext:
+    """Like request_context, but batches default to bulk priority and a longer deadline."""
+    return RequestContext(
+        priority=parse_priority(x_request_priority, default=BULK),
+        deadline=deadline_from_timeout(x_request_timeout, default=settings.batch_timeout_seconds)
+    )
+
+async def _batch_item(index: int, item: BatchChatItem, context: RequestContext,
+                      limit: asyncio.Semaphore) -> Dict[str, object]:
+    """Generate one batch item, reporting failures in the result instead of raising."""
+    result = {"type": "result", "index": index, "id": item.id, "persona": item.persona}
+    start_time = time.perf_counter()
+    upstream = metrics.track_upstream()
+    response_data = None
+    try:
+        async with limit:
+            with tracing.span("admission"):
+                await admission.admit_paced(item.persona, context)
+            response_data = await persona_services[item.persona].generate_response_async(
+                message=item.message,
+                conversation_history=item.conversation_history or [],
+                priority=context.priority,
+                deadline=context.deadline
+            )
+        result.update(
             response=response_data["response"],
             safety=response_data["safety"],
-            timestamp=datetime.now()
+            timestamp=datetime.now().isoformat()
         )
+    except (RateLimitedError, QueueFullError, DeadlineExceededError) as e:
+        error = _admission_error(item.persona, e)
+        result.update(type="error", status_code=error.status_code, detail=error.detail)
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=str(e)
-        )
+        result.update(type="error", status_code=500, detail=str(e))
+    finally:
+        metrics.observe_request(item.persona, "batch", time.perf_counter() - start_time)
+        _capture("batch", item.persona, item.message, item.conversation_history or [],
+                 result.get("status_code", 200), start_time, upstream, response_data, None, context)
+    return result
 
-@router.post("/chat/ahbeng", response_model=ChatResponse)
-async def chat_ahbeng(request: ChatRequest):
+@router.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, context: RequestContext = Depends(batch_request_context)):
     """
-    Chat endpoint for Ah Beng persona.
+    Run many chat items concurrently and stream the results back as
+    newline-delimited JSON, in completion order.
+
+    Each line is a `result` ({index, id, persona, response, safety, timestamp})
+    or an `error` ({index, id, persona, status_code, detail}); a final `done`
+    line carries the counts. `ask_all` sends one message to every persona, so
+    the total latency is that of the slowest persona. Items run at bulk
+    priority unless X-Request-Priority says otherwise.
     """
-    try:
-        response_data = ahbeng_service.generate_response(
-            message=request.message,
-            conversation_history=request.conversation_history
+    tracing.span_since_start("validation")
+    tracing.annotate(endpoint="batch")
+    items = list(request.items)
+    if request.ask_all is not None:
+        items.extend(
+            BatchChatItem(
+                id=persona,
+                persona=persona,
+                message=request.ask_all.message,
+                conversation_history=request.ask_all.conversation_history
+            )
+            for persona in persona_services
         )
 
-        logging.info(f"[Ah Beng] Generated response: {json.dumps(response_data)}")
-
-        return ChatResponse(
-            response=response_data["response"],
-            safety=response_data["safety"],
-            timestamp=datetime.now()
+    if not items:
+        raise HTTPException(
+            status_code=400,
+            detail="Batch has no items"
         )
-    except Exception as e:
+    if len(items) > settings.batch_max_items:
         raise HTTPException(
-            status_code=500,
-            detail=str(e)
+            status_code=413,
+            detail=f"Batch has {len(items)} items, the limit is {settings.batch_max_items}"
+        )
+    unknown = sorted({item.persona for item in items} - set(persona_services))
+    if unknown:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown persona: {', '.join(unknown)}"
         )
 
-@router.post("/chat/nsf", response_model=ChatResponse)
-async def chat_nsf(request: ChatRequest):
+    limit = asyncio.Semaphore(max(1, settings.batch_max_concurrency))
+    tasks = [
+        asyncio.ensure_future(_batch_item(index, item, context, limit))
+        for index, item in enumerate(items)
+    ]
+
+    async def result_stream():
+        errors = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                if result["type"] == "error":
+                    errors += 1
+                yield orjson.dumps(result) + b"\n"
+            yield orjson.dumps({"type": "done", "count": len(tasks), "errors": errors}) + b"\n"
+        finally:
+            # Client went away: stop the items that have not finished yet
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    request_logger.info(f"Batch of {len(items)} items accepted ({context.priority_name} priority)")
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+@router.post("/chat/{persona}/stream")
+async def chat_stream(persona: str, request: ChatRequest, context: RequestContext = Depends(request_context)):
     """
-    Chat endpoint for NSF persona.
+    Streaming chat endpoint for any persona, using Server-Sent Events.
+
+    Emits `token` events ({"delta": ...}) as partial output arrives, then a single
+    `done` event with the full response, safety label and timestamp. Failures after
+    the stream has started are reported as an `error` event.
     """
-    try:
-        response_data = nsf_service.generate_response(
-            message=request.message,
-            conversation_history=request.conversation_history
+    service = persona_services.get(persona)
+    if service is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown persona: {persona}"
         )
 
-        logging.info(f"[NSF] Generated response: {json.dumps(response_data)}")
+    tracing.span_since_start("validation")
+    tracing.annotate(persona=persona, endpoint="stream")
+    start_time = time.perf_counter()
+    upstream = metrics.track_upstream()
+    with tracing.span("session"):
+        session, history = _session_history(persona, request)
+    events = service.stream_response_async(
+        message=request.message,
+        conversation_history=history,
+        priority=context.priority,
+        deadline=context.deadline
+    )
 
-        return ChatResponse(
-            response=response_data["response"],
-            safety=response_data["safety"],
-            timestamp=datetime.now()
-        )
+    # Wait for the first event before committing to a 200, so a full queue or
+    # an unavailable model still surfaces as a normal HTTP error
+    try:
+        with tracing.span("admission"):
+            admission.admit(persona, context)
+        with tracing.span("first_event"):
+            first_event = await events.__anext__()
+    except (RateLimitedError, QueueFullError, DeadlineExceededError) as e:
+        await events.aclose()
+        metrics.observe_request(persona, "stream", time.perf_counter() - start_time)
+        error = _admission_error(persona, e)
+        _capture("stream", persona, request.message, history, error.status_code, start_time,
+                 upstream, None, request.session_id, context)
+        raise error
     except Exception as e:
+        metrics.observe_request(persona, "stream", time.perf_counter() - start_time)
+        _capture("stream", persona, request.message, history, 500, start_time,
+                 upstream, None, request.session_id, context)
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
 
+    async def event_stream():
+        event = first_event
+        final_event = None
+        try:
+            while True:
+                if event["type"] == "token":
+                    yield _sse_event("token", {"delta": event["delta"]})
+                else:
+                    final_event = event
+                    _record_turn(session, request.message, event)
+                    request_logger.info(f"[{service.get_persona_name()}] Streamed response ({event['safety']}, {len(event['response'])} chars)")
+                    yield _sse_event("done", {
+                        "response": event["response"],
+                        "safety": event["safety"],
+                        "timestamp": datetime.now().isoformat(),
+                        "session_id": request.session_id
+                    })
+                event = await events.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+            metrics.observe_request(persona, "stream", time.perf_counter() - start_time)
+            _capture("stream", persona, request.message, history, 200, start_time,
+                     upstream, final_event, request.session_id, context)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/chat/{persona}/sessions/{session_id}")
+async def delete_session(persona: str, session_id: str):
+    """
+    Forget a server-side conversation session.
+    """
+    if not session_store.delete(persona, session_id):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown session: {session_id}"
+        )
+    return {"deleted": session_id}
+
 @router.get("/health", response_model=HealthCheck)
 async def health_check():
     """
@@ -138,6 +402,26 @@ async def health_check():
         timestamp=datetime.now()
     )
 
+@router.get("/ready")
+async def readiness():
+    """
+    Per-persona readiness. Returns 503 until the default persona has a live client;
+    other personas may still be connecting or serving placeholders.
+    """
+    personas = {
+        persona: service.state
+        for persona, service in persona_services.items()
+    }
+    ready = model_service.is_ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "personas": personas,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
 @router.get("/model-status")
 async def model_status():
     """
@@ -145,7 +429,14 @@ async def model_status():
     """
     return {
         "status": "ok",
-        "model": model_service.get_model_status()
+        "model": model_service.get_model_status(),
+        "personas": {
+            persona: service.get_model_status()
+            for persona, service in persona_services.items()
+        },
+        "sessions": session_store.get_status(),
+        "capture": traffic_capture.get_status() if traffic_capture else {"enabled": False},
+        "admission": admission.get_status()
     }
 
 @router.get("/")
@@ -162,7 +453,11 @@ async def chat_info():
             "chat_xmm": "/api/chat/xmm",
             "chat_ahbeng": "/api/chat/ahbeng",
             "chat_nsf": "/api/chat/nsf",
+            "chat_stream": "/api/chat/{persona}/stream",
+            "chat_batch": "/api/chat/batch",
+            "delete_session": "/api/chat/{persona}/sessions/{session_id}",
             "health": "/api/health",
+            "ready": "/api/ready",
             "model_status": "/api/model-status"
         },
         "personas": {
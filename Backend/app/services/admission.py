@@ -0,0 +1,136 @@
+from app.config import settings
+from app.services.pool import INTERACTIVE, BULK, PRIORITY_NAMES
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import threading
+import time
+
+
+class RateLimitedError(Exception):
+    """Raised when a persona's request rate is over its token-bucket limit."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} is receiving too many requests, retry in {retry_after:.1f}s")
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take one token. Returns 0 on success, else the seconds until a token is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+@dataclass
+class RequestContext:
+    """Admission details for one API request."""
+    priority: int = INTERACTIVE
+    # time.monotonic() value after which the client no longer wants the answer
+    deadline: Optional[float] = None
+
+    @property
+    def priority_name(self) -> str:
+        return "bulk" if self.priority == BULK else "interactive"
+
+
+def parse_priority(value: Optional[str], default: int = INTERACTIVE) -> int:
+    """Map an X-Request-Priority header to a priority class (unknown values get the default)."""
+    if not value:
+        return default
+    return PRIORITY_NAMES.get(value.strip().lower(), default)
+
+
+def deadline_from_timeout(timeout_seconds: Optional[float], default: Optional[float] = None) -> Optional[float]:
+    """Turn a client's remaining timeout into a monotonic deadline, falling back to the server default."""
+    if timeout_seconds is None or timeout_seconds <= 0:
+        timeout_seconds = settings.request_timeout_seconds if default is None else default
+    if timeout_seconds <= 0:
+        return None
+    return time.monotonic() + min(timeout_seconds, settings.request_max_timeout_seconds)
+
+
+class AdmissionController:
+    """
+    Per-persona rate limiting in front of the worker pools.
+
+    Each persona has one token bucket per priority class, so a bulk
+    evaluation run spends its own budget and cannot starve interactive chat.
+    A rate of 0 disables the limit for that class.
+    """
+
+    def __init__(self, limits: Dict[int, Tuple[float, int]]):
+        self.limits = limits
+        self._buckets: Dict[Tuple[str, int], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rate_limited = 0
+
+    def _bucket(self, persona: str, priority: int) -> Optional[TokenBucket]:
+        rate, burst = self.limits.get(priority, (0.0, 0))
+        if rate <= 0:
+            return None
+        with self._lock:
+            bucket = self._buckets.get((persona, priority))
+            if bucket is None:
+                bucket = self._buckets[(persona, priority)] = TokenBucket(rate, burst)
+            return bucket
+
+    def admit(self, persona: str, context: RequestContext):
+        """Charge one request to the persona's bucket, raising RateLimitedError when it is empty."""
+        bucket = self._bucket(persona, context.priority)
+        wait = bucket.try_acquire() if bucket is not None else 0.0
+        if wait > 0:
+            self.rate_limited += 1
+            raise RateLimitedError(persona, wait)
+        self.admitted += 1
+
+    async def admit_paced(self, persona: str, context: RequestContext):
+        """
+        Like admit, but wait for the next token instead of failing. Used by batch
+        jobs, which should run at the configured rate rather than be rejected;
+        RateLimitedError is raised only if the wait would outlast the deadline.
+        """
+        bucket = self._bucket(persona, context.priority)
+        while bucket is not None:
+            wait = bucket.try_acquire()
+            if wait <= 0:
+                break
+            if context.deadline is not None and time.monotonic() + wait > context.deadline:
+                self.rate_limited += 1
+                raise RateLimitedError(persona, wait)
+            await asyncio.sleep(wait)
+        self.admitted += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "limits": {
+                "bulk" if priority == BULK else "interactive": {"rate_per_second": rate, "burst": burst}
+                for priority, (rate, burst) in self.limits.items()
+            },
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+        }
+
+
+# Shared admission controller for the chat API
+admission = AdmissionController({
+    INTERACTIVE: (settings.rate_limit_per_second, settings.rate_limit_burst),
+    BULK: (settings.bulk_rate_limit_per_second, settings.bulk_rate_limit_burst),
+})
@@ -0,0 +1,145 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from threading import Lock, Thread
+import logging
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class _BatchRequest:
+    adapter: Optional[str]
+    messages: List[Dict[str, str]]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching for the local model.
+
+    Requests from any number of worker threads are queued here. A single
+    scheduler thread groups them by adapter, waits at most `max_wait_ms`
+    (measured from the oldest queued request) for a group to fill up to
+    `max_batch_size`, then generates the whole group in one padded forward
+    pass and hands each caller its own result.
+    """
+
+    def __init__(self, runtime, max_batch_size: int, max_wait_ms: float):
+        self.runtime = runtime
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+
+    def submit(self, adapter: Optional[str], messages: List[Dict[str, str]]) -> Future:
+        """Queue a chat prompt for generation; the returned future resolves to the reply text."""
+        self._ensure_started()
+        request = _BatchRequest(adapter=adapter, messages=messages)
+        self._queue.put(request)
+        return request.future
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="local-batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(_STOP)
+                self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        pending: Dict[Optional[str], List[_BatchRequest]] = {}
+        stopping = False
+
+        while not stopping or any(pending.values()):
+            if not any(pending.values()):
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                pending.setdefault(item.adapter, []).append(item)
+
+            # Pick up everything that arrived while the previous batch was running
+            while not stopping:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                pending.setdefault(item.adapter, []).append(item)
+
+            # The oldest waiting request bounds how long this round may wait
+            oldest = min((group[0] for group in pending.values() if group), key=lambda r: r.enqueued_at)
+            deadline = oldest.enqueued_at + self.max_wait
+            while not stopping and not self._full_group(pending):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                pending.setdefault(item.adapter, []).append(item)
+
+            adapter = self._full_group(pending)
+            if adapter is None:
+                adapter = oldest.adapter
+            group = pending[adapter]
+            batch, pending[adapter] = group[:self.max_batch_size], group[self.max_batch_size:]
+            self._run_batch(adapter, batch)
+
+    def _full_group(self, pending: Dict[Optional[str], List[_BatchRequest]]) -> Any:
+        for adapter, group in pending.items():
+            if len(group) >= self.max_batch_size:
+                return adapter
+        return None
+
+    def _run_batch(self, adapter: Optional[str], batch: List[_BatchRequest]):
+        # Skip callers that gave up while queued
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        try:
+            texts = self.runtime.generate_batch(adapter, [request.messages for request in batch])
+        except Exception as e:
+            logger.error(f"Batch generation failed for adapter {adapter or 'base'}: {str(e)}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, text in zip(batch, texts):
+            request.future.set_result(text)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "requests": self.requests,
+            "average_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
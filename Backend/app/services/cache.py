@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import hashlib
+import json
+import threading
+import time
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message for exact-match lookups (case and whitespace insensitive)."""
+    return " ".join(message.lower().split())
+
+
+def hash_history(conversation_history: Optional[List[Any]]) -> str:
+    """Stable digest of a conversation history, so long histories don't bloat cache keys."""
+    if not conversation_history:
+        return ""
+    turns = [
+        (getattr(turn.role, "value", turn.role), turn.content)
+        for turn in conversation_history
+    ]
+    return hashlib.sha256(json.dumps(turns, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe, bounded in-memory cache with a per-entry TTL and LRU eviction.
+    Expired entries are dropped lazily on lookup or when the cache is full.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, str]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def set(self, key: Hashable, value: Dict[str, str]):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._purge_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _purge_expired(self, now: float):
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
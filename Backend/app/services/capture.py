@@ -0,0 +1,217 @@
+from app.config import settings
+from app.models.schemas import ChatMessage
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional
+import gzip
+import hashlib
+import logging
+import orjson
+import os
+import queue
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Personal data that should never reach a capture file, most specific first
+_SCRUB_PATTERNS = [
+    (re.compile(r"https?://\S+"), "<URL>"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<EMAIL>"),
+    (re.compile(r"\b[STFGM]\d{7}[A-Z]\b", re.IGNORECASE), "<NRIC>"),
+    (re.compile(r"\b(?:\d[ -]?){12,18}\d\b"), "<CARD>"),
+    (re.compile(r"(?:\+65[\s-]?)?\b[3689]\d{3}[\s-]?\d{4}\b"), "<PHONE>"),
+    (re.compile(r"\b\d{6}\b"), "<POSTCODE>"),
+]
+
+
+def scrub_text(text: str) -> str:
+    """Replace URLs, emails, NRIC/FIN, card, phone and postal code numbers with placeholders."""
+    for pattern, placeholder in _SCRUB_PATTERNS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def _hash_id(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+
+class TrafficCapture:
+    """
+    Opt-in capture of chat traffic to a JSONL log for later replay.
+
+    Request handlers only build a small dict and put it on a queue; a
+    background thread encodes and appends the lines (gzip when the path ends
+    in .gz, one gzip member per burst so the file stays readable while the
+    server runs). In "scrubbed" mode message text is kept with personal data
+    replaced by placeholders; in "shape" mode only lengths are kept. Session
+    ids are hashed. The file rolls over to `<path>.1` at `max_bytes`.
+
+    Write and rotation errors (disk full, permissions) never stop the writer:
+    the affected entries are counted as dropped and the file is reopened for
+    the next one.
+    """
+
+    def __init__(self, path: str, mode: str, max_bytes: int, sample_rate: float, max_pending: int = 10000):
+        self.path = Path(path)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+        self.captured = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _text(self, text: str) -> Dict[str, Any]:
+        if self.mode == "shape":
+            return {"len": len(text)}
+        return {"text": scrub_text(text)}
+
+    def record(
+        self,
+        endpoint: str,
+        persona: str,
+        message: str,
+        history: List[ChatMessage],
+        status: int,
+        latency: float,
+        upstream: Optional[List[float]] = None,
+        safety: Optional[str] = None,
+        session_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ):
+        """Queue one request for capture. Never blocks; entries are dropped if the writer falls behind."""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        entry = {
+            "t": round(time.time(), 3),
+            "endpoint": endpoint,
+            "persona": persona,
+            "message": self._text(message),
+            "history": [{"role": turn.role.value, **self._text(turn.content)} for turn in history],
+            "status": status,
+            "latency": round(latency, 4),
+            "upstream": [round(seconds, 4) for seconds in upstream] if upstream else [],
+            "safety": safety,
+            "session": _hash_id(session_id),
+            "priority": priority,
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.suffix == ".gz":
+            return gzip.open(self.path, "ab")
+        return open(self.path, "ab")
+
+    def _rotate(self, handle):
+        if handle is not None:
+            handle.close()
+        os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+        return None
+
+    def _failed(self, handle, action: str, error: Exception):
+        """Record a write/rotation error and drop the handle, so the next entry reopens the file."""
+        self.errors += 1
+        # Log once per run of failures, not for every entry while the disk stays full
+        if self.last_error is None:
+            logger.error(f"Traffic capture failed to {action}, dropping entries until it recovers: {str(error)}")
+        self.last_error = f"{action}: {str(error)}"
+        if handle is not None:
+            try:
+                handle.close()
+            except Exception:
+                pass
+        return None
+
+    def _run(self):
+        handle = None
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is _STOP:
+                    break
+                try:
+                    if handle is None:
+                        handle = self._open()
+                    handle.write(orjson.dumps(entry) + b"\n")
+                except Exception as e:
+                    self.dropped += 1
+                    handle = self._failed(handle, "write", e)
+                    continue
+                self.captured += 1
+                if not self._queue.empty():
+                    continue
+
+                try:
+                    # Burst written: make it visible on disk
+                    if self.path.suffix == ".gz":
+                        handle.close()
+                        handle = None
+                    else:
+                        handle.flush()
+                    if self.max_bytes > 0 and self.path.stat().st_size >= self.max_bytes:
+                        handle = self._rotate(handle)
+                except Exception as e:
+                    handle = self._failed(handle, "flush or rotate", e)
+                    continue
+                if self.last_error is not None:
+                    logger.info("Traffic capture recovered")
+                    self.last_error = None
+        finally:
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception as e:
+                    logger.error(f"Traffic capture failed to close {self.path}: {str(e)}")
+
+    def close(self):
+        """Write out everything queued so far and stop the writer thread."""
+        with self._start_lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join(timeout=5)
+                self._thread = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "path": str(self.path),
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# Shared capture log for the chat API, or None when capture is off
+traffic_capture = TrafficCapture(
+    path=settings.capture_path,
+    mode=settings.capture_mode,
+    max_bytes=settings.capture_max_bytes,
+    sample_rate=settings.capture_sample_rate
+) if settings.capture_enabled else None
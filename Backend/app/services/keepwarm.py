@@ -0,0 +1,171 @@
+from app.config import settings
+from collections import Counter, deque
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARM = "warm"
+COLD = "cold"
+UNKNOWN = "unknown"
+
+
+class WarmthTracker:
+    """
+    Recent upstream activity and keep-warm probe results for one persona.
+
+    Real calls count as activity, so a busy persona is never probed. Once it
+    goes quiet, probes start at `interval` and back off, doubling for each
+    `traffic_window` without traffic up to `max_interval`; after `max_idle`
+    without traffic they stop until traffic returns, so an unused Space is
+    allowed to sleep. Probes are never sent more often than
+    `max_probes_per_hour`. A probe slower than `cold_threshold` found the
+    backend asleep and counts as a cold start; a failed one leaves it cold.
+    """
+
+    def __init__(self, interval: float, max_interval: float, traffic_window: float,
+                 max_idle: float, max_probes_per_hour: int, cold_threshold: float):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.traffic_window = traffic_window
+        self.max_idle = max_idle
+        self.min_interval = 3600.0 / max(1, max_probes_per_hour)
+        self.cold_threshold = cold_threshold
+        self._lock = threading.Lock()
+        self._calls: deque = deque()
+        # Startup counts as activity, so probing starts at the base interval
+        self.last_activity = time.monotonic()
+        self.last_probe_at: Optional[float] = None
+        self.state = UNKNOWN
+        self.probes: Counter = Counter()
+        self.cold_starts = 0
+        self.last_probe_seconds: Optional[float] = None
+        self.last_cold_start_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record_call(self):
+        """A real request reached the backend and got an answer."""
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append(now)
+            self._trim(now)
+            self.last_activity = now
+            self.state = WARM
+
+    def record_probe(self, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            self.last_probe_at = time.monotonic()
+            self.last_probe_seconds = seconds
+            if error is not None:
+                self.probes["failed"] += 1
+                self.state = COLD
+                self.last_error = error
+                return
+            if seconds >= self.cold_threshold:
+                self.probes[COLD] += 1
+                self.cold_starts += 1
+                self.last_cold_start_seconds = seconds
+            else:
+                self.probes[WARM] += 1
+            # Either way the backend answered, so it is awake now
+            self.state = WARM
+            self.last_error = None
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0] < now - self.traffic_window:
+            self._calls.popleft()
+
+    def current_interval(self, now: float) -> Optional[float]:
+        """Seconds between probes at the current traffic level, or None while probing is paused."""
+        idle = now - self.last_activity
+        if idle >= self.max_idle:
+            return None
+        interval = min(self.interval * 2 ** int(idle // self.traffic_window), self.max_interval)
+        return max(interval, self.min_interval)
+
+    def next_probe_delay(self, now: float) -> Optional[float]:
+        """Seconds until the next probe is due (0 if it is due now), or None while probing is paused."""
+        with self._lock:
+            interval = self.current_interval(now)
+            if interval is None:
+                return None
+            last_touch = max(self.last_activity, self.last_probe_at or 0.0)
+            return max(0.0, last_touch + interval - now)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            interval = self.current_interval(now)
+            return {
+                "state": self.state,
+                "probing": "active" if interval is not None else "paused",
+                "probe_interval_seconds": round(interval, 1) if interval is not None else None,
+                "idle_seconds": round(now - self.last_activity, 1),
+                "recent_requests": len(self._calls),
+                "last_probe_ago_seconds": round(now - self.last_probe_at, 1) if self.last_probe_at else None,
+                "last_probe_seconds": round(self.last_probe_seconds, 3) if self.last_probe_seconds is not None else None,
+                "probes": dict(self.probes),
+                "cold_starts": self.cold_starts,
+                "last_cold_start_seconds": (round(self.last_cold_start_seconds, 3)
+                                            if self.last_cold_start_seconds is not None else None),
+                "last_error": self.last_error,
+            }
+
+
+def create_warmth_tracker(persona_slug: str) -> Optional[WarmthTracker]:
+    """A warmth tracker for the persona, or None if keep-warm is disabled or the persona opted out."""
+    if not settings.keep_warm_enabled or persona_slug in settings.keep_warm_excluded_personas:
+        return None
+    return WarmthTracker(
+        interval=settings.keep_warm_interval_seconds,
+        max_interval=settings.keep_warm_max_interval_seconds,
+        traffic_window=settings.keep_warm_traffic_window_seconds,
+        max_idle=settings.keep_warm_max_idle_seconds,
+        max_probes_per_hour=settings.keep_warm_max_probes_per_hour,
+        cold_threshold=settings.keep_warm_cold_threshold_seconds
+    )
+
+
+class KeepWarmScheduler:
+    """
+    Background task per persona that probes its backend whenever the persona's
+    WarmthTracker says a probe is due. Personas that are not connected, or
+    whose circuit breaker is open, are left alone.
+    """
+
+    def __init__(self, services: Dict[str, Any]):
+        self.services = services
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        for persona, service in self.services.items():
+            if service.warmth is not None:
+                self._tasks[persona] = asyncio.create_task(self._keep_warm(service), name=f"keep-warm-{persona}")
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def _keep_warm(self, service):
+        warmth = service.warmth
+        while True:
+            delay = warmth.next_probe_delay(time.monotonic())
+            if delay is None or not service.is_ready or service.breaker.state == service.breaker.OPEN:
+                await asyncio.sleep(warmth.interval)
+                continue
+            if delay > 0:
+                # Wake up at least once per base interval: traffic may have changed the schedule
+                await asyncio.sleep(min(delay, warmth.interval))
+                continue
+
+            try:
+                await asyncio.to_thread(service.probe)
+            except Exception as e:
+                logger.error(f"{service.get_persona_name()} keep-warm probe crashed: {str(e)}")
+                await asyncio.sleep(warmth.interval)
@@ -0,0 +1,109 @@
+from app.config import settings
+from app.services.model import BaseModelService, persona_services
+from app.services.keepwarm import KeepWarmScheduler
+from app.services.resilience import CONNECTION
+from typing import Dict, Any
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+class PersonaSupervisor:
+    """
+    Connects persona clients at startup and keeps supervising them.
+
+    All personas connect concurrently, so cold start costs the slowest Space
+    handshake rather than the sum of them. Personas that fail stay on their
+    placeholder (or unavailable) path while a background task retries with
+    exponential backoff and switches them to live once a connection succeeds.
+    Once connected, a persona whose circuit breaker opens on connection errors
+    (e.g. its Space restarted or was rebuilt) is reconnected the same way, and
+    replicas that were unreachable when it connected are retried.
+    """
+
+    def __init__(self, services: Dict[str, BaseModelService]):
+        self.services = services
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        for persona, service in self.services.items():
+            self._tasks[persona] = asyncio.create_task(
+                self._supervise(persona, service),
+                name=f"connect-{persona}"
+            )
+
+        # Serve as soon as every persona has had its first attempt, but never
+        # hold startup hostage to one slow Space
+        first_attempts = [
+            asyncio.create_task(self._wait_for_first_attempt(service))
+            for service in self.services.values()
+        ]
+        done, pending = await asyncio.wait(
+            first_attempts,
+            timeout=settings.startup_connect_timeout_seconds
+        )
+        for task in pending:
+            task.cancel()
+
+        logger.info(f"Persona readiness after startup: {self.get_readiness()}")
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+        for service in self.services.values():
+            service.shutdown()
+
+    @staticmethod
+    async def _wait_for_first_attempt(service: BaseModelService):
+        while service.connect_attempts == 0 or service.state == "connecting":
+            await asyncio.sleep(0.05)
+
+    async def _supervise(self, persona: str, service: BaseModelService):
+        while True:
+            await self._connect(service)
+            await self._watch(service)
+
+    async def _connect(self, service: BaseModelService):
+        """Connect the persona, retrying with backoff until it succeeds."""
+        delay = settings.reconnect_initial_delay_seconds
+        while True:
+            connected = await asyncio.to_thread(service.connect)
+            if connected:
+                if service.connect_attempts > 1:
+                    logger.info(f"{service.get_persona_name()} connected after {service.connect_attempts} attempts")
+                    # Failures of the old client say nothing about the new one
+                    service.breaker.reset()
+                return
+
+            # Jitter keeps several failing personas from retrying in lockstep
+            wait = random.uniform(delay / 2, delay)
+            logger.warning(f"{service.get_persona_name()} unavailable, retrying in {wait:.1f} seconds")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, settings.reconnect_max_delay_seconds)
+
+    async def _watch(self, service: BaseModelService):
+        """Return once the connected client keeps failing with connection errors."""
+        breaker = service.breaker
+        times_opened = breaker.times_opened
+        while True:
+            await asyncio.sleep(settings.supervisor_check_interval_seconds)
+            if service.replica_pool is not None and service.replica_pool.missing:
+                await asyncio.to_thread(service.replica_pool.connect_missing)
+            if breaker.times_opened > times_opened and breaker.open_reason == CONNECTION:
+                logger.warning(f"{service.get_persona_name()} keeps failing to connect, reconnecting")
+                return
+            times_opened = breaker.times_opened
+
+    def get_readiness(self) -> Dict[str, Any]:
+        return {persona: service.state for persona, service in self.services.items()}
+
+
+supervisor = PersonaSupervisor(persona_services)
+
+# Keep-warm probes for remote personas, or None when keep-warm is off
+keep_warm = KeepWarmScheduler(persona_services) if settings.keep_warm_enabled else None
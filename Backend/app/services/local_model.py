@@ -0,0 +1,486 @@
+from app.models.schemas import ChatMessage
+from app.config import settings
+from app.logging_config import REQUEST_LOGGER
+from app.services.model import BaseModelService
+from app.services.batching import BatchScheduler
+from app.services.prefix_cache import PrefixCache
+from app.services import metrics, tracing
+from typing import List, Dict, Any, Optional, Iterator
+from threading import Event, Lock, Thread
+import queue
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger(REQUEST_LOGGER)
+
+
+class LocalModelRuntime:
+    """
+    In-process Qwen3 Singlish base model shared by every local persona.
+
+    The base weights are loaded once; each persona's LoRA adapter is attached
+    to the same PeftModel under its own name and switched in per request, so
+    memory stays close to one base model plus a few small adapters. Requests
+    for a persona without an adapter run on the base with adapters disabled.
+
+    With a prefix cache, single-prompt generations (streams and batches of
+    one) reuse the attention state of the longest prompt prefix seen before
+    for the same adapter: the persona system prompt, or the previous turn of
+    the same conversation.
+
+    torch, transformers and peft are only imported when the runtime loads,
+    so the remote (gradio) backend does not need them installed.
+    """
+
+    def __init__(self, base_model_name: str, adapters: Dict[str, str], prefix_cache: Optional[PrefixCache] = None):
+        self.base_model_name = base_model_name
+        self.adapters = dict(adapters)
+        self.prefix_cache = prefix_cache
+        self.model = None
+        self.tokenizer = None
+        self.device = None
+        self.loaded = False
+        self._load_lock = Lock()
+        # Adapter selection is global model state, so generation is serialized
+        self._generate_lock = Lock()
+        self.active_adapter: Optional[str] = None
+        self.generated_tokens = 0
+
+    def ensure_loaded(self):
+        """Load the base model and all adapters, once, no matter how many personas ask."""
+        with self._load_lock:
+            if self.loaded:
+                return
+            self._load()
+            self.loaded = True
+
+    def _load(self):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if settings.device == "auto":
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        else:
+            self.device = settings.device
+
+        torch_dtype = getattr(torch, settings.torch_dtype)
+        if self.device == "cpu" and torch_dtype == torch.float16:
+            # Half precision matmuls are slow or unsupported on most CPUs
+            torch_dtype = torch.float32
+
+        model_kwargs: Dict[str, Any] = {"torch_dtype": torch_dtype}
+        if settings.load_in_4bit or settings.load_in_8bit:
+            from transformers import BitsAndBytesConfig
+            model_kwargs["quantization_config"] = BitsAndBytesConfig(
+                load_in_4bit=settings.load_in_4bit,
+                load_in_8bit=settings.load_in_8bit,
+                bnb_4bit_compute_dtype=torch_dtype
+            )
+            model_kwargs["device_map"] = self.device
+
+        start_time = time.perf_counter()
+        logger.info(f"Loading local base model {self.base_model_name} on {self.device}...")
+
+        tokenizer = AutoTokenizer.from_pretrained(self.base_model_name, token=settings.hf_token)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Decoder-only models must be left padded for batched generation
+        tokenizer.padding_side = "left"
+
+        model = AutoModelForCausalLM.from_pretrained(
+            self.base_model_name,
+            token=settings.hf_token,
+            **model_kwargs
+        )
+        if "device_map" not in model_kwargs:
+            model = model.to(self.device)
+
+        if self.adapters:
+            from peft import PeftModel
+
+            adapter_items = list(self.adapters.items())
+            first_name, first_path = adapter_items[0]
+            logger.info(f"Loading adapter '{first_name}' from {first_path}...")
+            model = PeftModel.from_pretrained(model, first_path, adapter_name=first_name, token=settings.hf_token)
+            for name, path in adapter_items[1:]:
+                logger.info(f"Loading adapter '{name}' from {path}...")
+                model.load_adapter(path, adapter_name=name, token=settings.hf_token)
+            self.active_adapter = first_name
+
+        model.eval()
+        self.model = model
+        self.tokenizer = tokenizer
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"Local model loaded in {elapsed:.1f} seconds with adapters: {list(self.adapters) or 'none'}")
+
+    def _activate(self, adapter: Optional[str]):
+        """Select the adapter for the next generation. Must hold _generate_lock."""
+        if adapter is not None and adapter != self.active_adapter:
+            self.model.set_adapter(adapter)
+            self.active_adapter = adapter
+
+    def _adapter_context(self, adapter: Optional[str]):
+        from contextlib import nullcontext
+
+        if adapter is None and self.adapters:
+            return self.model.disable_adapter()
+        return nullcontext()
+
+    def _render(self, messages: List[Dict[str, str]]) -> str:
+        return self.tokenizer.apply_chat_template(
+            messages,
+            add_generation_prompt=True,
+            tokenize=False,
+            enable_thinking=False
+        )
+
+    def _encode(self, messages: List[Dict[str, str]]):
+        return self.tokenizer.apply_chat_template(
+            messages,
+            add_generation_prompt=True,
+            return_tensors="pt",
+            return_dict=True,
+            enable_thinking=False
+        ).to(self.device)
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "max_new_tokens": settings.max_new_tokens,
+            "do_sample": settings.do_sample,
+            "pad_token_id": self.tokenizer.pad_token_id,
+        }
+        if settings.do_sample:
+            kwargs["temperature"] = settings.temperature
+            kwargs["top_p"] = settings.top_p
+        return kwargs
+
+    def generate(self, adapter: Optional[str], messages: List[Dict[str, str]]) -> str:
+        """Generate one reply for a chat-formatted prompt using the given adapter."""
+        return self.generate_batch(adapter, [messages])[0]
+
+    def generate_batch(self, adapter: Optional[str], batch: List[List[Dict[str, str]]]) -> List[str]:
+        """Generate replies for several chat prompts together in one left-padded batch."""
+        import torch
+
+        if len(batch) == 1 and self.prefix_cache is not None:
+            with self._generate_lock:
+                self._activate(adapter)
+                return [self._generate_with_prefix(adapter, batch[0])]
+
+        prompts = [self._render(messages) for messages in batch]
+
+        with self._generate_lock:
+            self._activate(adapter)
+            # The chat template already contains the special tokens
+            inputs = self.tokenizer(
+                prompts,
+                padding=True,
+                add_special_tokens=False,
+                return_tensors="pt"
+            ).to(self.device)
+            with torch.inference_mode(), self._adapter_context(adapter):
+                outputs = self.model.generate(**inputs, **self._generation_kwargs())
+
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        self.generated_tokens += int((new_tokens != self.tokenizer.pad_token_id).sum())
+        return [
+            text.strip()
+            for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        ]
+
+    def _generate_with_prefix(self, adapter: Optional[str], messages: List[Dict[str, str]], streamer=None,
+                              stopping_criteria=None) -> str:
+        """
+        Generate one reply, prefilling only the prompt tokens past the longest
+        cached prefix, then cache the state of the whole exchange for the
+        conversation's next turn. Must hold _generate_lock.
+        """
+        import torch
+
+        with torch.inference_mode():
+            input_ids = self.tokenizer(
+                self._render(messages),
+                add_special_tokens=False,
+                return_tensors="pt"
+            )["input_ids"].to(self.device)
+            kwargs = self._generation_kwargs()
+            past_key_values, _ = self.prefix_cache.lookup(adapter, input_ids[0])
+            if past_key_values is not None:
+                kwargs["past_key_values"] = past_key_values
+
+            with self._adapter_context(adapter):
+                outputs = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    return_dict_in_generate=True,
+                    streamer=streamer,
+                    stopping_criteria=stopping_criteria,
+                    **kwargs
+                )
+
+            sequence = outputs.sequences[0]
+            cache = outputs.past_key_values
+            self.prefix_cache.store(adapter, sequence[:cache.get_seq_length()], cache)
+
+        new_tokens = sequence[input_ids.shape[1]:]
+        self.generated_tokens += int((new_tokens != self.tokenizer.pad_token_id).sum())
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+
+    def pin_system_prompt(self, adapter: Optional[str], system_prompt: str):
+        """Precompute and pin the attention state of a persona's system prompt."""
+        import torch
+
+        if self.prefix_cache is None or not system_prompt:
+            return
+        prefix = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}],
+            tokenize=False,
+            enable_thinking=False
+        )
+        input_ids = self.tokenizer(prefix, add_special_tokens=False, return_tensors="pt")["input_ids"].to(self.device)
+
+        with self._generate_lock:
+            if self.prefix_cache.is_pinned(adapter, input_ids[0]):
+                return
+            self._activate(adapter)
+            with torch.inference_mode(), self._adapter_context(adapter):
+                outputs = self.model(input_ids=input_ids, use_cache=True)
+            self.prefix_cache.store(adapter, input_ids[0], outputs.past_key_values, pinned=True)
+        logger.info(f"Cached {input_ids.shape[1]} system prompt tokens for adapter '{adapter or 'base'}'")
+
+    def stream(self, adapter: Optional[str], messages: List[Dict[str, str]]) -> Iterator[str]:
+        """
+        Yield decoded text chunks as they are generated. If the consumer stops
+        early (e.g. the client disconnected), generation ends at the next token
+        instead of running on to max_new_tokens while holding the lock. Errors
+        in the generation thread are raised here once the stream has ended.
+        """
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+        cancelled = Event()
+
+        class StopWhenCancelled(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+        stopping_criteria = StoppingCriteriaList([StopWhenCancelled()])
+
+        with self._generate_lock:
+            self._activate(adapter)
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                            timeout=settings.local_stream_token_timeout_seconds)
+
+            if self.prefix_cache is not None:
+                def generate():
+                    self._generate_with_prefix(adapter, messages, streamer, stopping_criteria)
+            else:
+                inputs = self._encode(messages)
+
+                def generate():
+                    with torch.inference_mode(), self._adapter_context(adapter):
+                        self.model.generate(**inputs, **self._generation_kwargs(), streamer=streamer,
+                                            stopping_criteria=stopping_criteria)
+
+            errors: List[BaseException] = []
+
+            def run():
+                try:
+                    generate()
+                except BaseException as e:
+                    errors.append(e)
+                    # Unblock the consumer; generate() only ends the streamer when it returns
+                    streamer.end()
+
+            thread = Thread(target=run, daemon=True)
+            thread.start()
+            try:
+                try:
+                    for text in streamer:
+                        if text:
+                            yield text
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"No tokens generated for {settings.local_stream_token_timeout_seconds} seconds"
+                    )
+            finally:
+                cancelled.set()
+                thread.join()
+            if errors:
+                raise errors[0]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "base_model": self.base_model_name,
+            "device": self.device,
+            "loaded": self.loaded,
+            "adapters": self.adapters,
+            "active_adapter": self.active_adapter,
+            "generated_tokens": self.generated_tokens,
+            "prefix_cache": self.prefix_cache.get_stats() if self.prefix_cache else {"enabled": False},
+        }
+
+
+class LocalModelService(BaseModelService):
+    """
+    Persona service backed by the shared in-process LocalModelRuntime.
+    Each persona is just an adapter name on the shared base model.
+    """
+
+    # The model lives in this process, so there is nothing to keep warm
+    keep_warm_supported = False
+
+    def __init__(self, persona_name: str, adapter: Optional[str], runtime: LocalModelRuntime,
+                 scheduler: Optional[BatchScheduler] = None, system_prompt: Optional[str] = None):
+        self.persona_name = persona_name
+        self.adapter = adapter
+        self.system_prompt = system_prompt
+        self.runtime = runtime
+        self.scheduler = scheduler
+        super().__init__()
+
+    def _pool_concurrency(self) -> int:
+        # Worker threads only wait on the scheduler, so allow enough of them to fill a batch
+        if self.scheduler is not None:
+            return max(settings.inference_max_concurrency, self.scheduler.max_batch_size)
+        return settings.inference_max_concurrency
+
+    def get_persona_name(self) -> str:
+        return self.persona_name
+
+    def _load_model(self):
+        """Load the shared local model (a no-op if another persona already did)."""
+        try:
+            logger.info(f"Initializing local model for {self.persona_name}...")
+            self.runtime.ensure_loaded()
+            if self.system_prompt:
+                self.runtime.pin_system_prompt(self.adapter, self.system_prompt)
+            self.client = self.runtime
+            self.model_loaded = True
+            logger.info(f"{self.persona_name} local model ready (adapter: {self.adapter or 'base'})")
+        except Exception as e:
+            logger.error(f"Failed to load local model for {self.persona_name}: {str(e)}")
+            self.client = None
+            self.model_loaded = False
+
+    def count_tokens(self, text: str) -> int:
+        if self.runtime.tokenizer is None:
+            return super().count_tokens(text)
+        return len(self.runtime.tokenizer.encode(text, add_special_tokens=False))
+
+    def _build_messages(self, message: str, conversation_history: List[ChatMessage]) -> List[Dict[str, str]]:
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.extend(
+            {"role": getattr(turn.role, "value", turn.role), "content": turn.content}
+            for turn in conversation_history or []
+        )
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def _to_response(self, text: str) -> Dict[str, str]:
+        # Adapters reply in plain text; only parse when they emit the Space's JSON contract
+        if text.lstrip().startswith("{"):
+            return self._parse_output(text)
+        metrics.record_outcome(self.persona_slug, metrics.OK)
+        return {"response": text.strip(), "safety": "Unknown"}
+
+    def _generate_with_model(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
+        """Generate a response with the local model and this persona's adapter."""
+        if not self.model_loaded or self.client is None:
+            raise ValueError("Model client not loaded")
+
+        start_time = time.perf_counter()
+        messages = self._build_messages(message, conversation_history)
+        with tracing.span("upstream"):
+            if self.scheduler is not None:
+                text = self.scheduler.submit(self.adapter, messages).result()
+            else:
+                text = self.runtime.generate(self.adapter, messages)
+        elapsed = time.perf_counter() - start_time
+        request_logger.info(f"[{self.persona_name}] Inference time: {elapsed:.3f} seconds")
+        metrics.observe_upstream(self.persona_slug, elapsed)
+
+        return self._to_response(text)
+
+    def _stream_with_model(self, message: str, conversation_history: List[ChatMessage] = None) -> Iterator[Dict[str, str]]:
+        """Stream a response from the local model as tokens are decoded."""
+        if not self.model_loaded or self.client is None:
+            raise ValueError("Model client not loaded")
+
+        start_time = time.perf_counter()
+        first_output_time = None
+        chunks = []
+        for text in self.runtime.stream(self.adapter, self._build_messages(message, conversation_history)):
+            if first_output_time is None:
+                first_output_time = time.perf_counter()
+            chunks.append(text)
+            yield {"type": "token", "delta": text}
+
+        end_time = time.perf_counter()
+        if first_output_time is not None:
+            tracing.record_span("upstream_first_output", start_time, first_output_time)
+            tracing.record_span("upstream_stream", first_output_time, end_time)
+            request_logger.info(f"[{self.persona_name}] Time to first output: {first_output_time - start_time:.3f} seconds")
+        request_logger.info(f"[{self.persona_name}] Inference time: {end_time - start_time:.3f} seconds")
+        metrics.observe_upstream(self.persona_slug, end_time - start_time)
+
+        yield {"type": "final", **self._to_response("".join(chunks))}
+
+    def get_model_status(self) -> Dict[str, Any]:
+        """Get the current status of the local model service."""
+        base_status = super().get_model_status()
+        return {
+            **base_status,
+            "inference_type": "Local (transformers + PEFT)",
+            "local_model": "Yes",
+            "adapter": self.adapter or "None (base model)",
+            "system_prompt": bool(self.system_prompt),
+            "runtime": self.runtime.get_status(),
+            "batching": self.scheduler.get_status() if self.scheduler else {"enabled": False}
+        }
+
+    def shutdown(self):
+        super().shutdown()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+
+def create_local_services() -> Dict[str, LocalModelService]:
+    """Build the four persona services on one shared local runtime."""
+    adapters = dict(settings.local_adapters)
+    if settings.adapter_repo_name:
+        adapters.setdefault("singlish", settings.adapter_repo_name)
+
+    prefix_cache = None
+    if settings.local_prefix_cache_enabled:
+        prefix_cache = PrefixCache(
+            max_tokens=settings.local_prefix_cache_max_tokens,
+            min_match_tokens=settings.local_prefix_cache_min_tokens
+        )
+
+    runtime = LocalModelRuntime(settings.base_model_name, adapters, prefix_cache)
+    scheduler = None
+    if settings.local_batching_enabled:
+        scheduler = BatchScheduler(
+            runtime,
+            max_batch_size=settings.local_batch_max_size,
+            max_wait_ms=settings.local_batch_max_wait_ms
+        )
+
+    def adapter_for(persona: str) -> Optional[str]:
+        return persona if persona in adapters else None
+
+    def service(persona: str, name: str) -> LocalModelService:
+        return LocalModelService(name, adapter_for(persona), runtime, scheduler,
+                                 system_prompt=settings.local_system_prompts.get(persona))
+
+    return {
+        "singlish": service("singlish", "Singlish"),
+        "xmm": service("xmm", "XMM"),
+        "ahbeng": service("ahbeng", "Ah Beng"),
+        "nsf": service("nsf", "NSF"),
+    }
@@ -0,0 +1,175 @@
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.registry import Collector
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+# Outcome classes for a single chat turn
+OK = "ok"
+QUOTA = "quota"
+CONNECTION = "connection"
+PARSE_FALLBACK = "parse_fallback"
+PLACEHOLDER = "placeholder"
+CIRCUIT_OPEN = "circuit_open"
+CACHE_HIT = "cache_hit"
+SEMANTIC_CACHE_HIT = "semantic_cache_hit"
+# Answered by the local safety pre-filter without calling the model
+SAFETY_PREFILTER = "safety_prefilter"
+ERROR = "error"
+# Requests turned away by admission control before reaching a worker
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+# Chat replies take seconds, not milliseconds, so the buckets stretch out to a minute
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60)
+
+REQUEST_LATENCY = Histogram(
+    "chat_request_latency_seconds",
+    "End-to-end latency of chat API requests",
+    ["persona", "endpoint"],
+    buckets=_LATENCY_BUCKETS
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "chat_upstream_latency_seconds",
+    "Latency of a single call to the persona's model backend",
+    ["persona"],
+    buckets=_LATENCY_BUCKETS
+)
+
+KEEP_WARM_PROBE_LATENCY = Histogram(
+    "chat_keep_warm_probe_latency_seconds",
+    "Latency of keep-warm probes to the persona's model backend",
+    ["persona"],
+    buckets=_LATENCY_BUCKETS
+)
+
+OUTCOMES = Counter(
+    "chat_outcomes",
+    "Chat turns by outcome class",
+    ["persona", "outcome"]
+)
+
+
+def record_outcome(persona: str, outcome: str):
+    OUTCOMES.labels(persona=persona, outcome=outcome).inc()
+
+
+# Upstream call timings for the current request, while something is tracking them
+_request_upstream: ContextVar[Optional[List[float]]] = ContextVar("request_upstream", default=None)
+
+
+def track_upstream() -> List[float]:
+    """
+    Start collecting the upstream call timings made on behalf of the current
+    request. Work it hands to the worker pool inherits the context, so the
+    returned list fills in as the calls finish.
+    """
+    timings: List[float] = []
+    _request_upstream.set(timings)
+    return timings
+
+
+def observe_upstream(persona: str, seconds: float):
+    UPSTREAM_LATENCY.labels(persona=persona).observe(seconds)
+    timings = _request_upstream.get()
+    if timings is not None:
+        timings.append(seconds)
+
+
+def observe_probe(persona: str, seconds: float):
+    KEEP_WARM_PROBE_LATENCY.labels(persona=persona).observe(seconds)
+
+
+def observe_request(persona: str, endpoint: str, seconds: float):
+    REQUEST_LATENCY.labels(persona=persona, endpoint=endpoint).observe(seconds)
+
+
+class PersonaStatsCollector(Collector):
+    """
+    Exports the live state the persona services already track (worker pool,
+    response caches, coalescing, circuit breaker) at scrape time, so the hot
+    path does not have to keep separate gauges in sync.
+    """
+
+    def __init__(self, services: Dict[str, object]):
+        self.services = services
+
+    def collect(self) -> Iterator:
+        in_flight = GaugeMetricFamily("chat_requests_in_flight", "Requests running on the persona worker pool", labels=["persona"])
+        queued = GaugeMetricFamily("chat_requests_queued", "Requests waiting for a persona worker", labels=["persona"])
+        rejected = CounterMetricFamily("chat_requests_rejected", "Requests rejected because the persona queue was full", labels=["persona"])
+        shed = CounterMetricFamily("chat_requests_shed", "Queued bulk requests dropped to make room for interactive ones", labels=["persona"])
+        expired = CounterMetricFamily("chat_requests_expired", "Requests whose deadline passed while queued", labels=["persona"])
+        ready = GaugeMetricFamily("chat_persona_ready", "Whether the persona has a live model client", labels=["persona"])
+        circuit_open = GaugeMetricFamily("chat_circuit_open", "Whether the persona's circuit breaker is open", labels=["persona"])
+        cache_entries = GaugeMetricFamily("chat_cache_entries", "Entries in the persona's response cache", labels=["persona"])
+        cache_lookups = CounterMetricFamily("chat_cache_lookups", "Response cache lookups by result", labels=["persona", "result"])
+        cache_evictions = CounterMetricFamily("chat_cache_evictions", "Response cache entries evicted or expired", labels=["persona"])
+        semantic_entries = GaugeMetricFamily("chat_semantic_cache_entries", "Entries in the persona's semantic cache", labels=["persona"])
+        semantic_lookups = CounterMetricFamily("chat_semantic_cache_lookups", "Semantic cache lookups by result", labels=["persona", "result"])
+        semantic_evictions = CounterMetricFamily("chat_semantic_cache_evictions", "Semantic cache entries evicted or expired", labels=["persona"])
+        safety_checks = CounterMetricFamily("chat_safety_prefilter_checks", "Messages checked by the safety pre-filter", labels=["persona"])
+        safety_matches = CounterMetricFamily("chat_safety_prefilter_matches", "Messages answered by the safety pre-filter, by category", labels=["persona", "category"])
+        warm = GaugeMetricFamily("chat_persona_warm", "Whether the persona's backend was last seen awake", labels=["persona"])
+        probes = CounterMetricFamily("chat_keep_warm_probes", "Keep-warm probes by result (warm, cold or failed)", labels=["persona", "result"])
+        cold_starts = CounterMetricFamily("chat_cold_starts", "Keep-warm probes that found the backend asleep", labels=["persona"])
+        replica_outstanding = GaugeMetricFamily("chat_replica_outstanding", "Calls in progress on each of the persona's backend replicas", labels=["persona", "replica"])
+        replica_calls = CounterMetricFamily("chat_replica_calls", "Calls sent to each of the persona's backend replicas", labels=["persona", "replica"])
+        hedged = CounterMetricFamily("chat_hedged_requests", "Slow calls duplicated to a second replica, by which attempt answered first", labels=["persona", "winner"])
+        coalesced = CounterMetricFamily("chat_coalesced_requests", "Requests that shared another request's upstream call", labels=["persona"])
+
+        for persona, service in self.services.items():
+            pool = service.pool
+            in_flight.add_metric([persona], pool.in_flight)
+            queued.add_metric([persona], pool.queued)
+            rejected.add_metric([persona], pool.rejected)
+            shed.add_metric([persona], pool.shed)
+            expired.add_metric([persona], pool.expired)
+            ready.add_metric([persona], 1 if service.is_ready else 0)
+            circuit_open.add_metric([persona], 1 if service.breaker.state == service.breaker.OPEN else 0)
+
+            cache = service.response_cache
+            if cache is not None:
+                cache_entries.add_metric([persona], len(cache))
+                cache_lookups.add_metric([persona, "hit"], cache.hits)
+                cache_lookups.add_metric([persona, "miss"], cache.misses)
+                cache_evictions.add_metric([persona], cache.evictions + cache.expirations)
+
+            semantic = service.semantic_cache
+            if semantic is not None:
+                semantic_entries.add_metric([persona], len(semantic))
+                semantic_lookups.add_metric([persona, "hit"], semantic.hits)
+                semantic_lookups.add_metric([persona, "miss"], semantic.misses)
+                semantic_evictions.add_metric([persona], semantic.evictions + semantic.expirations)
+
+            prefilter = service.safety_prefilter
+            if prefilter is not None:
+                safety_checks.add_metric([persona], prefilter.checked)
+                for category, count in prefilter.matched.items():
+                    safety_matches.add_metric([persona, category], count)
+
+            warmth = service.warmth
+            if warmth is not None:
+                warm.add_metric([persona], 1 if warmth.state == "warm" else 0)
+                for result, count in warmth.probes.items():
+                    probes.add_metric([persona, result], count)
+                cold_starts.add_metric([persona], warmth.cold_starts)
+
+            replica_pool = service.replica_pool
+            if replica_pool is not None:
+                for replica in replica_pool.replicas:
+                    replica_outstanding.add_metric([persona, replica.source], replica.outstanding)
+                    replica_calls.add_metric([persona, replica.source], replica.calls)
+                hedged.add_metric([persona, "hedge"], replica_pool.hedges_won)
+                hedged.add_metric([persona, "primary"], replica_pool.hedged - replica_pool.hedges_won)
+
+            if service.inflight is not None:
+                coalesced.add_metric([persona], service.inflight.coalesced)
+
+        yield from (in_flight, queued, rejected, shed, expired, ready, circuit_open,
+                    cache_entries, cache_lookups, cache_evictions,
+                    semantic_entries, semantic_lookups, semantic_evictions,
+                    safety_checks, safety_matches, warm, probes, cold_starts,
+                    replica_outstanding, replica_calls, hedged, coalesced)
@@ -1,115 +1,610 @@
 from app.models.schemas import ChatMessage, MessageRole
 from app.config import settings
-from typing import List, Dict, Any, Optional
+from app.logging_config import setup_logging, REQUEST_LOGGER
+from app.services.pool import InferencePool, INTERACTIVE
+from app.services.cache import ResponseCache, normalize_message, hash_history
+from app.services.semantic_cache import SemanticCache, create_semantic_cache, get_encoder
+from app.services.safety import SafetyPrefilter, create_safety_prefilter
+from app.services.keepwarm import WarmthTracker, create_warmth_tracker
+from app.services.replicas import ReplicaPool, create_replica_pool
+from app.services.singleflight import SingleFlight
+from app.services.sessions import estimate_tokens, trim_history
+from app.services.parsing import parse_model_output, FALLBACK
+from app.services import metrics, tracing
+from app.services.resilience import (
+    CircuitBreaker, RetryPolicy, classify_error, parse_retry_hint, retry_hint_seconds, format_wait,
+    QUOTA, CONNECTION
+)
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from datetime import datetime
+import asyncio
+import threading
 import time
 import json
-import ast
 import logging
 import re
+import urllib.parse
+import httpx
 from gradio_client import Client
 from abc import ABC, abstractmethod
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
+request_logger = logging.getLogger(REQUEST_LOGGER)
+
+_PARTIAL_RESPONSE_RE = re.compile(r'"response"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def _extract_partial_response(output: Any) -> str:
+    """
+    Pull the response text out of a (possibly incomplete) streamed output.
+    Spaces that answer with the JSON contract stream it as a growing JSON string,
+    so only the "response" value is forwarded; plain text is passed through as is.
+    """
+    text = str(output)
+    if not text.lstrip().startswith("{"):
+        return text
+
+    match = _PARTIAL_RESPONSE_RE.search(text)
+    if not match:
+        return ""
+
+    # Drop a half-received \uXXXX escape so the text decodes cleanly
+    raw = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', match.group(1))
+    try:
+        return json.loads(f'"{raw}"')
+    except json.JSONDecodeError:
+        return raw.replace('\\"', '"')
+
 
 class BaseModelService(ABC):
     """Base class for all persona model services."""
 
+    # Whether this persona's sampled outputs may be reused, either from the
+    # response caches or by sharing one in-flight call between identical requests.
+    # Set to False for personas that should always sample fresh.
+    reuse_sampled_responses: bool = True
+
+    # Whether the backend can fall asleep when idle and should get keep-warm probes
+    keep_warm_supported: bool = True
+
     def __init__(self):
         self.client = None
+        # Set when the persona has several equivalent backends; self.client is then the pool
+        self.replica_pool: Optional[ReplicaPool] = None
         self.model_loaded = False
+        # Client connections are made by connect(), normally from the app's lifespan hook
+        self.state = "pending"
+        self.connect_attempts = 0
+        self.connected_at: Optional[datetime] = None
+        self.pool = InferencePool(
+            self.get_persona_name(),
+            max_concurrency=self._pool_concurrency(),
+            max_queue_depth=settings.inference_max_queue_depth
+        )
+        self.response_cache: Optional[ResponseCache] = None
+        if (settings.response_cache_enabled and self.reuse_sampled_responses
+                and self.persona_slug not in settings.response_cache_excluded_personas):
+            self.response_cache = ResponseCache(
+                max_entries=settings.response_cache_max_entries,
+                ttl_seconds=settings.response_cache_ttl_seconds
+            )
+        self.semantic_cache: Optional[SemanticCache] = None
+        if self.reuse_sampled_responses:
+            self.semantic_cache = create_semantic_cache(self.persona_slug)
+        self.breaker = CircuitBreaker(
+            self.get_persona_name(),
+            failure_threshold=settings.circuit_failure_threshold,
+            recovery_seconds=settings.circuit_recovery_seconds
+        )
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.retry_max_attempts,
+            base_delay=settings.retry_base_delay_seconds,
+            max_delay=settings.retry_max_delay_seconds
+        )
+        self.inflight: Optional[SingleFlight] = None
+        if settings.request_coalescing_enabled and self.reuse_sampled_responses:
+            self.inflight = SingleFlight()
+        self.safety_prefilter: Optional[SafetyPrefilter] = create_safety_prefilter(self.persona_slug)
+        self.warmth: Optional[WarmthTracker] = None
+        if self.keep_warm_supported:
+            self.warmth = create_warmth_tracker(self.persona_slug)
+
+    def _pool_concurrency(self) -> int:
+        """Number of worker threads this persona may keep busy at once."""
+        return settings.inference_max_concurrency
+
+    def shutdown(self):
+        """Release worker threads and any backend resources."""
+        self.pool.shutdown()
 
     @abstractmethod
     def _load_model(self):
         """Initialize the model client. Must be implemented by subclasses."""
         pass
 
+    def connect(self) -> bool:
+        """(Re)initialize the model client. Returns True once the persona is live."""
+        self.state = "connecting"
+        self.connect_attempts += 1
+        if self.semantic_cache is not None:
+            # Load the shared encoder now rather than on the first request
+            get_encoder().load()
+        self._load_model()
+        if self.model_loaded:
+            self.state = "ready"
+            self.connected_at = datetime.now()
+        else:
+            self.state = "unavailable"
+        return self.model_loaded
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
     @abstractmethod
     def get_persona_name(self) -> str:
         """Return the persona name. Must be implemented by subclasses."""
         pass
 
+    @property
+    def persona_slug(self) -> str:
+        """Persona name as used in routes and metric labels, e.g. "ahbeng"."""
+        return self.get_persona_name().lower().replace(" ", "")
+
+    def _space_source(self, space: str) -> str:
+        """The Space to connect to, unless persona_space_urls points this persona elsewhere."""
+        overrides = settings.persona_space_urls
+        return overrides.get(self.persona_slug) or overrides.get("*") or space
+
+    def _create_client(self, space: str):
+        """
+        Connect to the persona's Space. With several equivalent backends in
+        persona_replicas, the client is a ReplicaPool spreading calls over them.
+        """
+        replicas = settings.persona_replicas
+        sources = replicas.get(self.persona_slug) or replicas.get("*")
+        if not sources or len(sources) == 1:
+            self.replica_pool = None
+            return Client(sources[0] if sources else self._space_source(space), token=settings.hf_token)
+
+        self.replica_pool = create_replica_pool(
+            self.get_persona_name(), sources, lambda source: Client(source, token=settings.hf_token)
+        )
+        return self.replica_pool
+
+    def count_tokens(self, text: str) -> int:
+        """Token count used for history budgeting. Backends with a tokenizer can be exact."""
+        return estimate_tokens(text)
+
+    def _prepare_history(self, message: str, conversation_history: Optional[List[ChatMessage]]) -> List[ChatMessage]:
+        """Trim the history to the most recent turns that fit the prompt token budget."""
+        if not conversation_history:
+            return []
+        return trim_history(conversation_history, message, settings.history_token_budget, self.count_tokens)
+
+    def _format_prompt(self, message: str, conversation_history: List[ChatMessage]) -> str:
+        """Flatten the history into the single prompt string the Spaces accept."""
+        if not conversation_history:
+            return message
+
+        lines = ["Conversation so far:"]
+        for turn in conversation_history:
+            speaker = "User" if turn.role == MessageRole.USER else "Assistant"
+            lines.append(f"{speaker}: {turn.content}")
+        lines.append("")
+        lines.append(f"User: {message}")
+        return "\n".join(lines)
+
     def _generate_with_model(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
         """Generate response using the HuggingFace inference client."""
         if not self.model_loaded or self.client is None:
             raise ValueError("Model client not loaded")
 
+        # Fail fast while the backend is known to be down or out of quota
+        if not self.breaker.allow_request():
+            return self._circuit_open_response()
+
+        prompt = self._format_prompt(message, conversation_history)
+        retry_delays = self.retry_policy.delays()
+        while True:
+            start_time = time.perf_counter()
+            try:
+                # Covers the gradio handshake, the Space's queue and generation
+                with tracing.span("upstream"):
+                    result = self.client.predict(
+                        prompt,
+                        api_name="/inference"
+                    )
+
+                end_time = time.perf_counter()
+                elapsed = end_time - start_time
+                request_logger.info(f"[{self.get_persona_name()}] Inference time: {elapsed:.3f} seconds")
+                metrics.observe_upstream(self.persona_slug, elapsed)
+
+                self.breaker.record_success()
+                if self.warmth is not None:
+                    self.warmth.record_call()
+                return self._parse_output(result)
+            except Exception as e:
+                metrics.observe_upstream(self.persona_slug, time.perf_counter() - start_time)
+                # Transient connection failures are retried; quota errors never are
+                if classify_error(str(e)) == CONNECTION:
+                    delay = next(retry_delays, None)
+                    if delay is not None:
+                        logger.warning(f"{self.get_persona_name()} connection error, retrying in {delay:.2f} seconds: {str(e)}")
+                        with tracing.span("retry_backoff"):
+                            time.sleep(delay)
+                        continue
+                return self._handle_generation_error(e)
+
+    def _stream_with_model(self, message: str, conversation_history: List[ChatMessage] = None) -> Iterator[Dict[str, str]]:
+        """Stream a response from the HuggingFace inference client as the job produces output."""
+        if not self.model_loaded or self.client is None:
+            raise ValueError("Model client not loaded")
+
+        if not self.breaker.allow_request():
+            yield {"type": "final", **self._circuit_open_response()}
+            return
+        # A stream the client abandons records no outcome, so it must hand back the half-open probe
+        probing = self.breaker.state == self.breaker.HALF_OPEN
+        outcome_recorded = False
+
+        job = None
         try:
             start_time = time.perf_counter()
+            first_output_time = None
 
-            result = self.client.predict(
-                message,
+            job = self.client.submit(
+                self._format_prompt(message, conversation_history),
                 api_name="/inference"
             )
 
+            sent = ""
+            for output in job:
+                if first_output_time is None:
+                    first_output_time = time.perf_counter()
+                partial = _extract_partial_response(output)
+                if partial.startswith(sent):
+                    delta = partial[len(sent):]
+                else:
+                    # Space emitted a non-cumulative chunk
+                    delta = partial
+                sent = partial
+                if delta:
+                    yield {"type": "token", "delta": delta}
+
+            result = job.result()
+
             end_time = time.perf_counter()
-            elapsed = end_time - start_time
-            logger.info(f"Inference time: {elapsed:.3f} seconds")
+            if first_output_time is not None:
+                # The first output marks the end of the handshake, the Space's queue and prefill
+                tracing.record_span("upstream_first_output", start_time, first_output_time)
+                tracing.record_span("upstream_stream", first_output_time, end_time)
+                request_logger.info(f"[{self.get_persona_name()}] Time to first output: {first_output_time - start_time:.3f} seconds")
+            request_logger.info(f"[{self.get_persona_name()}] Inference time: {end_time - start_time:.3f} seconds")
+            metrics.observe_upstream(self.persona_slug, end_time - start_time)
+
+            self.breaker.record_success()
+            outcome_recorded = True
+            if self.warmth is not None:
+                self.warmth.record_call()
+            yield {"type": "final", **self._parse_output(result)}
+        except Exception as e:
+            outcome_recorded = True
+            yield {"type": "final", **self._handle_generation_error(e)}
+        finally:
+            if probing and not outcome_recorded:
+                self.breaker.release_probe()
+            if job is not None and not job.done():
+                job.cancel()
+
+    def probe(self):
+        """
+        Send one cheap keep-warm request to the backend and record its latency.
+        Probes do not touch the circuit breaker or the outcome metrics, as no
+        user is waiting on them.
+        """
+        if self.warmth is None or not self.model_loaded or self.client is None:
+            return
+
+        start_time = time.perf_counter()
+        error = None
+        try:
+            if settings.keep_warm_probe == "inference":
+                self.client.predict(settings.keep_warm_probe_message, api_name="/inference")
+            else:
+                # Every replica has to stay awake, not just the one the next call goes to
+                clients = [replica.client for replica in self.replica_pool.replicas] if self.replica_pool else [self.client]
+                for client in clients:
+                    response = httpx.get(
+                        urllib.parse.urljoin(client.src, "config"),
+                        headers=client.headers,
+                        timeout=settings.keep_warm_probe_timeout_seconds,
+                        follow_redirects=True
+                    )
+                    response.raise_for_status()
+        except Exception as e:
+            error = str(e)
+
+        elapsed = time.perf_counter() - start_time
+        self.warmth.record_probe(elapsed, error)
+        metrics.observe_probe(self.persona_slug, elapsed)
+        if error is not None:
+            logger.warning(f"{self.get_persona_name()} keep-warm probe failed after {elapsed:.3f} seconds: {error}")
+        elif elapsed >= self.warmth.cold_threshold:
+            logger.info(f"{self.get_persona_name()} was cold, keep-warm probe took {elapsed:.3f} seconds")
+        else:
+            request_logger.info(f"[{self.get_persona_name()}] Keep-warm probe: {elapsed:.3f} seconds")
+
+    def _parse_output(self, result: Any) -> Dict[str, str]:
+        """Parse the Space's raw output into the response/safety contract."""
+        with tracing.span("parse"):
+            parsed_data, path = parse_model_output(result, settings.model_output_max_chars)
+        if path == FALLBACK:
+            logger.warning("Could not parse model output as JSON/Dict. Using raw string.")
+            metrics.record_outcome(self.persona_slug, metrics.PARSE_FALLBACK)
+        else:
+            metrics.record_outcome(self.persona_slug, metrics.OK)
+        return parsed_data
 
-            parsed_data = {}
+    def _quota_response(self, wait_time: str) -> Dict[str, str]:
+        return {
+            'response': f"I'm currently experiencing high demand and the GPU quota has been temporarily exceeded. Please try again in {wait_time}. If this persists, your HuggingFace Space may need configuration adjustments.",
+            'safety': 'System'
+        }
 
-            try:
-                parsed_data = json.loads(result)
-            except json.JSONDecodeError:
-                try:
-                    parsed_data = ast.literal_eval(result)
-                except (ValueError, SyntaxError):
-                    logger.warning("Could not parse model output as JSON/Dict. Using raw string.")
-                    parsed_data = {"response": result, "safety": "Unknown"}
-
-            final_response = {
-                'response': str(parsed_data.get('response', '')).strip(),
-                'safety': str(parsed_data.get('safety', 'Unknown')).strip()
-            }
-
-            return final_response
+    def _connection_error_response(self) -> Dict[str, str]:
+        return {
+            'response': "Sorry, I'm having trouble connecting to the model service. Please try again in a moment.",
+            'safety': 'System'
+        }
+
+    def _circuit_open_response(self) -> Dict[str, str]:
+        """Reply used while the circuit breaker is open, without calling the backend."""
+        metrics.record_outcome(self.persona_slug, metrics.CIRCUIT_OPEN)
+        if self.breaker.open_reason == QUOTA:
+            return self._quota_response(format_wait(self.breaker.retry_after()))
+        return self._connection_error_response()
+
+    def _handle_generation_error(self, e: Exception) -> Dict[str, str]:
+        """
+        Record an upstream failure with the circuit breaker and turn known failures
+        into a user-facing system reply, re-raising anything else.
+        """
+        error_msg = str(e)
+        kind = classify_error(error_msg)
+
+        # Check for GPU quota error
+        if kind == QUOTA:
+            logger.warning(f"GPU quota exceeded: {error_msg}")
+            # Extract wait time if available, and keep the circuit open until then
+            hint = parse_retry_hint(error_msg)
+            self.breaker.record_failure(QUOTA, open_for=retry_hint_seconds(hint) or settings.circuit_recovery_seconds)
+            metrics.record_outcome(self.persona_slug, metrics.QUOTA)
+            return self._quota_response(hint or "a few minutes")
+
+        self.breaker.record_failure(kind)
+
+        # Check for other API/connection errors
+        if kind == CONNECTION:
+            logger.error(f"API/Connection error: {error_msg}")
+            metrics.record_outcome(self.persona_slug, metrics.CONNECTION)
+            return self._connection_error_response()
+
+        # Other unexpected errors
+        logger.error(f"Error generating response: {error_msg}")
+        metrics.record_outcome(self.persona_slug, metrics.ERROR)
+        raise e
+
+    def _placeholder_response(self, message: str) -> Optional[Dict[str, str]]:
+        """Reply to use while no model client is loaded. None means the persona has no placeholder."""
+        return None
+
+    def _unavailable_response(self, message: str) -> Dict[str, str]:
+        placeholder = self._placeholder_response(message)
+        if placeholder is None:
+            metrics.record_outcome(self.persona_slug, metrics.ERROR)
+            raise ValueError("Model client not loaded - cannot generate response")
+        metrics.record_outcome(self.persona_slug, metrics.PLACEHOLDER)
+        return placeholder
+
+    def _prefiltered_response(self, message: str) -> Optional[Dict[str, str]]:
+        """Templated reply for clear-cut abusive or self-harm messages, answered without the model."""
+        if self.safety_prefilter is None:
+            return None
+        with tracing.span("prefilter"):
+            match = self.safety_prefilter.check(message)
+        if match is None:
+            return None
+        request_logger.info(f"[{self.get_persona_name()}] Safety pre-filter matched {match.category}: {', '.join(match.terms)}")
+        metrics.record_outcome(self.persona_slug, metrics.SAFETY_PREFILTER)
+        return match.response
+
+    def _cache_key(self, message: str, conversation_history: List[ChatMessage]) -> tuple:
+        return (self.get_persona_name(), normalize_message(message), hash_history(conversation_history))
+
+    def _get_cached_response(self, message: str, conversation_history: List[ChatMessage]) -> Optional[Dict[str, str]]:
+        if self.response_cache is None:
+            return None
+        with tracing.span("cache_lookup"):
+            cached = self.response_cache.get(self._cache_key(message, conversation_history))
+        if cached is not None:
+            metrics.record_outcome(self.persona_slug, metrics.CACHE_HIT)
+        return cached
+
+    def _get_similar_response(self, message: str, conversation_history: List[ChatMessage]) -> Optional[Dict[str, str]]:
+        """Reply to a paraphrase of `message` from the semantic cache. Embeds the message, so call it off the event loop."""
+        if self.semantic_cache is None:
+            return None
+        with tracing.span("semantic_cache_lookup"):
+            cached = self.semantic_cache.get(message, hash_history(conversation_history))
+        if cached is not None:
+            metrics.record_outcome(self.persona_slug, metrics.SEMANTIC_CACHE_HIT)
+        return cached
+
+    def _cache_response(self, message: str, conversation_history: List[ChatMessage], response_data: Dict[str, str]):
+        # System replies (quota / connection apologies) must never be replayed
+        if response_data.get("safety") == "System":
+            return
+        with tracing.span("cache_store"):
+            if self.response_cache is not None:
+                self.response_cache.set(self._cache_key(message, conversation_history), response_data)
+            if self.semantic_cache is not None:
+                self.semantic_cache.set(message, hash_history(conversation_history), response_data)
+
+    def _generate_uncached(self, message: str, conversation_history: List[ChatMessage]) -> Dict[str, str]:
+        try:
+            response_data = self._generate_with_model(message, conversation_history)
         except Exception as e:
-            error_msg = str(e)
-
-            # Check for GPU quota error
-            if "GPU quota" in error_msg or "exceeded your GPU quota" in error_msg:
-                logger.warning(f"GPU quota exceeded: {error_msg}")
-                # Extract wait time if available
-                wait_time_match = re.search(r'Try again in ([\d:]+)', error_msg)
-                wait_time = wait_time_match.group(1) if wait_time_match else "a few minutes"
-
-                return {
-                    'response': f"I'm currently experiencing high demand and the GPU quota has been temporarily exceeded. Please try again in {wait_time}. If this persists, your HuggingFace Space may need configuration adjustments.",
-                    'safety': 'System'
-                }
-
-            # Check for other API/connection errors
-            elif "API" in error_msg or "connection" in error_msg.lower() or "timeout" in error_msg.lower():
-                logger.error(f"API/Connection error: {error_msg}")
-                return {
-                    'response': "Sorry, I'm having trouble connecting to the model service. Please try again in a moment.",
-                    'safety': 'System'
-                }
-
-            # Other unexpected errors
-            logger.error(f"Error generating response: {error_msg}")
-            raise
+            logger.error(f"Model generation failed: {str(e)}")
+            raise ValueError(f"Failed to generate response: {str(e)}")
+
+        self._cache_response(message, conversation_history, response_data)
+        return response_data
 
     def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
         """Generate a response with safety information."""
-        if conversation_history is None:
-            conversation_history = []
+        prefiltered = self._prefiltered_response(message)
+        if prefiltered is not None:
+            return prefiltered
 
-        if self.model_loaded:
+        conversation_history = self._prepare_history(message, conversation_history)
+
+        if not self.model_loaded:
+            return self._unavailable_response(message)
+
+        cached = self._get_cached_response(message, conversation_history)
+        if cached is None:
+            cached = self._get_similar_response(message, conversation_history)
+        if cached is not None:
+            return cached
+        return self._generate_uncached(message, conversation_history)
+
+    async def generate_response_async(self, message: str, conversation_history: List[ChatMessage] = None,
+                                      priority: int = INTERACTIVE, deadline: Optional[float] = None) -> Dict[str, str]:
+        """
+        Generate a response on this persona's worker pool without blocking the event loop.
+        Safety pre-filter matches, cache hits and placeholder replies are answered directly without taking a pool slot
+        (semantic cache lookups run on a helper thread, as they embed the message), and
+        identical requests already in flight share that call's result.
+        Raises QueueFullError if the persona already has too much work queued, and
+        DeadlineExceededError if `deadline` passes before a worker is free.
+        """
+        prefiltered = self._prefiltered_response(message)
+        if prefiltered is not None:
+            return prefiltered
+
+        conversation_history = self._prepare_history(message, conversation_history)
+
+        if not self.model_loaded:
+            return self._unavailable_response(message)
+
+        cached = self._get_cached_response(message, conversation_history)
+        if cached is None and self.semantic_cache is not None:
+            cached = await asyncio.to_thread(self._get_similar_response, message, conversation_history)
+        if cached is not None:
+            return cached
+
+        if self.inflight is None:
+            return await self.pool.run(self._generate_uncached, message, conversation_history,
+                                       priority=priority, deadline=deadline)
+
+        # Only requests of the same priority class share a call, and only with a
+        # call whose deadline is no stricter than their own
+        response_data = await self.inflight.do(
+            (self._cache_key(message, conversation_history), priority),
+            lambda: self.pool.run(self._generate_uncached, message, conversation_history,
+                                  priority=priority, deadline=deadline),
+            deadline=deadline
+        )
+        return dict(response_data)
+
+    def stream_response(self, message: str, conversation_history: List[ChatMessage] = None) -> Iterator[Dict[str, str]]:
+        """
+        Yield "token" events with partial response text as they arrive, followed by
+        one "final" event carrying the full response and its safety label.
+        """
+        conversation_history = self._prepare_history(message, conversation_history)
+
+        # Pre-filtered, placeholder and cached replies are sent in one go
+        response_data = self._prefiltered_response(message)
+        if response_data is None and not self.model_loaded:
+            response_data = self._unavailable_response(message)
+        elif response_data is None:
+            response_data = (self._get_cached_response(message, conversation_history)
+                             or self._get_similar_response(message, conversation_history))
+
+        if response_data is not None:
+            yield {"type": "token", "delta": response_data["response"]}
+            yield {"type": "final", **response_data}
+            return
+
+        try:
+            for event in self._stream_with_model(message, conversation_history):
+                if event["type"] == "final":
+                    self._cache_response(message, conversation_history, {
+                        "response": event["response"],
+                        "safety": event["safety"]
+                    })
+                yield event
+        except Exception as e:
+            logger.error(f"Model streaming failed: {str(e)}")
+            raise ValueError(f"Failed to generate response: {str(e)}")
+
+    async def stream_response_async(self, message: str, conversation_history: List[ChatMessage] = None,
+                                    priority: int = INTERACTIVE, deadline: Optional[float] = None) -> AsyncIterator[Dict[str, str]]:
+        """
+        Async version of stream_response. The stream holds one slot on the persona's
+        worker pool until it finishes; closing the iterator early cancels the upstream job.
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        end_of_stream = object()
+
+        def produce():
+            stream = self.stream_response(message, conversation_history)
             try:
-                return self._generate_with_model(message, conversation_history)
-            except Exception as e:
-                logger.error(f"Model generation failed: {str(e)}")
-                raise ValueError(f"Failed to generate response: {str(e)}")
-        else:
-            raise ValueError("Model client not loaded - cannot generate response")
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            finally:
+                stream.close()
+
+        task = asyncio.ensure_future(self.pool.run(produce, priority=priority, deadline=deadline))
+        task.add_done_callback(lambda _: events.put_nowait(end_of_stream))
+        try:
+            while True:
+                event = await events.get()
+                if event is end_of_stream:
+                    break
+                yield event
+            # Surface QueueFullError, DeadlineExceededError or generation failures
+            await task
+        finally:
+            stop.set()
+            if not task.done():
+                task.cancel()
 
     def get_model_status(self) -> Dict[str, Any]:
         """Get the current status of the model service."""
         return {
             "model_loaded": self.model_loaded,
             "persona": self.get_persona_name(),
+            "state": self.state,
+            "connect_attempts": self.connect_attempts,
+            "connected_at": self.connected_at.isoformat() if self.connected_at else None,
+            "pool": self.pool.get_status(),
+            "circuit": self.breaker.get_status(),
+            "cache": self.response_cache.get_stats() if self.response_cache else {"enabled": False},
+            "semantic_cache": self.semantic_cache.get_stats() if self.semantic_cache else {"enabled": False},
+            "coalescing": self.inflight.get_status() if self.inflight else {"enabled": False},
+            "safety_prefilter": self.safety_prefilter.get_stats() if self.safety_prefilter else {"enabled": False},
+            "keep_warm": self.warmth.get_stats() if self.warmth else {"enabled": False},
+            "replicas": self.replica_pool.get_status() if self.replica_pool else {"enabled": False},
         }
 
 class SinglishModelService(BaseModelService):
@@ -118,10 +613,6 @@ class SinglishModelService(BaseModelService):
     Uses Hugging Face inference API via gradio_client.
     """
 
-    def __init__(self):
-        super().__init__()
-        self._load_model()
-
     def get_persona_name(self) -> str:
         return "Singlish"
 
@@ -130,10 +621,7 @@ class SinglishModelService(BaseModelService):
         try:
             logger.info("Initializing Singlish HuggingFace inference client...")
 
-            self.client = Client(
-                "yuhueng/SinglishTest",
-                token=settings.hf_token
-            )
+            self.client = self._create_client("yuhueng/SinglishTest")
 
             self.model_loaded = True
             logger.info("Singlish HuggingFace inference client initialized successfully!")
@@ -162,10 +650,6 @@ class XMMModelService(BaseModelService):
     Uses placeholder HuggingFace endpoint (to be replaced).
     """
 
-    def __init__(self):
-        super().__init__()
-        self._load_model()
-
     def get_persona_name(self) -> str:
         return "XMM"
 
@@ -174,10 +658,7 @@ class XMMModelService(BaseModelService):
         try:
             logger.info("Initializing XMM HuggingFace inference client...")
 
-            self.client = Client(
-                "yuhueng/xmm-persona", 
-                token=settings.hf_token
-            )
+            self.client = self._create_client("yuhueng/xmm-persona")
 
             self.model_loaded = True
             logger.info("XMM HuggingFace inference client initialized successfully!")
@@ -188,15 +669,12 @@ class XMMModelService(BaseModelService):
             self.client = None
             self.model_loaded = False
 
-    def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
-        """Generate XMM persona response."""
-        if not self.model_loaded:
-            # Placeholder response when model is not loaded
-            return {
-                'response': f"XMM here! (Placeholder response) You said: {message}",
-                'safety': "Safe"
-            }
-        return super().generate_response(message, conversation_history)
+    def _placeholder_response(self, message: str) -> Optional[Dict[str, str]]:
+        """Placeholder XMM response used while the model is not loaded."""
+        return {
+            'response': f"XMM here! (Placeholder response) You said: {message}",
+            'safety': "Safe"
+        }
 
     def get_model_status(self) -> Dict[str, Any]:
         """Get the current status of the XMM model service."""
@@ -216,10 +694,6 @@ class AhBengModelService(BaseModelService):
     Uses placeholder HuggingFace endpoint (to be replaced).
     """
 
-    def __init__(self):
-        super().__init__()
-        self._load_model()
-
     def get_persona_name(self) -> str:
         return "Ah Beng"
 
@@ -228,10 +702,7 @@ class AhBengModelService(BaseModelService):
         try:
             logger.info("Initializing Ah Beng HuggingFace inference client...")
 
-            self.client = Client(
-                "yuhueng/ahbeng-persona",
-                token=settings.hf_token
-            )
+            self.client = self._create_client("yuhueng/ahbeng-persona")
 
             self.model_loaded = True
             logger.info("Ah Beng HuggingFace inference client initialized successfully!")
@@ -242,15 +713,12 @@ class AhBengModelService(BaseModelService):
             self.client = None
             self.model_loaded = False
 
-    def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
-        """Generate Ah Beng persona response."""
-        if not self.model_loaded:
-            # Placeholder response when model is not loaded
-            return {
-                'response': f"Wah bro! (Placeholder response) You said: {message}",
-                'safety': "Safe"
-            }
-        return super().generate_response(message, conversation_history)
+    def _placeholder_response(self, message: str) -> Optional[Dict[str, str]]:
+        """Placeholder Ah Beng response used while the model is not loaded."""
+        return {
+            'response': f"Wah bro! (Placeholder response) You said: {message}",
+            'safety': "Safe"
+        }
 
     def get_model_status(self) -> Dict[str, Any]:
         """Get the current status of the Ah Beng model service."""
@@ -270,10 +738,6 @@ class NSFModelService(BaseModelService):
     Uses HuggingFace endpoint.
     """
 
-    def __init__(self):
-        super().__init__()
-        self._load_model()
-
     def get_persona_name(self) -> str:
         return "NSF"
 
@@ -282,10 +746,7 @@ class NSFModelService(BaseModelService):
         try:
             logger.info("Initializing NSF HuggingFace inference client...")
 
-            self.client = Client(
-                "yuhueng/nsf-persona",
-                token=settings.hf_token
-            )
+            self.client = self._create_client("yuhueng/nsf-persona")
 
             self.model_loaded = True
             logger.info("NSF HuggingFace inference client initialized successfully!")
@@ -296,15 +757,12 @@ class NSFModelService(BaseModelService):
             self.client = None
             self.model_loaded = False
 
-    def generate_response(self, message: str, conversation_history: List[ChatMessage] = None) -> Dict[str, str]:
-        """Generate NSF persona response."""
-        if not self.model_loaded:
-            # Placeholder response when model is not loaded
-            return {
-                'response': f"Eh bro, ORD loh! (Placeholder response) You said: {message}",
-                'safety': "Safe"
-            }
-        return super().generate_response(message, conversation_history)
+    def _placeholder_response(self, message: str) -> Optional[Dict[str, str]]:
+        """Placeholder NSF response used while the model is not loaded."""
+        return {
+            'response': f"Eh bro, ORD loh! (Placeholder response) You said: {message}",
+            'safety': "Safe"
+        }
 
     def get_model_status(self) -> Dict[str, Any]:
         """Get the current status of the NSF model service."""
@@ -318,11 +776,29 @@ class NSFModelService(BaseModelService):
         }
 
 
-# Singleton instances for each persona
-singlish_service = SinglishModelService()
-xmm_service = XMMModelService()
-ahbeng_service = AhBengModelService()
-nsf_service = NSFModelService()
+# Singleton instances for each persona (clients connect during app startup)
+if settings.inference_backend == "local":
+    # Imported here because local_model builds on BaseModelService above
+    from app.services.local_model import create_local_services
+
+    _local_services = create_local_services()
+    singlish_service = _local_services["singlish"]
+    xmm_service = _local_services["xmm"]
+    ahbeng_service = _local_services["ahbeng"]
+    nsf_service = _local_services["nsf"]
+else:
+    singlish_service = SinglishModelService()
+    xmm_service = XMMModelService()
+    ahbeng_service = AhBengModelService()
+    nsf_service = NSFModelService()
 
 # Keep backward compatibility
-model_service = singlish_service
\ No newline at end of file
+model_service = singlish_service
+
+# Lookup by the persona slug used in the API routes
+persona_services = {
+    "singlish": singlish_service,
+    "xmm": xmm_service,
+    "ahbeng": ahbeng_service,
+    "nsf": nsf_service,
+}
\ No newline at end of file
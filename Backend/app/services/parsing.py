@@ -0,0 +1,69 @@
+from typing import Any, Dict, Optional, Tuple
+import orjson
+import re
+
+# How a raw output was understood
+JSON = "json"
+LITERAL = "literal"
+FALLBACK = "fallback"
+
+# Quoted "response"/"safety" values in a Python-style dict, e.g. {'response': 'Wah', 'safety': 'Safe'}
+_LITERAL_FIELD_RE = {
+    key: re.compile(r"""['"]%s['"]\s*:\s*(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)")""" % key, re.DOTALL)
+    for key in ("response", "safety")
+}
+_ESCAPE_RE = re.compile(r"\\(.)", re.DOTALL)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def _literal_field(text: str, key: str) -> Optional[str]:
+    match = _LITERAL_FIELD_RE[key].search(text)
+    if not match:
+        return None
+    value = match.group(1) if match.group(1) is not None else match.group(2)
+    return _unescape(value)
+
+
+def parse_model_output(output: Any, max_chars: int) -> Tuple[Dict[str, str], str]:
+    """
+    Parse a Space's raw output into the {response, safety} contract.
+
+    Strict JSON objects take the fast path. Python-style dicts (single quotes),
+    which some Spaces return, are read field by field with a regex rather than
+    evaluated. Anything else, including output over `max_chars`, is passed
+    through as the response with safety "Unknown". Returns the parsed fields
+    and which path was taken (JSON, LITERAL or FALLBACK).
+    """
+    if isinstance(output, dict):
+        data = output
+        path = JSON
+    else:
+        text = output if isinstance(output, str) else str(output)
+        if len(text) > max_chars:
+            return {"response": text[:max_chars].strip(), "safety": "Unknown"}, FALLBACK
+
+        stripped = text.strip()
+        if not (stripped.startswith("{") and stripped.endswith("}")):
+            return {"response": stripped, "safety": "Unknown"}, FALLBACK
+
+        try:
+            data = orjson.loads(stripped)
+            path = JSON
+        except orjson.JSONDecodeError:
+            response = _literal_field(stripped, "response")
+            if response is None:
+                return {"response": stripped, "safety": "Unknown"}, FALLBACK
+            data = {"response": response, "safety": _literal_field(stripped, "safety") or "Unknown"}
+            path = LITERAL
+
+        if not isinstance(data, dict):
+            return {"response": stripped, "safety": "Unknown"}, FALLBACK
+
+    return {
+        "response": str(data.get("response", "")).strip(),
+        "safety": str(data.get("safety", "Unknown")).strip()
+    }, path
@@ -0,0 +1,199 @@
+from app.services import tracing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes; lower values are served first
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+
+class QueueFullError(Exception):
+    """Raised when a persona's inference queue cannot accept more work."""
+
+    def __init__(self, name: str, queue_depth: int, retry_after: float = 1.0):
+        self.name = name
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+        super().__init__(f"{name} inference queue is full ({queue_depth} waiting)")
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's deadline passes before it gets a worker."""
+
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"{name} request deadline passed while queued")
+
+
+class InferencePool:
+    """
+    Bounded worker pool that runs blocking inference calls off the event loop.
+
+    At most `max_concurrency` calls run at once on a dedicated thread pool;
+    up to `max_queue_depth` further callers wait for a free slot, and anything
+    beyond that is rejected with QueueFullError instead of piling up.
+
+    Waiting callers are served by priority class (interactive before bulk),
+    then in arrival order. When the queue is full, a new interactive request
+    sheds the newest queued bulk request instead of being rejected. Callers
+    can pass a monotonic `deadline`; if it passes while they are still queued
+    they get DeadlineExceededError and never reach a worker.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue_depth: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix=f"inference-{name.lower().replace(' ', '-')}"
+        )
+        self._active = 0
+        # Heap of (priority, sequence, waiter)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Smoothed time a call holds a worker, used to suggest a Retry-After
+        self._service_time: Optional[float] = None
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+        self.expired = 0
+
+    async def run(self, fn: Callable[..., Any], *args,
+                  priority: int = INTERACTIVE, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on the pool once a slot is free.
+        `deadline` is a time.monotonic() value after which the call is no longer wanted.
+        """
+        loop = asyncio.get_running_loop()
+
+        with tracing.span("queue"):
+            await self._acquire(loop, priority, deadline)
+
+        started = time.monotonic()
+        # Carry the caller's context into the worker thread, like asyncio.to_thread does
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(context.run, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+
+        # Free the slot only once the worker thread is actually done, so a
+        # cancelled caller does not let more calls run than we have workers.
+        future.add_done_callback(lambda _: self._release_threadsafe(loop, time.monotonic() - started))
+        return await asyncio.wrap_future(future)
+
+    async def _acquire(self, loop: asyncio.AbstractEventLoop, priority: int, deadline: Optional[float]):
+        if deadline is not None and time.monotonic() >= deadline:
+            self.expired += 1
+            raise DeadlineExceededError(self.name)
+
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue_depth:
+            self._shed_for(priority)
+
+        waiter = loop.create_future()
+        entry = (priority, next(self._sequence), waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            if deadline is None:
+                await waiter
+            else:
+                await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._discard(entry)
+            self.expired += 1
+            raise DeadlineExceededError(self.name)
+        except asyncio.CancelledError:
+            if not self._discard(entry) and waiter.done() and not waiter.cancelled():
+                # A slot was handed to us just before we were cancelled
+                self._release()
+            raise
+
+    def _shed_for(self, priority: int):
+        """Make room for a new request of `priority`, or reject it."""
+        victim = max(self._waiters) if self._waiters else None
+        if victim is None or victim[0] <= priority:
+            self.rejected += 1
+            raise QueueFullError(self.name, len(self._waiters), self.retry_after())
+
+        # Drop the newest waiter of the lowest priority class
+        self._discard(victim)
+        self.shed += 1
+        victim[2].set_exception(QueueFullError(self.name, len(self._waiters), self.retry_after()))
+
+    def _discard(self, entry: Tuple[int, int, asyncio.Future]) -> bool:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return False
+        heapq.heapify(self._waiters)
+        return True
+
+    def _release(self, service_time: Optional[float] = None):
+        self.completed += 1
+        if service_time is not None:
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # Hand the slot straight to the next waiter
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop, service_time: float):
+        try:
+            loop.call_soon_threadsafe(self._release, service_time)
+        except RuntimeError:
+            # Event loop already closed (e.g. during shutdown)
+            self._active = max(0, self._active - 1)
+
+    def retry_after(self) -> float:
+        """Rough number of seconds until the current queue has drained."""
+        service_time = self._service_time or 1.0
+        return float(max(1, math.ceil(service_time * (len(self._waiters) + 1) / self.max_concurrency)))
+
+    @property
+    def in_flight(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def shutdown(self, wait: bool = False):
+        """Stop accepting work and release the worker threads."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "expired": self.expired,
+            "avg_service_seconds": round(self._service_time, 3) if self._service_time is not None else None,
+        }
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import threading
+
+
+@dataclass
+class _PrefixEntry:
+    adapter: Optional[str]
+    tokens: Any  # 1-D CPU tensor of token ids covered by `cache`
+    cache: Any  # transformers Cache holding the attention keys/values for `tokens`
+    pinned: bool = False
+
+
+def _common_prefix_length(a, b) -> int:
+    """Length of the longest common prefix of two 1-D token tensors."""
+    n = min(len(a), len(b))
+    if n == 0:
+        return 0
+    mismatch = (a[:n] != b[:n]).nonzero()
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+class PrefixCache:
+    """
+    Attention key/value state for prompt prefixes, per adapter, for the local model.
+
+    Before a prompt is prefilled, the cached entry sharing the longest token
+    prefix with it (for the same adapter) is copied and cropped to that prefix,
+    so only the remaining tokens have to be encoded. Persona system prompts are
+    stored pinned when the model loads; after each turn the state of the whole
+    exchange is stored too, so the next turn of the same session only encodes
+    the new message. Unpinned entries are evicted least recently used first
+    once their total length exceeds `max_tokens`.
+
+    Callers serialize access through the runtime's generation lock; the lock
+    here only keeps the status counters consistent.
+    """
+
+    def __init__(self, max_tokens: int, min_match_tokens: int):
+        self.max_tokens = max_tokens
+        self.min_match_tokens = max(1, min_match_tokens)
+        self._entries: "OrderedDict[int, _PrefixEntry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.cached_tokens = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.evictions = 0
+
+    def lookup(self, adapter: Optional[str], tokens) -> Tuple[Optional[Any], int]:
+        """
+        A private copy of the cached state for the longest known prefix of
+        `tokens`, and its length. At least one token is always left to prefill.
+        Returns (None, 0) on a miss.
+        """
+        tokens = tokens.cpu()
+        with self._lock:
+            best_id, best_length = None, 0
+            for entry_id, entry in self._entries.items():
+                if entry.adapter != adapter:
+                    continue
+                length = min(_common_prefix_length(entry.tokens, tokens), len(tokens) - 1)
+                if length > best_length:
+                    best_id, best_length = entry_id, length
+
+            if best_id is None or best_length < self.min_match_tokens:
+                self.misses += 1
+                self.prefilled_tokens += len(tokens)
+                return None, 0
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.reused_tokens += best_length
+            self.prefilled_tokens += len(tokens) - best_length
+            source = self._entries[best_id].cache
+
+        # Generation appends to the cache it is given, so never hand out the stored one
+        cache = copy.deepcopy(source)
+        excess = cache.get_seq_length() - best_length
+        if excess > 0:
+            cache.crop(-excess)
+        return cache, best_length
+
+    def store(self, adapter: Optional[str], tokens, cache, pinned: bool = False):
+        """Remember the state for `tokens`, replacing entries it extends."""
+        tokens = tokens.detach().cpu()
+        if len(tokens) < self.min_match_tokens or (not pinned and len(tokens) > self.max_tokens):
+            return
+        with self._lock:
+            # An earlier turn of the same conversation is a strict prefix of this one
+            for entry_id, entry in list(self._entries.items()):
+                if (entry.adapter == adapter and not entry.pinned and len(entry.tokens) <= len(tokens)
+                        and _common_prefix_length(entry.tokens, tokens) == len(entry.tokens)):
+                    self._remove(entry_id)
+
+            self._entries[self._next_id] = _PrefixEntry(adapter, tokens, cache, pinned)
+            self._next_id += 1
+            self.cached_tokens += len(tokens)
+            self._evict()
+
+    def is_pinned(self, adapter: Optional[str], tokens) -> bool:
+        tokens = tokens.cpu()
+        with self._lock:
+            return any(
+                entry.pinned and entry.adapter == adapter and len(entry.tokens) == len(tokens)
+                and _common_prefix_length(entry.tokens, tokens) == len(tokens)
+                for entry in self._entries.values()
+            )
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self.cached_tokens -= len(entry.tokens)
+
+    def _evict(self):
+        for entry_id in list(self._entries):
+            if self.cached_tokens <= self.max_tokens:
+                return
+            if not self._entries[entry_id].pinned:
+                self._remove(entry_id)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for entry_id in [i for i, entry in self._entries.items() if not entry.pinned]:
+                self._remove(entry_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        total = self.reused_tokens + self.prefilled_tokens
+        pinned: List[Optional[str]] = [entry.adapter for entry in self._entries.values() if entry.pinned]
+        return {
+            "entries": len(self._entries),
+            "pinned": pinned,
+            "cached_tokens": self.cached_tokens,
+            "max_tokens": self.max_tokens,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            # Share of prompt tokens whose prefill was skipped
+            "reused_token_rate": round(self.reused_tokens / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,82 @@
+from collections import Counter
+from typing import Dict, Optional
+import os
+import sys
+import threading
+import time
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+    def __init__(self):
+        super().__init__("A profile is already running")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    # Semicolons separate frames in the collapsed format
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the live process.
+
+    Every `interval` seconds it takes the current stack of every thread
+    (sys._current_frames(), so nothing is instrumented and requests are not
+    slowed down beyond the sampling itself) and counts identical stacks. The
+    result is in the collapsed-stack format, one "thread;outer;...;inner count"
+    line per stack, which flamegraph.pl, inferno and speedscope read directly.
+    Idle threads are included, so waiting (e.g. on upstream calls) shows up too.
+    One profile runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float) -> Dict[str, object]:
+        """Sample for `seconds` (blocking). Raises ProfilerBusyError if a profile is already running."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+        try:
+            stacks: Counter = Counter()
+            own_thread = threading.get_ident()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, f"thread-{thread_id}").replace(";", ":"))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+            self.runs += 1
+            return {
+                "samples": samples,
+                "seconds": time.perf_counter() - started,
+                "stacks": stacks,
+            }
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapse(stacks: Counter, limit: Optional[int] = None) -> str:
+        """Collapsed-stack text, most frequent stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common(limit))
+
+
+profiler = SamplingProfiler()
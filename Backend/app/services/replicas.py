@@ -0,0 +1,268 @@
+from app.config import settings
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """One of a persona's equivalent backends, with its routing state."""
+
+    def __init__(self, source: str, client: Any):
+        self.source = source
+        self.client = client
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.calls = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def routing_key(self) -> tuple:
+        # Expected wait if the call queues behind the outstanding ones. Replicas failing
+        # right now go last; unmeasured ones count as fast, so they get tried
+        expected = (self.outstanding + 1) * (self.latency_ewma or 0.0)
+        return (self.consecutive_failures > 0, expected, self.outstanding)
+
+
+@dataclass
+class _Attempt:
+    replica: Replica
+    job: Any
+    started: float
+    hedge: bool = False
+    abandoned: bool = False
+
+
+class ReplicaPool:
+    """
+    Equivalent backends (duplicate Spaces or stand-in servers) for one persona.
+
+    Stands in for a single gradio Client: `predict` and `submit` go to the
+    replica expected to answer first, i.e. with the fewest outstanding calls
+    weighted by its recent latency. With hedging on, a `predict` that has not
+    finished by the persona's recent `hedge_quantile` latency is sent to a
+    second replica as well; whichever answers first wins and the other job is
+    cancelled. Streams (`submit`) are routed but never hedged. Hedging starts
+    once `hedge_min_samples` calls have finished.
+
+    Sources that could not be reached are kept in `missing`; the persona
+    supervisor calls `connect_missing` to retry them, each with its own
+    exponential backoff, and adds them to the pool once they answer.
+    """
+
+    def __init__(self, persona_name: str, replicas: List[Replica], hedging: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20,
+                 latency_window: int = 200, ewma_alpha: float = 0.2,
+                 missing: Optional[List[str]] = None, connect: Optional[Callable[[str], Any]] = None):
+        if not replicas:
+            raise ValueError("ReplicaPool needs at least one replica")
+        self.persona_name = persona_name
+        self.replicas = replicas
+        self.connect = connect
+        # Missing source -> (monotonic time of its next attempt, backoff delay)
+        self._missing: Dict[str, tuple] = {}
+        if connect is not None:
+            delay = settings.reconnect_initial_delay_seconds
+            self._missing = {source: (time.monotonic() + delay, delay) for source in missing or []}
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.ewma_alpha = ewma_alpha
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedges_won = 0
+
+    @property
+    def src(self) -> str:
+        """Source of the first replica, for code that expects a single Client."""
+        return self.replicas[0].source
+
+    @property
+    def missing(self) -> List[str]:
+        """Sources not connected yet."""
+        return list(self._missing)
+
+    def connect_missing(self) -> int:
+        """Retry the missing sources whose backoff has passed. Blocks while connecting; returns how many joined."""
+        joined = 0
+        now = time.monotonic()
+        for source, (next_attempt, delay) in list(self._missing.items()):
+            if now < next_attempt:
+                continue
+            try:
+                replica = Replica(source, self.connect(source))
+            except Exception as e:
+                delay = min(delay * 2, settings.reconnect_max_delay_seconds)
+                self._missing[source] = (time.monotonic() + delay, delay)
+                logger.warning(f"{self.persona_name} replica {source} still not available, retrying in {delay:.0f} seconds: {str(e)}")
+                continue
+            del self._missing[source]
+            # Swap in a new list, so calls picking a replica meanwhile never see it change
+            with self._lock:
+                self.replicas = self.replicas + [replica]
+            logger.info(f"{self.persona_name} replica {source} connected")
+            joined += 1
+        return joined
+
+    def _pick(self, exclude: Optional[Replica] = None) -> Optional[Replica]:
+        candidates = [replica for replica in self.replicas if replica is not exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=Replica.routing_key)
+
+    def hedge_delay(self) -> Optional[float]:
+        """The persona's recent latency at `hedge_quantile`, or None until enough calls have finished."""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def _start(self, replica: Replica, args: tuple, kwargs: Dict[str, Any], hedge: bool = False,
+               on_done: Optional[Callable[[_Attempt], None]] = None) -> _Attempt:
+        with self._lock:
+            replica.outstanding += 1
+            replica.calls += 1
+            if hedge:
+                replica.hedges += 1
+        try:
+            job = replica.client.submit(*args, **kwargs)
+        except Exception:
+            self._finish(replica, None)
+            raise
+        attempt = _Attempt(replica, job, time.perf_counter(), hedge)
+
+        def done(_):
+            failed = False
+            try:
+                job.result(timeout=0)
+            except Exception:
+                failed = True
+            # A cancelled loser says nothing about the replica's latency or health
+            self._finish(replica, None if attempt.abandoned else (time.perf_counter() - attempt.started, failed))
+            if on_done is not None:
+                on_done(attempt)
+
+        job.add_done_callback(done)
+        return attempt
+
+    def _finish(self, replica: Replica, outcome: Optional[tuple]):
+        with self._lock:
+            replica.outstanding -= 1
+            if outcome is None:
+                return
+            seconds, failed = outcome
+            if failed:
+                replica.failures += 1
+                replica.consecutive_failures += 1
+                return
+            replica.consecutive_failures = 0
+            if replica.latency_ewma is None:
+                replica.latency_ewma = seconds
+            else:
+                replica.latency_ewma += self.ewma_alpha * (seconds - replica.latency_ewma)
+            self._latencies.append(seconds)
+
+    def submit(self, *args, **kwargs) -> Any:
+        """Start a job on the least loaded replica and return it (not hedged)."""
+        return self._start(self._pick(), args, kwargs).job
+
+    def predict(self, *args, **kwargs) -> Any:
+        """Run a call to completion on the least loaded replica, hedged on a second one if it is slow."""
+        finished: "queue.Queue[_Attempt]" = queue.Queue()
+        primary = self._start(self._pick(), args, kwargs, on_done=finished.put)
+        pending = [primary]
+
+        hedge_after = self.hedge_delay() if self.hedging and len(self.replicas) > 1 else None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                try:
+                    attempt = finished.get(timeout=hedge_after)
+                except queue.Empty:
+                    hedge_after = None
+                    replica = self._pick(exclude=primary.replica)
+                    logger.info(f"{self.persona_name} call to {primary.replica.source} is slow, hedging on {replica.source}")
+                    with self._lock:
+                        self.hedged += 1
+                    pending.append(self._start(replica, args, kwargs, hedge=True, on_done=finished.put))
+                    continue
+
+                pending.remove(attempt)
+                try:
+                    result = attempt.job.result()
+                except Exception as e:
+                    # The other attempt may still succeed
+                    error = e
+                    continue
+                if attempt.hedge:
+                    with self._lock:
+                        self.hedges_won += 1
+                        attempt.replica.hedges_won += 1
+                return result
+            raise error
+        finally:
+            for attempt in pending:
+                attempt.abandoned = True
+                attempt.job.cancel()
+
+    def get_status(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "replicas": [
+                    {
+                        "source": replica.source,
+                        "outstanding": replica.outstanding,
+                        "latency_ewma_seconds": round(replica.latency_ewma, 3) if replica.latency_ewma is not None else None,
+                        "calls": replica.calls,
+                        "failures": replica.failures,
+                        "hedges": replica.hedges,
+                        "hedges_won": replica.hedges_won,
+                    }
+                    for replica in self.replicas
+                ],
+                "missing": self.missing,
+                "hedging": self.hedging,
+                "hedge_after_seconds": round(delay, 3) if delay is not None else None,
+                "hedged": self.hedged,
+                "hedges_won": self.hedges_won,
+            }
+
+
+def create_replica_pool(persona_name: str, sources: List[str], connect: Callable[[str], Any]) -> ReplicaPool:
+    """
+    Connect to every source that answers and pool them. Sources that fail are
+    retried in the background (see ReplicaPool.connect_missing); if none
+    connect the error is raised.
+    """
+    replicas = []
+    missing = []
+    error: Optional[Exception] = None
+    for source in sources:
+        try:
+            replicas.append(Replica(source, connect(source)))
+        except Exception as e:
+            logger.warning(f"{persona_name} replica {source} not available, retrying in the background: {str(e)}")
+            missing.append(source)
+            error = e
+    if not replicas:
+        raise error
+    return ReplicaPool(
+        persona_name,
+        replicas,
+        hedging=settings.hedging_enabled,
+        hedge_quantile=settings.hedge_quantile,
+        hedge_min_samples=settings.hedge_min_samples,
+        latency_window=settings.replica_latency_window,
+        missing=missing,
+        connect=connect
+    )
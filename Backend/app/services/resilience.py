@@ -0,0 +1,151 @@
+from typing import Any, Dict, Iterator, Optional
+import random
+import re
+import threading
+import time
+
+QUOTA = "quota"
+CONNECTION = "connection"
+OTHER = "other"
+
+_RETRY_HINT_RE = re.compile(r'Try again in ([\d:]+)')
+
+
+def classify_error(error_msg: str) -> str:
+    """Sort an upstream error message into quota, connection or other failures."""
+    if "GPU quota" in error_msg or "exceeded your GPU quota" in error_msg:
+        return QUOTA
+    lowered = error_msg.lower()
+    if "API" in error_msg or "connection" in lowered or "timeout" in lowered or "timed out" in lowered:
+        return CONNECTION
+    return OTHER
+
+
+def parse_retry_hint(error_msg: str) -> Optional[str]:
+    """Return the raw "Try again in ..." hint from a quota error, if present."""
+    match = _RETRY_HINT_RE.search(error_msg)
+    return match.group(1) if match else None
+
+
+def retry_hint_seconds(hint: Optional[str]) -> Optional[float]:
+    """Convert an "H:MM:SS", "MM:SS" or "SS" hint into seconds."""
+    if not hint:
+        return None
+    try:
+        seconds = 0
+        for part in hint.strip(":").split(":"):
+            seconds = seconds * 60 + int(part)
+        return float(seconds)
+    except ValueError:
+        return None
+
+
+def format_wait(seconds: float) -> str:
+    """Format a wait in the same H:MM:SS shape the Spaces use."""
+    seconds = max(0, int(round(seconds)))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker.
+
+    Closed: calls go through and consecutive failures are counted.
+    Open: calls fail fast until `open_until` (from a quota hint, or the recovery timeout).
+    Half-open: once the open period ends, a single probe call is let through;
+    success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.open_reason: Optional[str] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.open_reason = None
+            self._probe_in_flight = False
+
+    def record_failure(self, reason: str, open_for: Optional[float] = None):
+        """
+        Count a failed call. The circuit opens when the threshold is reached,
+        when a half-open probe fails, or immediately if `open_for` is given
+        (e.g. a quota error that says exactly when to come back).
+        """
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if (open_for is not None or self.state == self.HALF_OPEN
+                    or self.consecutive_failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.open_reason = reason
+                self.open_until = time.monotonic() + (open_for if open_for is not None else self.recovery_seconds)
+
+    def release_probe(self):
+        """Give back the half-open probe when the probing call ended without an outcome (e.g. it was abandoned)."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def reset(self):
+        """Close the circuit, e.g. after the client was replaced by a fresh connection."""
+        self.record_success()
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit will let a probe through (0 if not open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.open_until - time.monotonic())
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "open_reason": self.open_reason,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and full jitter."""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delays(self) -> Iterator[float]:
+        """Yield the sleep before each retry (max_attempts - 1 values)."""
+        for attempt in range(self.max_attempts - 1):
+            yield random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
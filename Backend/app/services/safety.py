@@ -0,0 +1,231 @@
+from app.config import settings
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import re
+import threading
+
+# Categories of clear-cut messages answered without calling the model
+PROFANITY = "profanity"
+SELF_HARM = "self_harm"
+
+# Singlish / Hokkien / Malay / English terms, written as users type them; each
+# entry goes through the same normalisation as incoming messages
+LEXICON: Dict[str, List[str]] = {
+    PROFANITY: [
+        "chee bai", "chee bye", "cheebai", "cheebye", "chi bai", "chibai", "jibai", "ji bai",
+        "knn", "kan ni na", "kanina", "kannina", "knnbccb", "nabei", "na bei", "lanjiao", "lan jiao",
+        "pukimak", "puki mak", "puki", "pundek", "fuck", "fucking", "fucker", "motherfucker", "fk you",
+        "stfu", "bitch", "cunt", "dickhead", "asshole",
+    ],
+    SELF_HARM: [
+        "kill myself", "killing myself", "kms", "want to die", "wanna die", "want to end it all",
+        "end my life", "ending my life", "take my own life", "suicide", "suicidal", "cut myself",
+        "hurt myself", "self harm", "unalive myself", "don't want to live", "dont want to live",
+        "no reason to live", "better off dead",
+    ],
+}
+
+# Benign uses of lexicon terms, cut out of the normalised text before matching:
+# distances ("5 kms run") and talk about suicide rather than intent ("suicide
+# rate", "Suicide Squad"). Ambiguous terms are left out of the lexicon
+# altogether: "cb" (and "ccb", which squeezes to it) is also the COVID circuit
+# breaker, and "bastard" has literal uses ("bastard son")
+BENIGN_CONTEXTS = [
+    r"\d+ kms",
+    r"suicide (?:rate|rates|statistics|stats|squad|prevention|awareness|hotline|bomber|bombers|bombing)",
+]
+
+# Labels of the templated replies; the frontend blurs "Unsafe" replies until
+# clicked, so the self-harm reply (which must stay readable) gets its own label
+LABELS: Dict[str, str] = {
+    PROFANITY: "Unsafe",
+    SELF_HARM: "SelfHarm",
+}
+
+# Replies in each persona's voice; self-harm replies always point to help
+TEMPLATES: Dict[str, Dict[str, str]] = {
+    PROFANITY: {
+        "singlish": "Wah, no need to use such language lah. Talk nicely can or not?",
+        "xmm": "Eee why so rude one 😤 Talk nice nice to me can?",
+        "ahbeng": "Oi bro, chill lah. Vulgar until like that for what, talk properly can?",
+        "nsf": "Language, please. Keep it respectful and we can carry on the conversation.",
+    },
+    SELF_HARM: {
+        "*": (
+            "Hey, it sounds like you're going through something really heavy right now, and you don't "
+            "have to face it alone. Please reach out to Samaritans of Singapore (SOS) at 1767, any time "
+            "of day, or WhatsApp them at 9151 1767. If you're in immediate danger, call 995."
+        ),
+    },
+}
+
+_LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i"})
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+_REPEATS = re.compile(r"(.)\1+")
+# Sentence punctuation around a word is not leetspeak ("CB!" is not "cbi")
+_PUNCTUATION = ".,!?;:'\"()[]{}<>~"
+_BENIGN = re.compile("(?<= )(?:" + "|".join(BENIGN_CONTEXTS) + ")(?= )")
+
+
+def _normalize_words(text: str) -> List[str]:
+    words = []
+    for token in text.lower().split():
+        token = token.strip(_PUNCTUATION)
+        # Digits and symbols only stand in for letters in tokens that have letters
+        if any(c.isalpha() for c in token):
+            token = token.translate(_LEET)
+        words.extend(_REPEATS.sub(r"\1", word) for word in _SEPARATORS.split(token) if word)
+    return words
+
+
+def normalize(text: str) -> List[str]:
+    """
+    Normalised spellings of `text` to match against: lowercase, leetspeak
+    decoded, stretched letters squeezed ("fuuuck"), and once more with runs of
+    single letters joined ("c b", "f.u.c.k"). Words are space-delimited with a
+    space at both ends, so lexicon entries only match whole words.
+    """
+    words = _normalize_words(text)
+    variants = [" " + " ".join(words) + " "]
+
+    joined: List[str] = []
+    run = ""
+    for word in words:
+        if len(word) == 1:
+            run += word
+            continue
+        if run:
+            joined.append(run)
+            run = ""
+        joined.append(word)
+    if run:
+        joined.append(run)
+    if joined != words:
+        variants.append(" " + " ".join(joined) + " ")
+    return variants
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher: one pass over the text finds every pattern occurring in it."""
+
+    def __init__(self, patterns: Dict[str, str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for pattern, label in patterns.items():
+            self._add(pattern, label)
+        self._build()
+
+    def _add(self, pattern: str, label: str):
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append(label)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                if node:
+                    fallback = self._fail[node]
+                    while fallback and char not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text: str) -> List[str]:
+        """Labels of all patterns found in `text`, once per occurrence."""
+        found = []
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if self._output[node]:
+                found.extend(self._output[node])
+        return found
+
+
+def _build_automaton() -> AhoCorasick:
+    patterns = {}
+    for category, terms in LEXICON.items():
+        for term in terms:
+            patterns.setdefault(normalize(term)[0], f"{category}:{term}")
+    return AhoCorasick(patterns)
+
+
+_automaton = _build_automaton()
+
+
+@dataclass
+class SafetyMatch:
+    category: str
+    terms: List[str]
+    response: Dict[str, str]
+
+
+class SafetyPrefilter:
+    """
+    Local pre-classifier run on each user message before any model call.
+
+    Messages containing a lexicon term (profanity or self-harm phrases) get a
+    templated reply in the persona's voice right away, without spending GPU
+    quota. Replies carry the category's label from LABELS, never "Safe", so
+    they are not mistaken for ordinary model output. Opt-in, since a lexicon
+    cannot tell every benign use of a term from an abusive one.
+    """
+
+    def __init__(self, persona_slug: str):
+        self.persona_slug = persona_slug
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.matched: Counter = Counter()
+        self.terms: Counter = Counter()
+
+    def check(self, message: str) -> Optional[SafetyMatch]:
+        """The templated reply for a clear-cut message, or None to go on to the model."""
+        hits: List[str] = []
+        for variant in normalize(message):
+            hits.extend(_automaton.find(_BENIGN.sub("", variant)))
+
+        with self._lock:
+            self.checked += 1
+            if not hits:
+                return None
+            categories = [hit.split(":", 1)[0] for hit in hits]
+            # Self-harm outranks profanity: the reply has to point to help
+            category = SELF_HARM if SELF_HARM in categories else PROFANITY
+            terms = sorted({hit.split(":", 1)[1] for hit in hits})
+            self.matched[category] += 1
+            self.terms.update(terms)
+
+        templates = TEMPLATES[category]
+        reply = templates.get(self.persona_slug) or templates.get("*") or templates["singlish"]
+        return SafetyMatch(category, terms, {"response": reply, "safety": LABELS[category]})
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            matched = sum(self.matched.values())
+            return {
+                "checked": self.checked,
+                "matched": dict(self.matched),
+                "match_rate": round(matched / self.checked, 4) if self.checked else 0.0,
+                "top_terms": self.terms.most_common(10),
+            }
+
+
+def create_safety_prefilter(persona_slug: str) -> Optional[SafetyPrefilter]:
+    """A pre-filter for the persona, or None if it is disabled or the persona opted out."""
+    if not settings.safety_prefilter_enabled or persona_slug in settings.safety_prefilter_excluded_personas:
+        return None
+    return SafetyPrefilter(persona_slug)
@@ -0,0 +1,203 @@
+from app.config import settings
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SentenceEncoder:
+    """
+    Small CPU sentence encoder shared by every persona's semantic cache.
+
+    sentence-transformers (and numpy) are only imported when the model first
+    loads, so they are not needed unless the semantic cache is enabled. The
+    last few embeddings are memoised, because a message that misses the cache
+    is embedded again when its reply is stored.
+    """
+
+    def __init__(self, model_name: str, memo_size: int = 512):
+        self.model_name = model_name
+        self.memo_size = memo_size
+        self._model = None
+        self._failed = False
+        self._load_lock = threading.Lock()
+        self._memo: "OrderedDict[str, Any]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def load(self) -> bool:
+        """Load the model once. Returns False if it is not available."""
+        with self._load_lock:
+            if self._model is None and not self._failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+                    logger.info(f"Semantic cache encoder {self.model_name} loaded")
+                except Exception as e:
+                    logger.error(f"Semantic cache disabled, could not load {self.model_name}: {str(e)}")
+                    self._failed = True
+            return self._model is not None
+
+    def encode(self, text: str):
+        """Unit-normalised float32 embedding of `text`, or None if the encoder is unavailable."""
+        with self._memo_lock:
+            vector = self._memo.get(text)
+            if vector is not None:
+                self._memo.move_to_end(text)
+                return vector
+        if not self.load():
+            return None
+
+        vector = self._model.encode(text, convert_to_numpy=True, normalize_embeddings=True,
+                                    show_progress_bar=False).astype("float32")
+        with self._memo_lock:
+            self._memo[text] = vector
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return vector
+
+
+class SemanticCache:
+    """
+    Bounded nearest-neighbour cache of (message, response) pairs for one persona.
+
+    Embeddings live in a preallocated matrix, so a lookup is one matrix-vector
+    product over at most `max_entries` rows; the best match is served if its
+    cosine similarity reaches `threshold` and it was answered with the same
+    conversation history. Entries expire after `ttl_seconds`, and when the
+    matrix is full the least recently used one is replaced.
+    """
+
+    def __init__(self, encode: Callable[[str], Any], max_entries: int, ttl_seconds: float, threshold: float):
+        self.encode = encode
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._expires = None
+        self._last_used = None
+        self._entries: Dict[int, Tuple[str, str, Dict[str, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _allocate(self, dim: int):
+        import numpy as np
+
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+
+    def get(self, message: str, history_key: str) -> Optional[Dict[str, str]]:
+        vector = self.encode(message)
+        if vector is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors @ vector
+            # Empty and expired slots can never match
+            similarities[self._expires <= now] = -1.0
+            while True:
+                slot = int(similarities.argmax())
+                if similarities[slot] < self.threshold:
+                    self.misses += 1
+                    return None
+                _, entry_history, response = self._entries[slot]
+                if entry_history == history_key:
+                    break
+                similarities[slot] = -1.0
+
+            self._last_used[slot] = now
+            self.hits += 1
+            return dict(response)
+
+    def set(self, message: str, history_key: str, response: Dict[str, str]):
+        vector = self.encode(message)
+        if vector is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._allocate(vector.shape[0])
+
+            slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._expires[slot] = now + self.ttl_seconds
+            self._last_used[slot] = now
+            self._entries[slot] = (message, history_key, dict(response))
+
+    def _free_slot(self, now: float) -> int:
+        if len(self._entries) < self.max_entries:
+            # Unused slots are the ones with no expiry time
+            return int(self._expires.argmin())
+
+        expired = self._expires <= now
+        if expired.any():
+            self.expirations += int(expired.sum())
+            for slot in expired.nonzero()[0]:
+                del self._entries[int(slot)]
+                self._expires[slot] = 0.0
+            return int(expired.argmax())
+
+        self.evictions += 1
+        slot = int(self._last_used.argmin())
+        del self._entries[slot]
+        return slot
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._expires is not None:
+                self._expires[:] = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_encoder: Optional[SentenceEncoder] = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder() -> SentenceEncoder:
+    """The encoder shared by all personas, created on first use."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = SentenceEncoder(settings.semantic_cache_model)
+        return _encoder
+
+
+def create_semantic_cache(persona_slug: str) -> Optional[SemanticCache]:
+    """A semantic cache for the persona, or None if it is disabled or the persona opted out."""
+    if not settings.semantic_cache_enabled or persona_slug in settings.semantic_cache_excluded_personas:
+        return None
+    return SemanticCache(
+        encode=get_encoder().encode,
+        max_entries=settings.semantic_cache_max_entries,
+        ttl_seconds=settings.semantic_cache_ttl_seconds,
+        threshold=settings.semantic_cache_threshold
+    )
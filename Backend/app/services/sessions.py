@@ -0,0 +1,137 @@
+from app.models.schemas import ChatMessage, MessageRole
+from app.config import settings
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import time
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for when no tokenizer is at hand."""
+    return len(text) // 4 + 1
+
+
+def trim_history(
+    conversation_history: List[ChatMessage],
+    message: str,
+    token_budget: int,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[ChatMessage]:
+    """
+    Keep the most recent turns that fit in the token budget alongside the new message.
+    Older turns are dropped first; the new message itself is never trimmed.
+    """
+    remaining = token_budget - count_tokens(message)
+    kept: List[ChatMessage] = []
+    for turn in reversed(conversation_history):
+        cost = count_tokens(turn.content)
+        if cost > remaining:
+            break
+        kept.append(turn)
+        remaining -= cost
+    kept.reverse()
+
+    # Never start the context on a dangling assistant reply
+    while kept and kept[0].role == MessageRole.ASSISTANT:
+        kept.pop(0)
+    return kept
+
+
+@dataclass
+class Session:
+    session_id: str
+    persona: str
+    history: List[ChatMessage] = field(default_factory=list)
+    created_at: float = field(default_factory=time.monotonic)
+    last_active: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """
+    Bounded in-memory conversation store keyed by (persona, session id).
+
+    Sessions idle for longer than `idle_ttl_seconds` are evicted, and when the
+    store is full the least recently used session goes first. Each session keeps
+    at most `max_messages` messages; prompt-sized trimming happens later against
+    the token budget.
+    """
+
+    def __init__(self, max_sessions: int, idle_ttl_seconds: float, max_messages: int):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages = max(2, max_messages)
+        self._sessions: "OrderedDict[Tuple[str, str], Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+
+    def get_or_create(self, persona: str, session_id: str,
+                      seed_history: Optional[List[ChatMessage]] = None) -> Session:
+        """
+        Fetch a live session, or start one. A new session is seeded with the
+        client's history, so clients can fall back to uploading it after eviction.
+        """
+        now = time.monotonic()
+        key = (persona, session_id)
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(key)
+            if session is None:
+                session = Session(session_id=session_id, persona=persona)
+                if seed_history:
+                    session.history = list(seed_history)[-self.max_messages:]
+                self._sessions[key] = session
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            session.last_active = now
+            self._sessions.move_to_end(key)
+            return session
+
+    def snapshot(self, session: Session) -> List[ChatMessage]:
+        with self._lock:
+            return list(session.history)
+
+    def append_turn(self, session: Session, user_message: str, assistant_message: str):
+        """Append one user/assistant exchange, dropping the oldest messages past the cap."""
+        with self._lock:
+            session.history.append(ChatMessage(role=MessageRole.USER, content=user_message))
+            session.history.append(ChatMessage(role=MessageRole.ASSISTANT, content=assistant_message))
+            if len(session.history) > self.max_messages:
+                del session.history[:len(session.history) - self.max_messages]
+            session.last_active = time.monotonic()
+
+    def delete(self, persona: str, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop((persona, session_id), None) is not None
+
+    def _evict_idle(self, now: float):
+        # Sessions are kept in last-used order, so idle ones sit at the front
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_active < self.idle_ttl_seconds:
+                break
+            del self._sessions[key]
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+# Shared session store for the chat API
+session_store = SessionStore(
+    max_sessions=settings.session_max_sessions,
+    idle_ttl_seconds=settings.session_idle_ttl_seconds,
+    max_messages=settings.session_max_messages
+)
@@ -0,0 +1,64 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single underlying call.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is still running wait on the same task and get the same
+    result (or exception). Waiters are shielded from the task, so a cancelled
+    waiter - including the one that started it - never cancels the shared call.
+
+    Callers may pass the monotonic `deadline` the call runs under. A caller
+    only joins a running call whose deadline is no earlier than its own;
+    otherwise it makes its own call, so it never gives up early because of
+    another request's budget.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Task, Optional[float]]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        entry = self._calls.get(key)
+        if entry is None or entry[0].done():
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = (task, deadline)
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        elif entry[1] is None or (deadline is not None and entry[1] >= deadline):
+            task = entry[0]
+            self.coalesced += 1
+        else:
+            # The running call would give up before this caller does
+            self.bypassed += 1
+            return await fn()
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Shared call for {key!r} failed: {task.exception()}")
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+        }
@@ -0,0 +1,201 @@
+from app.config import settings
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+
+# Requests that are not traced: scrapes, health checks and the admin endpoints
+# (a profiling run would always show up as a slow request)
+_UNTRACED_PREFIXES = ("/metrics", "/health", "/api/health", "/api/admin")
+
+# Batches record spans for every item; keep a trace's memory bounded
+_MAX_SPANS = 256
+
+
+class Trace:
+    """
+    Timed spans of one HTTP request. Spans are (name, offset, duration) in
+    seconds from the start of the request, and may be added from worker
+    threads, which inherit the request's context.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+        self.tags: Dict[str, Any] = {}
+        self.status: Optional[int] = None
+        self.duration: Optional[float] = None
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float):
+        """Record a span between two time.perf_counter() values."""
+        with self._lock:
+            if len(self.spans) >= _MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append((name, start - self.start, end - start))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.start
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds spent per span name, in order of first appearance."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for name, _, duration in self.spans:
+                totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def server_timing(self) -> str:
+        """The spans so far as a Server-Timing header value (durations in milliseconds)."""
+        metrics = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [
+                {"name": name, "offset_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+                for name, offset, duration in self.spans
+            ]
+        return {
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at.isoformat(),
+            "status": self.status,
+            "duration_ms": round(self.elapsed() * 1000, 1),
+            **self.tags,
+            "spans": spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as a span of the current request, if it is traced."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter())
+
+
+def record_span(name: str, start: float, end: float):
+    """Record a span measured elsewhere (time.perf_counter() values) on the current request."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end)
+
+
+def span_since_start(name: str):
+    """Record the time from the start of the request until now, e.g. parsing before the handler ran."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, trace.start, time.perf_counter())
+
+
+def annotate(**tags: Any):
+    """Attach fields (persona, endpoint, ...) to the current request's trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.tags.update(tags)
+
+
+class SlowRequestLog:
+    """Ring buffer of the most recent requests that took at least `threshold_seconds`."""
+
+    def __init__(self, threshold_seconds: float, max_entries: int):
+        self.threshold_seconds = threshold_seconds
+        self._entries: deque = deque(maxlen=max(1, max_entries))
+        self._lock = threading.Lock()
+        self.traced = 0
+        self.slow = 0
+
+    def record(self, trace: Trace):
+        slow = trace.elapsed() >= self.threshold_seconds
+        entry = trace.to_dict() if slow else None
+        with self._lock:
+            self.traced += 1
+            if slow:
+                self.slow += 1
+                self._entries.append(entry)
+
+    def get_recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Slow requests, newest first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit is not None else entries
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold_seconds": self.threshold_seconds,
+                "max_entries": self._entries.maxlen,
+                "entries": len(self._entries),
+                "traced": self.traced,
+                "slow": self.slow,
+            }
+
+
+slow_requests = SlowRequestLog(
+    threshold_seconds=settings.slow_request_threshold_seconds,
+    max_entries=settings.slow_request_log_size
+)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a Trace for each HTTP request. With
+    server_timing_enabled, the spans recorded before the response headers go
+    out are returned in a Server-Timing header (for a stream, that is up to
+    its first event). Requests slower than the threshold are kept in
+    `slow_requests` with all of their spans once the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled or scope["path"].startswith(_UNTRACED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                if settings.server_timing_enabled:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            trace.finish()
+            slow_requests.record(trace)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the local inference backend, with and without dynamic batching.
+
+Runs on CPU against whatever BASE_MODEL_NAME / LOCAL_ADAPTERS point at, e.g.:
+
+    BASE_MODEL_NAME=./tiny-model LOCAL_ADAPTERS='{"xmm": "./tiny-xmm"}' \\
+        python benchmarks/bench_local_batching.py --concurrency 1 4 16 --requests 64
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Allow running from the Backend directory without installing the app
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.config import settings
+from app.services.batching import BatchScheduler
+from app.services.local_model import LocalModelRuntime
+
+PROMPTS = [
+    "Hey what's up?",
+    "Where can I find good chicken rice?",
+    "It's so hot today",
+    "Want to hang out this weekend?",
+    "The MRT was packed this morning",
+    "What should I eat for lunch?",
+]
+
+
+def run(runtime: LocalModelRuntime, scheduler, concurrency: int, requests: int, adapters):
+    def one(i: int):
+        adapter = adapters[i % len(adapters)]
+        messages = [{"role": "user", "content": PROMPTS[i % len(PROMPTS)]}]
+        if scheduler is not None:
+            return scheduler.submit(adapter, messages).result()
+        return runtime.generate(adapter, messages)
+
+    tokens_before = runtime.generated_tokens
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    tokens = runtime.generated_tokens - tokens_before
+    return elapsed, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--max-batch-size", type=int, default=settings.local_batch_max_size)
+    parser.add_argument("--max-wait-ms", type=float, default=settings.local_batch_max_wait_ms)
+    args = parser.parse_args()
+
+    runtime = LocalModelRuntime(settings.base_model_name, dict(settings.local_adapters))
+    runtime.ensure_loaded()
+    adapters = list(runtime.adapters) or [None]
+
+    # Warm up so the first measured run doesn't pay for lazy initialization
+    runtime.generate(adapters[0], [{"role": "user", "content": PROMPTS[0]}])
+
+    print(f"{'mode':<10} {'conc':>5} {'req/s':>8} {'tok/s':>9} {'avg batch':>10}")
+    for concurrency in args.concurrency:
+        for mode in ("serial", "batched"):
+            scheduler = None
+            if mode == "batched":
+                scheduler = BatchScheduler(runtime, args.max_batch_size, args.max_wait_ms)
+            elapsed, tokens = run(runtime, scheduler, concurrency, args.requests, adapters)
+            avg_batch = scheduler.get_status()["average_batch_size"] if scheduler else 1.0
+            if scheduler is not None:
+                scheduler.stop()
+            print(f"{mode:<10} {concurrency:>5} {args.requests / elapsed:>8.2f} {tokens / elapsed:>9.1f} {avg_batch:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Load generator for the chat API.
+
+Drives /api/chat/{persona} (or the SSE stream endpoint) at each concurrency level
+and reports throughput, p50/p95/p99 latency, error rates and rate-limited (429)
+responses per persona. Results can be saved as a baseline and later runs
+compared against it; a regression beyond the tolerance makes the script exit
+with status 1.
+
+Typical run against the local stub Space (benchmarks/stub_space.py), with the
+per-persona rate limits off so the numbers measure the backend rather than the
+admission limiter (the script warns when 429s show up):
+
+    RATE_LIMIT_PER_SECOND=0 BULK_RATE_LIMIT_PER_SECOND=0 \
+        PERSONA_SPACE_URLS='{"*": "http://127.0.0.1:7860/"}' uvicorn app.main:app &
+    python benchmarks/load_test.py --concurrency 1 8 32 --requests 200 --save benchmarks/results/baseline.json
+    python benchmarks/load_test.py --concurrency 1 8 32 --requests 200 --compare benchmarks/results/baseline.json
+
+--in-process runs the FastAPI app inside this script instead of over HTTP.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Allow running from the Backend directory without installing the app
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+PERSONAS = ["singlish", "xmm", "ahbeng", "nsf"]
+
+PROMPTS = [
+    "Hey what's up?",
+    "Where can I find good chicken rice?",
+    "It's so hot today",
+    "Want to hang out this weekend?",
+    "The MRT was packed this morning",
+    "What should I eat for lunch?",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(s["latency"] for s in samples if s["ok"])
+    rate_limited = sum(1 for s in samples if s["status"] == 429)
+    errors = sum(1 for s in samples if not s["ok"]) - rate_limited
+    system = sum(1 for s in samples if s["ok"] and s["safety"] == "System")
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        # Turned away by admission control; counted apart from errors
+        "rate_limited": rate_limited,
+        "rate_limited_rate": round(rate_limited / len(samples), 4) if samples else 0.0,
+        # 200s carrying a quota/connection apology instead of a model reply
+        "system_replies": system,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "status_codes": {},
+    }
+    first_bytes = sorted(s["first_byte"] for s in samples if s["ok"] and s.get("first_byte") is not None)
+    if first_bytes:
+        summary["first_byte_p50"] = percentile(first_bytes, 50)
+        summary["first_byte_p95"] = percentile(first_bytes, 95)
+    for s in samples:
+        code = str(s["status"])
+        summary["status_codes"][code] = summary["status_codes"].get(code, 0) + 1
+    return summary
+
+
+async def send(client: httpx.AsyncClient, persona: str, message: str, endpoint: str,
+               history: Optional[List[Dict[str, str]]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    sample = {"persona": persona, "ok": False, "status": "error", "safety": None, "first_byte": None}
+    payload = {"message": message, "conversation_history": history or []}
+    start = time.perf_counter()
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", f"/api/chat/{persona}/stream", json=payload, headers=headers) as response:
+                sample["status"] = response.status_code
+                last_data = None
+                async for line in response.aiter_lines():
+                    if sample["first_byte"] is None:
+                        sample["first_byte"] = time.perf_counter() - start
+                    if line.startswith("data: "):
+                        last_data = line[6:]
+                if response.status_code == 200 and last_data is not None:
+                    sample["safety"] = json.loads(last_data).get("safety")
+        else:
+            response = await client.post(f"/api/chat/{persona}", json=payload, headers=headers)
+            sample["status"] = response.status_code
+            if response.status_code == 200:
+                sample["safety"] = response.json().get("safety")
+        sample["ok"] = sample["status"] == 200
+    except httpx.HTTPError as e:
+        sample["status"] = type(e).__name__
+    sample["latency"] = time.perf_counter() - start
+    return sample
+
+
+async def run_level(client: httpx.AsyncClient, args, concurrency: int) -> Dict[str, Any]:
+    counter = itertools.count()
+    samples: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if i >= args.requests:
+                return
+            persona = args.personas[i % len(args.personas)]
+            message = PROMPTS[i % len(PROMPTS)]
+            if not args.repeat_prompts:
+                # Unique prompts, so caching and request coalescing do not flatter the numbers
+                message = f"{message} ({i})"
+            samples.append(await send(client, persona, message, args.endpoint))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {"elapsed_seconds": round(elapsed, 3), "all": summarize(samples, elapsed)}
+    for persona in args.personas:
+        result[persona] = summarize([s for s in samples if s["persona"] == persona], elapsed)
+    return result
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the ways `results` is worse than `baseline` by more than `tolerance`."""
+    regressions = []
+    for level, personas in results["levels"].items():
+        for persona, current in personas.items():
+            if persona == "elapsed_seconds":
+                continue
+            before = baseline.get("levels", {}).get(level, {}).get(persona)
+            if not before:
+                continue
+            where = f"concurrency {level} / {persona}"
+            if before["throughput_rps"] and current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{where}: throughput {current['throughput_rps']} rps < baseline {before['throughput_rps']}")
+            for key in ("p50", "p95", "p99"):
+                if before.get(key) and current.get(key) and current[key] > before[key] * (1 + tolerance):
+                    regressions.append(f"{where}: {key} {current[key]:.3f}s > baseline {before[key]:.3f}s")
+            if current["error_rate"] > before["error_rate"] + 0.01:
+                regressions.append(f"{where}: error rate {current['error_rate']:.2%} > baseline {before['error_rate']:.2%}")
+            if current.get("rate_limited_rate", 0.0) > before.get("rate_limited_rate", 0.0) + 0.01:
+                regressions.append(f"{where}: rate limited {current['rate_limited_rate']:.2%} > baseline "
+                                   f"{before.get('rate_limited_rate', 0.0):.2%} (check the server's rate limits)")
+    return regressions
+
+
+def print_level(label: str, result: Dict[str, Any]):
+    print(f"\n{label} ({result['elapsed_seconds']}s)")
+    print(f"  {'persona':<10}{'reqs':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>9}{'429s':>9}{'system':>8}")
+    for persona, s in result.items():
+        if persona == "elapsed_seconds":
+            continue
+        fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+        print(f"  {persona:<10}{s['requests']:>6}{s['throughput_rps']:>9}{fmt(s['p50']):>9}{fmt(s['p95']):>9}"
+              f"{fmt(s['p99']):>9}{s['error_rate']:>9.2%}{s.get('rate_limited_rate', 0.0):>9.2%}{s['system_replies']:>8}")
+    if result["all"].get("rate_limited"):
+        print(f"  warning: {result['all']['rate_limited']} requests were rate limited (429), so these numbers "
+              f"measure the admission limits; start the server with RATE_LIMIT_PER_SECOND=0 "
+              f"BULK_RATE_LIMIT_PER_SECOND=0 to measure the backend")
+
+
+async def run(args) -> Dict[str, Any]:
+    if args.in_process:
+        from app.main import app
+        from app.services.lifecycle import supervisor
+
+        await supervisor.start()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://in-process"
+    else:
+        transport = None
+        base_url = args.base_url
+
+    results = {
+        "created": datetime.now().isoformat(),
+        "config": {
+            "endpoint": args.endpoint,
+            "requests": args.requests,
+            "personas": args.personas,
+            "repeat_prompts": args.repeat_prompts,
+            "target": "in-process" if args.in_process else args.base_url,
+        },
+        "levels": {},
+    }
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=args.timeout, limits=limits) as client:
+            for level in args.concurrency:
+                result = await run_level(client, args, level)
+                results["levels"][str(level)] = result
+                print_level(f"concurrency {level}", result)
+    finally:
+        if args.in_process:
+            await supervisor.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-process", action="store_true", help="run the app in this process instead of over HTTP")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--personas", nargs="+", default=PERSONAS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--repeat-prompts", action="store_true", help="reuse the same few prompts (exercises cache/coalescing)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--save", type=Path, help="write the results here as a baseline")
+    parser.add_argument("--compare", type=Path, help="baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2))
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.compare}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
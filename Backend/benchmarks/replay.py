@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Replay captured chat traffic against the API at its original arrival times.
+
+Reads a capture log written with CAPTURE_ENABLED=true (see app/services/capture.py)
+and re-sends every request open-loop: each one goes out at its recorded offset from
+the first request, divided by --speed, whether or not earlier ones have finished.
+Messages and history are sent as captured (personal data already masked); logs
+recorded in "shape" mode get filler text of the original lengths.
+
+    python benchmarks/replay.py captures/traffic.jsonl --speed 4 --save benchmarks/results/replay.json
+
+The report compares the replayed latencies with the ones recorded at capture time,
+and shows how far behind schedule requests were sent (lateness should stay near 0).
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from load_test import percentile, print_level, send, summarize
+
+FILLER = "wah this one ah "
+
+
+def load_capture(path: Path) -> List[Dict[str, Any]]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: entry["t"])
+
+
+def text_of(field: Dict[str, Any]) -> str:
+    if "text" in field:
+        return field["text"]
+    length = field.get("len", 0)
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+def recorded_summary(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The latencies observed when the traffic was captured, in the same shape as a replay summary."""
+    samples = [
+        {"persona": e["persona"], "ok": e["status"] == 200, "status": e["status"],
+         "safety": e.get("safety"), "latency": e["latency"]}
+        for e in entries
+    ]
+    span = entries[-1]["t"] - entries[0]["t"] if len(entries) > 1 else 0.0
+    result = {"elapsed_seconds": round(span, 3), "all": summarize(samples, span)}
+    for persona in sorted({e["persona"] for e in entries}):
+        result[persona] = summarize([s for s in samples if s["persona"] == persona], span)
+    return result
+
+
+async def replay(args, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    samples: List[Dict[str, Any]] = []
+    lateness: List[float] = []
+
+    async def fire(entry: Dict[str, Any]):
+        headers = {"X-Request-Priority": entry.get("priority") or "interactive"}
+        history = [{"role": turn["role"], "content": text_of(turn)} for turn in entry.get("history", [])]
+        endpoint = "stream" if entry["endpoint"] == "stream" else "chat"
+        samples.append(await send(client, entry["persona"], text_of(entry["message"]), endpoint, history, headers))
+
+    limits = httpx.Limits(max_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        first = entries[0]["t"]
+        tasks = []
+        start = time.perf_counter()
+        for entry in entries:
+            due = (entry["t"] - first) / args.speed
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lateness.append(max(0.0, (time.perf_counter() - start) - due))
+            tasks.append(asyncio.ensure_future(fire(entry)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    result = {"elapsed_seconds": round(elapsed, 3), "all": summarize(samples, elapsed)}
+    for persona in sorted({s["persona"] for s in samples}):
+        result[persona] = summarize([s for s in samples if s["persona"] == persona], elapsed)
+    lateness.sort()
+    result["all"]["lateness_p50"] = percentile(lateness, 50)
+    result["all"]["lateness_p99"] = percentile(lateness, 99)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path, help="capture log (.jsonl or .jsonl.gz)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale: 2 replays twice as fast as recorded")
+    parser.add_argument("--personas", nargs="+", help="only replay these personas")
+    parser.add_argument("--limit", type=int, help="only replay the first N requests")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--save", type=Path, help="write the results here")
+    args = parser.parse_args()
+
+    entries = load_capture(args.capture)
+    if args.personas:
+        entries = [e for e in entries if e["persona"] in args.personas]
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        parser.error("no requests to replay")
+
+    span = entries[-1]["t"] - entries[0]["t"]
+    print(f"Replaying {len(entries)} requests recorded over {span:.1f}s at {args.speed}x "
+          f"(~{span / args.speed:.1f}s)")
+
+    recorded = recorded_summary(entries)
+    result = asyncio.run(replay(args, entries))
+    print_level("recorded", recorded)
+    print_level(f"replayed at {args.speed}x", result)
+    print(f"\nschedule lateness: p50 {result['all']['lateness_p50']:.3f}s, p99 {result['all']['lateness_p99']:.3f}s")
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({
+            "created": datetime.now().isoformat(),
+            "capture": str(args.capture),
+            "speed": args.speed,
+            "recorded": recorded,
+            "replayed": result,
+        }, indent=2))
+        print(f"\nSaved results to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the persona HF Spaces, for load testing without spending GPU quota.
+
+Serves a Gradio app with the same `/inference` endpoint the backend calls, answering
+with the {"response", "safety"} JSON contract after a configurable delay. Failures
+the real Spaces produce can be injected at set rates: quota errors, timeouts and
+malformed output. Replies are streamed as a growing JSON string, like the Spaces do.
+
+Needs `pip install gradio` (not part of requirements.txt). Point the backend at it with
+
+    PERSONA_SPACE_URLS='{"*": "http://127.0.0.1:7860/"}' uvicorn app.main:app
+
+e.g. python benchmarks/stub_space.py --latency lognormal --latency-mean 1.5 --quota-rate 0.02
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+import gradio as gr
+
+REPLIES = [
+    "Wah, steady lah bro!",
+    "Aiyo, why you like that one?",
+    "Can lah, no problem.",
+    "Shiok sia, later we go makan.",
+    "Eh don't play play ah.",
+]
+
+
+def sample_latency(args) -> float:
+    """Draw one response time (seconds) from the configured distribution."""
+    mean = args.latency_mean
+    if args.latency == "fixed":
+        return mean
+    if args.latency == "uniform":
+        return random.uniform(0, 2 * mean)
+    if args.latency == "exponential":
+        return random.expovariate(1 / mean) if mean > 0 else 0.0
+    # lognormal with the requested mean; --latency-sigma controls the tail
+    sigma = args.latency_sigma
+    return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean > 0 else 0.0
+
+
+def make_output(message: str, args) -> str:
+    reply = f"{random.choice(REPLIES)} (re: {message[:40]})"
+    if random.random() < args.malformed_rate:
+        # The shapes of bad output seen from the real Spaces
+        return random.choice([
+            reply,
+            str({"response": reply, "safety": "Safe"}),
+            json.dumps({"response": reply, "safety": "Safe"})[:-5],
+        ])
+    return json.dumps({"response": reply, "safety": "Safe"})
+
+
+def build_app(args) -> gr.Interface:
+    def inference(message: str):
+        if random.random() < args.quota_rate:
+            wait = random.randint(30, 600)
+            raise gr.Error(
+                f"You have exceeded your GPU quota (60s requested vs. 0s left). "
+                f"Try again in {wait // 3600}:{wait % 3600 // 60:02d}:{wait % 60:02d}"
+            )
+        if random.random() < args.timeout_rate:
+            time.sleep(args.timeout_seconds)
+            raise gr.Error("Upstream request timed out")
+
+        output = make_output(message, args)
+        latency = sample_latency(args)
+        chunks = max(1, args.stream_chunks)
+        step = math.ceil(len(output) / chunks)
+        for end in range(step, len(output) + step, step):
+            time.sleep(latency / chunks)
+            yield output[:end]
+
+    return gr.Interface(
+        fn=inference,
+        inputs=gr.Textbox(label="message"),
+        outputs=gr.Textbox(label="output"),
+        api_name="inference",
+        concurrency_limit=args.concurrency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=1.0, help="mean response time in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal shape (bigger = longer tail)")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="fraction of calls failing with a GPU quota error")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction of calls that hang, then fail")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of replies not in the JSON contract")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="pieces each reply is streamed in")
+    parser.add_argument("--concurrency", type=int, default=16, help="calls the stub serves at once (a GPU Space serves 1)")
+    args = parser.parse_args()
+
+    app = build_app(args)
+    app.queue(default_concurrency_limit=args.concurrency)
+    app.launch(server_name="127.0.0.1", server_port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from app.services.capture import TrafficCapture
+import json
+import time
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_writer_survives_write_errors(tmp_path):
+    # A file where the capture directory should be makes every open fail
+    blocker = tmp_path / "captures"
+    blocker.write_text("")
+    capture = TrafficCapture(str(blocker / "traffic.jsonl"), mode="shape", max_bytes=0, sample_rate=1.0)
+
+    capture.record("chat", "xmm", "hello", [], status=200, latency=0.5)
+    wait_for(lambda: capture.dropped == 1)
+    status = capture.get_status()
+    assert status["errors"] == 1
+    assert status["last_error"].startswith("write")
+    assert capture._thread.is_alive()
+
+    blocker.unlink()
+    capture.record("chat", "xmm", "hello again", [], status=200, latency=0.5)
+    wait_for(lambda: capture.captured == 1)
+    capture.close()
+
+    lines = (blocker / "traffic.jsonl").read_text().splitlines()
+    assert [json.loads(line)["message"] for line in lines] == [{"len": 11}]
+    assert capture.get_status()["last_error"] is None
@@ -0,0 +1,28 @@
+from app.services.local_model import LocalModelRuntime
+from types import SimpleNamespace
+import pytest
+
+
+class FailingModel:
+    """Raises inside generate(), like an OOM or a bad cache crop would."""
+
+    def generate(self, **kwargs):
+        raise RuntimeError("CUDA out of memory")
+
+
+def failing_runtime() -> LocalModelRuntime:
+    runtime = LocalModelRuntime("base", {})
+    runtime.model = FailingModel()
+    runtime.tokenizer = SimpleNamespace(pad_token_id=0)
+    runtime._encode = lambda messages: {}
+    return runtime
+
+
+def test_stream_raises_generation_errors_and_releases_the_lock():
+    runtime = failing_runtime()
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        list(runtime.stream(None, [{"role": "user", "content": "hello"}]))
+
+    assert runtime._generate_lock.acquire(timeout=1)
+    runtime._generate_lock.release()
@@ -0,0 +1,24 @@
+from app.config import settings
+from app.services.replicas import create_replica_pool
+
+
+def test_unreachable_replica_joins_the_pool_once_it_answers(monkeypatch):
+    monkeypatch.setattr(settings, "reconnect_initial_delay_seconds", 0.0)
+    down = {"http://replica-b/"}
+
+    def connect(source):
+        if source in down:
+            raise ConnectionError("connection refused")
+        return object()
+
+    pool = create_replica_pool("XMM", ["http://replica-a/", "http://replica-b/"], connect)
+    assert [replica.source for replica in pool.replicas] == ["http://replica-a/"]
+    assert pool.missing == ["http://replica-b/"]
+
+    assert pool.connect_missing() == 0
+    assert pool.missing == ["http://replica-b/"]
+
+    down.clear()
+    assert pool.connect_missing() == 1
+    assert [replica.source for replica in pool.replicas] == ["http://replica-a/", "http://replica-b/"]
+    assert pool.get_status()["missing"] == []
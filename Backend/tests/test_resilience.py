@@ -0,0 +1,71 @@
+from app.services.model import SinglishModelService
+from app.services.resilience import CONNECTION
+import json
+
+
+class FakeJob:
+    """Streams a few growing JSON outputs, like a Space does."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._done = False
+
+    def __iter__(self):
+        for end in range(10, 40, 10):
+            yield json.dumps({"response": "Wah steady lah bro, can can", "safety": "Safe"})[:end]
+        self._done = True
+
+    def result(self):
+        return json.dumps({"response": "Wah steady lah bro, can can", "safety": "Safe"})
+
+    def done(self):
+        return self._done
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, *args, api_name=None):
+        self.jobs.append(FakeJob())
+        return self.jobs[-1]
+
+
+def half_open_service() -> SinglishModelService:
+    service = SinglishModelService()
+    service.client = FakeClient()
+    service.model_loaded = True
+    breaker = service.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(CONNECTION)
+    # Let the recovery period pass
+    breaker.open_until = 0.0
+    return service
+
+
+def test_abandoned_probing_stream_releases_probe():
+    service = half_open_service()
+    stream = service._stream_with_model("hello")
+    assert next(stream)["type"] == "token"
+    assert service.breaker.state == service.breaker.HALF_OPEN
+
+    # Client disconnects after the first token
+    stream.close()
+
+    assert service.client.jobs[0].cancelled
+    assert service.breaker.state == service.breaker.HALF_OPEN
+    # The next request gets to probe instead of being rejected forever
+    assert service.breaker.allow_request()
+    service.shutdown()
+
+
+def test_finished_probing_stream_closes_circuit():
+    service = half_open_service()
+    events = list(service._stream_with_model("hello"))
+    assert events[-1]["type"] == "final"
+    assert events[-1]["response"] == "Wah steady lah bro, can can"
+    assert service.breaker.state == service.breaker.CLOSED
+    service.shutdown()
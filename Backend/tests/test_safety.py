@@ -0,0 +1,32 @@
+from app.services.safety import PROFANITY, SELF_HARM, SafetyPrefilter
+import pytest
+
+
+@pytest.mark.parametrize("message", [
+    "5 kms run today",
+    "3 kms run for IPPT",
+    "During CB I stay home",
+    "What is the suicide rate in Singapore?",
+    "I watched Suicide Squad",
+    "he is a bastard son in the story",
+])
+def test_benign_messages_go_to_the_model(message):
+    assert SafetyPrefilter("singlish").check(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "i really wanna kms",
+    "sometimes i feel suicidal",
+    "I want to end my life",
+])
+def test_self_harm_gets_helpline_reply(message):
+    match = SafetyPrefilter("singlish").check(message)
+    assert match.category == SELF_HARM
+    assert match.response["safety"] == "SelfHarm"
+    assert "1767" in match.response["response"]
+
+
+def test_profanity_reply_is_not_labelled_safe():
+    match = SafetyPrefilter("xmm").check("knn why u so slow")
+    assert match.category == PROFANITY
+    assert match.response["safety"] == "Unsafe"
@@ -23,6 +23,10 @@ const api = axios.create({
 api.interceptors.request.use(
   (config) => {
     console.log('API Request:', config.method?.toUpperCase(), config.url, config.data)
+    // Tell the backend how long we will wait, so it can drop requests we have given up on
+    if (config.timeout) {
+      config.headers['X-Request-Timeout'] = String(config.timeout / 1000)
+    }
     return config
   },
   (error) => {
@@ -0,0 +1,288 @@
+"""
+Batched generation and perplexity for the persona evaluation (persona_evals.ipynb).
+
+The notebook generates one prompt at a time and runs one forward pass per text
+for perplexity. Here both run in padded batches of similar-length inputs
+(sorted by token count, so little compute goes to padding):
+
+- generate_responses: left-padded batched sampling with the notebook's decoding
+  settings. With a checkpoint file, every finished batch is appended to disk
+  and a rerun skips prompts that already have a response (failed batches are
+  not recorded, so a rerun retries them).
+- calculate_perplexity: right-padded batched forward passes; padded positions
+  are masked out of the loss, so the result matches the per-text version.
+- evaluate_model: the notebook's metric suite on top of these, with
+  coherence/diversity/distinct-n from persona_metrics.
+
+Needs torch and transformers (peft for adapters); ROUGE and BERTScore need `evaluate`.
+
+    python persona_harness.py --base yuhueng/qwen3-4b-singlish-base \\
+        --adapter Birthright00/singlish_adapter_4B-NSF-on-Singlish_no_system_prompt \\
+        --prompts prompts.json --checkpoint runs/nsf.jsonl --batch-size 16
+"""
+import argparse
+import hashlib
+import json
+import math
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+
+from persona_metrics import EmbeddingCache, calculate_coherence, calculate_distinct_n, calculate_diversity
+
+
+def _length_buckets(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """Indices grouped into batches of similar length, longest first (surfaces OOM early)."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _pad_token_id(tokenizer) -> int:
+    if tokenizer.pad_token_id is not None:
+        return tokenizer.pad_token_id
+    return tokenizer.eos_token_id
+
+
+class GenerationCheckpoint:
+    """
+    Append-only JSONL record of finished generations.
+
+    Each line holds the prompt's key (a hash of the prompt, system prompt and
+    decoding settings) and its response, so a resumed run only regenerates
+    prompts whose key is missing. Use one file per model/adapter.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.done: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of an interrupted write
+                        continue
+                    self.done[record["key"]] = record["response"]
+
+    @staticmethod
+    def key(prompt: str, settings: Dict[str, Any]) -> str:
+        payload = json.dumps({"prompt": prompt, **settings}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def add(self, records: List[Dict[str, str]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.done[record["key"]] = record["response"]
+
+
+def generate_responses(model, tokenizer, prompts: Sequence[str], system_prompt: Optional[str] = None,
+                       max_new_tokens: int = 128, temperature: float = 1, top_p: float = 0.95,
+                       batch_size: int = 16, checkpoint: Optional[str] = None) -> List[str]:
+    """
+    Generate a response for every prompt, in length-bucketed batches.
+    Failed batches yield empty responses, as the notebook's per-prompt loop did,
+    and are left out of the checkpoint so a resumed run retries them.
+    """
+    settings = {"system_prompt": system_prompt, "max_new_tokens": max_new_tokens,
+                "temperature": temperature, "top_p": top_p}
+    store = GenerationCheckpoint(checkpoint) if checkpoint else None
+    keys = [GenerationCheckpoint.key(prompt, settings) for prompt in prompts]
+
+    responses: List[Optional[str]] = [None] * len(prompts)
+    if store is not None:
+        for i, key in enumerate(keys):
+            responses[i] = store.done.get(key)
+
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if len(pending) < len(prompts):
+        print(f"  Resuming: {len(prompts) - len(pending)}/{len(prompts)} responses already in {checkpoint}")
+
+    texts = {}
+    for i in pending:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompts[i]})
+        texts[i] = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    lengths = [len(tokenizer(texts[i], add_special_tokens=False)["input_ids"]) for i in pending]
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    model.eval()
+    completed = len(prompts) - len(pending)
+    try:
+        for bucket in _length_buckets(lengths, batch_size):
+            batch = [pending[j] for j in bucket]
+            failed = False
+            try:
+                # The chat template already contains the special tokens
+                inputs = tokenizer([texts[i] for i in batch], padding=True, add_special_tokens=False,
+                                   return_tensors="pt").to(model.device)
+                with torch.no_grad():
+                    outputs = model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=True,
+                        temperature=temperature,
+                        top_p=top_p,
+                        pad_token_id=_pad_token_id(tokenizer),
+                    )
+                decoded = tokenizer.batch_decode(outputs[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+                batch_responses = [text.strip() for text in decoded]
+            except Exception as e:
+                print(f"  Error on prompts {batch}: {e}")
+                batch_responses = [""] * len(batch)
+                failed = True
+
+            for i, response in zip(batch, batch_responses):
+                responses[i] = response
+            if store is not None and not failed:
+                store.add([{"key": keys[i], "index": i, "prompt": prompts[i], "response": responses[i]} for i in batch])
+            completed += len(batch)
+            print(f"  {completed}/{len(prompts)} completed")
+    finally:
+        tokenizer.padding_side = padding_side
+
+    return responses
+
+
+def calculate_perplexity(model, tokenizer, generated_texts: Sequence[str], batch_size: int = 16) -> float:
+    """
+    Corpus perplexity exp(total NLL / total predicted tokens), like
+    calculate_perplexity_manual, but with one masked forward pass per batch.
+    """
+    encoded = []
+    for text in generated_texts:
+        if not text or len(text.strip()) == 0:
+            continue
+        ids = tokenizer.encode(text)
+        if len(ids) <= 1:
+            continue
+        encoded.append(ids)
+
+    model.eval()
+    pad_id = _pad_token_id(tokenizer)
+    total_nll = 0.0
+    total_tokens = 0
+    for bucket in _length_buckets([len(ids) for ids in encoded], batch_size):
+        batch = [encoded[i] for i in bucket]
+        width = max(len(ids) for ids in batch)
+        input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, ids in enumerate(batch):
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            attention_mask[row, :len(ids)] = 1
+        input_ids = input_ids.to(model.device)
+        attention_mask = attention_mask.to(model.device)
+
+        try:
+            with torch.no_grad():
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+            shift_logits = logits[:, :-1, :].float()
+            shift_labels = input_ids[:, 1:].masked_fill(attention_mask[:, 1:] == 0, -100)
+            loss = F.cross_entropy(
+                shift_logits.reshape(-1, shift_logits.size(-1)),
+                shift_labels.reshape(-1),
+                ignore_index=-100,
+                reduction="sum"
+            )
+        except Exception as e:
+            print(f"  Skipping perplexity batch: {e}")
+            continue
+        total_nll += loss.item()
+        total_tokens += int((shift_labels != -100).sum())
+
+    if total_tokens == 0:
+        return float("inf")
+    return math.exp(total_nll / total_tokens)
+
+
+def evaluate_model(model, tokenizer, prompts: Sequence[str], reference: Optional[Sequence[str]] = None,
+                   batch_size: int = 16, checkpoint: Optional[str] = None,
+                   cache: Optional[EmbeddingCache] = None) -> Dict[str, Any]:
+    """Generate responses for all prompts and run the notebook's metrics on them."""
+    print(f"\nGenerating {len(prompts)} responses...")
+    start = time.perf_counter()
+    generated_responses = generate_responses(model, tokenizer, prompts, max_new_tokens=128,
+                                             batch_size=batch_size, checkpoint=checkpoint)
+    print(f"  Generation took {time.perf_counter() - start:.1f}s")
+
+    print("\nCalculating metrics...")
+    results: Dict[str, Any] = {}
+    results["perplexity"] = calculate_perplexity(model, tokenizer, generated_responses, batch_size=batch_size)
+    results["coherence"] = calculate_coherence(prompts, generated_responses, cache)
+    results["diversity"] = calculate_diversity(generated_responses, cache)
+    results["distinct_n_score"] = calculate_distinct_n(generated_responses, n=3)
+
+    if reference:
+        import evaluate
+        references = [[ref] for ref in reference]
+        results["rouge"] = evaluate.load("rouge").compute(
+            predictions=generated_responses, references=references, use_stemmer=True
+        )
+        bertscore = evaluate.load("bertscore").compute(
+            predictions=generated_responses, references=references, model_type="distilbert-base-uncased"
+        )
+        results["bertscore"] = {key: float(sum(bertscore[key]) / len(bertscore[key])) for key in ("precision", "recall", "f1")}
+
+    results["generated_responses"] = generated_responses
+    results["prompts"] = list(prompts)
+    return results
+
+
+def load_model(base: str, adapter: Optional[str] = None, load_in_4bit: bool = False):
+    """Load the base model (optionally 4-bit) with an optional LoRA adapter on top."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    kwargs: Dict[str, Any] = {"device_map": "auto" if torch.cuda.is_available() else None}
+    if load_in_4bit:
+        from transformers import BitsAndBytesConfig
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_4bit=True)
+    elif torch.cuda.is_available():
+        kwargs["torch_dtype"] = torch.float16
+
+    tokenizer = AutoTokenizer.from_pretrained(base)
+    model = AutoModelForCausalLM.from_pretrained(base, **kwargs)
+    if adapter:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, adapter)
+    return model, tokenizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched persona evaluation with resumable generation.")
+    parser.add_argument("--base", required=True, help="base model name or path")
+    parser.add_argument("--adapter", help="LoRA adapter name or path")
+    parser.add_argument("--prompts", type=Path, required=True,
+                        help='JSON list of prompts, or {"prompts": [...], "references": [...]}')
+    parser.add_argument("--checkpoint", help="JSONL file for finished generations (resumes from it)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--load-in-4bit", action="store_true")
+    parser.add_argument("--embedding-cache", help="persona_metrics embedding cache (.npz)")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    data = json.loads(args.prompts.read_text(encoding="utf-8"))
+    prompts = data["prompts"] if isinstance(data, dict) else data
+    references = data.get("references") if isinstance(data, dict) else None
+
+    model, tokenizer = load_model(args.base, args.adapter, args.load_in_4bit)
+    cache = EmbeddingCache(path=args.embedding_cache)
+    results = evaluate_model(model, tokenizer, prompts, references, args.batch_size, args.checkpoint, cache)
+    cache.save()
+
+    for key in ("perplexity", "coherence", "diversity", "distinct_n_score"):
+        print(f"{key:<20} {results[key]:.3f}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
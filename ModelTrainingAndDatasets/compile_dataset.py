@@ -0,0 +1,368 @@
+"""
+Compile chat datasets into packed, pre-tokenized, memory-mapped training shards.
+
+The training notebooks run apply_chat_template row by row through dataset.map at
+every session start, then pad each short chat out to max_seq_length=2048, so most
+of every batch is padding. This script does the formatting once:
+
+1. streams the sources (the Instruction/Output CSVs and the persona
+   {"conversation_id", "messages"} JSON/JSONL files), optionally adding a system
+   prompt, and renders each conversation with the tokenizer's chat template;
+2. tokenizes in batches and builds the response-only loss mask that
+   train_on_responses_only produces (assistant turns are trained on, everything
+   from a user turn up to the next assistant header is masked);
+3. packs whole conversations into max_seq_length sequences (best-fit decreasing),
+   with position_ids restarting at 0 for each conversation;
+4. writes .npy shards plus a manifest.json. PackedDataset memory-maps them, so
+   training starts instantly and rebuilding is skipped while the sources,
+   tokenizer and settings are unchanged.
+
+    python compile_dataset.py Personas/Datasets/xmm_data.json --tokenizer yuhueng/qwen3-4b-singlish-base \\
+        --system-prompt-file xmm_system_prompt.txt --output compiled/xmm
+
+In the notebook, replace the formatting/map/train_on_responses_only steps with:
+
+    from compile_dataset import PackedDataset, collate_packed
+    train_dataset = PackedDataset("compiled/xmm")
+    trainer = Trainer(model=model, train_dataset=train_dataset, data_collator=collate_packed, args=...)
+
+collate_packed works like DataCollatorWithFlattening: it concatenates the
+sequences of a batch into a single (1, total_length) row without padding or
+attention_mask. transformers only treats a row as packed when the batch size is
+1, so with attn_implementation="flash_attention_2" the model then reads the
+conversation boundaries from the restarting position_ids and runs varlen
+attention, keeping the conversations separate. Other attention implementations
+let them attend to each other, the same trade-off as SFTConfig(packing=True).
+"""
+import argparse
+import bisect
+import csv
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INSTRUCTION_PART = "<|im_start|>user\n"
+RESPONSE_PART = "<|im_start|>assistant\n"
+IGNORE_INDEX = -100
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+# ============================================================================
+# SOURCES
+# ============================================================================
+
+def read_conversations(path: Path) -> Iterator[List[Dict[str, str]]]:
+    """Yield the messages of each conversation in a .csv, .json or .jsonl source."""
+    if path.suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("Instruction") and row.get("Output"):
+                    yield [
+                        {"role": "user", "content": row["Instruction"]},
+                        {"role": "assistant", "content": row["Output"]},
+                    ]
+        return
+
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            records = (json.loads(line) for line in f if line.strip())
+            for record in records:
+                yield record.get("messages") or record["conversations"]
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for record in json.load(f):
+            yield record.get("messages") or record["conversations"]
+
+
+def render(tokenizer, sources: Sequence[Path], system_prompt: Optional[str] = None) -> Iterator[str]:
+    for path in sources:
+        for messages in read_conversations(path):
+            if system_prompt:
+                messages = [{"role": "system", "content": system_prompt}] + list(messages)
+            yield tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+
+
+# ============================================================================
+# TOKENIZATION AND RESPONSE-ONLY MASKS
+# ============================================================================
+
+def response_spans(text: str, instruction_part: str = INSTRUCTION_PART,
+                   response_part: str = RESPONSE_PART) -> List[Tuple[int, int]]:
+    """Character spans trained on: after each assistant header up to the next user header."""
+    spans = []
+    start = text.find(response_part)
+    while start != -1:
+        start += len(response_part)
+        end = text.find(instruction_part, start)
+        if end == -1:
+            end = len(text)
+        spans.append((start, end))
+        start = text.find(response_part, end)
+    return spans
+
+
+def tokenize_batch(tokenizer, texts: List[str], instruction_part: str,
+                   response_part: str) -> List[Tuple[List[int], np.ndarray]]:
+    """Token ids and a 0/1 loss mask for each rendered conversation."""
+    # The chat template already contains the special tokens
+    encoded = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+    results = []
+    for text, ids, offsets in zip(texts, encoded["input_ids"], encoded["offset_mapping"]):
+        starts = np.array([start for start, _ in offsets], dtype=np.int64)
+        mask = np.zeros(len(ids), dtype=np.uint8)
+        for span_start, span_end in response_spans(text, instruction_part, response_part):
+            mask[(starts >= span_start) & (starts < span_end)] = 1
+        results.append((ids, mask))
+    return results
+
+
+# ============================================================================
+# PACKING
+# ============================================================================
+
+def pack(lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    """
+    Best-fit decreasing: place each conversation, longest first, into the fullest
+    sequence that still has room for it. Returns conversation indices per sequence.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    bins: List[List[int]] = []
+    # Sorted (remaining space, bin index) pairs of bins that can still take something
+    free: List[Tuple[int, int]] = []
+    for i in order:
+        slot = bisect.bisect_left(free, (lengths[i], -1))
+        if slot < len(free):
+            remaining, b = free.pop(slot)
+        else:
+            remaining, b = max_length, len(bins)
+            bins.append([])
+        bins[b].append(i)
+        remaining -= lengths[i]
+        if remaining > 0:
+            bisect.insort(free, (remaining, b))
+    return bins
+
+
+# ============================================================================
+# SHARDS
+# ============================================================================
+
+def fingerprint(tokenizer, sources: Sequence[Path], **settings) -> str:
+    """Hash of everything the compiled output depends on."""
+    digest = hashlib.sha256()
+    for path in sources:
+        digest.update(str(path).encode("utf-8"))
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    digest.update(tokenizer.name_or_path.encode("utf-8"))
+    digest.update(str(tokenizer.chat_template).encode("utf-8"))
+    digest.update(json.dumps({"version": FORMAT_VERSION, **settings}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_shards(output: Path, examples: List[Tuple[List[int], np.ndarray]], bins: List[List[int]],
+                 max_length: int, pad_token_id: int, shard_size: int) -> List[Dict[str, Any]]:
+    shards = []
+    for shard_index, first in enumerate(range(0, len(bins), shard_size)):
+        shard_bins = bins[first:first + shard_size]
+        name = f"shard_{shard_index:05d}"
+        shape = (len(shard_bins), max_length)
+        input_ids = np.lib.format.open_memmap(output / f"{name}.input_ids.npy", mode="w+", dtype=np.uint32, shape=shape)
+        loss_mask = np.lib.format.open_memmap(output / f"{name}.loss_mask.npy", mode="w+", dtype=np.uint8, shape=shape)
+        position_ids = np.lib.format.open_memmap(output / f"{name}.position_ids.npy", mode="w+", dtype=np.uint16, shape=shape)
+        input_ids[:] = pad_token_id
+        loss_mask[:] = 0
+        position_ids[:] = 0
+        lengths = np.zeros(len(shard_bins), dtype=np.int64)
+
+        for row, members in enumerate(shard_bins):
+            offset = 0
+            for i in members:
+                ids, mask = examples[i]
+                end = offset + len(ids)
+                input_ids[row, offset:end] = ids
+                loss_mask[row, offset:end] = mask
+                position_ids[row, offset:end] = np.arange(len(ids))
+                offset = end
+            lengths[row] = offset
+        np.save(output / f"{name}.lengths.npy", lengths)
+
+        for array in (input_ids, loss_mask, position_ids):
+            array.flush()
+        shards.append({"name": name, "sequences": len(shard_bins)})
+    return shards
+
+
+def compile_dataset(tokenizer, sources: Sequence[Path], output: Path, max_length: int = 2048,
+                    system_prompt: Optional[str] = None, instruction_part: str = INSTRUCTION_PART,
+                    response_part: str = RESPONSE_PART, shard_size: int = 4096, batch_size: int = 256,
+                    force: bool = False) -> Dict[str, Any]:
+    """Build (or reuse) the packed shards for `sources` in `output`; returns the manifest."""
+    sources = [Path(path) for path in sources]
+    output = Path(output)
+    key = fingerprint(tokenizer, sources, max_length=max_length, system_prompt=system_prompt,
+                      instruction_part=instruction_part, response_part=response_part)
+    manifest_path = output / MANIFEST
+    if not force and manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("fingerprint") == key:
+            print(f"{output} is up to date ({manifest['sequences']} sequences)")
+            return manifest
+
+    start = time.perf_counter()
+    examples: List[Tuple[List[int], np.ndarray]] = []
+    batch: List[str] = []
+    truncated = 0
+    for text in render(tokenizer, sources, system_prompt):
+        batch.append(text)
+        if len(batch) == batch_size:
+            examples.extend(tokenize_batch(tokenizer, batch, instruction_part, response_part))
+            batch = []
+    if batch:
+        examples.extend(tokenize_batch(tokenizer, batch, instruction_part, response_part))
+    if not examples:
+        raise ValueError(f"No conversations found in {', '.join(map(str, sources))}")
+
+    for i, (ids, mask) in enumerate(examples):
+        if len(ids) > max_length:
+            examples[i] = (ids[:max_length], mask[:max_length])
+            truncated += 1
+
+    lengths = [len(ids) for ids, _ in examples]
+    bins = pack(lengths, max_length)
+
+    output.mkdir(parents=True, exist_ok=True)
+    for stale in output.glob("shard_*.npy"):
+        stale.unlink()
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    shards = write_shards(output, examples, bins, max_length, pad_token_id, shard_size)
+
+    tokens = sum(lengths)
+    manifest = {
+        "version": FORMAT_VERSION,
+        "fingerprint": key,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tokenizer": tokenizer.name_or_path,
+        "sources": [str(path) for path in sources],
+        "system_prompt": system_prompt,
+        "max_length": max_length,
+        "pad_token_id": pad_token_id,
+        "conversations": len(examples),
+        "truncated": truncated,
+        "sequences": len(bins),
+        "tokens": tokens,
+        "trained_tokens": int(sum(int(mask.sum()) for _, mask in examples)),
+        # Share of real tokens per batch, packed vs. one padded conversation per row
+        "packed_fill": round(tokens / (len(bins) * max_length), 4),
+        "padded_fill": round(tokens / (len(examples) * max_length), 4),
+        "shards": shards,
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False))
+    print(f"Packed {len(examples)} conversations ({tokens} tokens, {truncated} truncated) into "
+          f"{len(bins)} sequences of {max_length} in {time.perf_counter() - start:.1f}s: "
+          f"{manifest['packed_fill']:.1%} real tokens vs {manifest['padded_fill']:.1%} unpacked")
+    return manifest
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+class PackedDataset:
+    """
+    Memory-mapped view of compiled shards, usable as a torch Dataset.
+
+    Each item has input_ids, labels (IGNORE_INDEX outside assistant turns) and
+    position_ids as torch tensors, cut to the packed length (no padding). Items
+    differ in length, so batch them with collate_packed.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / MANIFEST).read_text())
+        self._shards = []
+        self._offsets = []
+        total = 0
+        for shard in self.manifest["shards"]:
+            name = shard["name"]
+            self._shards.append(tuple(
+                np.load(self.path / f"{name}.{field}.npy", mmap_mode="r")
+                for field in ("input_ids", "loss_mask", "position_ids", "lengths")
+            ))
+            self._offsets.append(total)
+            total += shard["sequences"]
+        self._length = total
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        import torch
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        shard = bisect.bisect_right(self._offsets, index) - 1
+        row = index - self._offsets[shard]
+        input_ids, loss_mask, position_ids, lengths = self._shards[shard]
+
+        length = int(lengths[row])
+        ids = torch.from_numpy(input_ids[row, :length].astype(np.int64))
+        labels = ids.masked_fill(torch.from_numpy(loss_mask[row, :length] == 0), IGNORE_INDEX)
+        return {
+            "input_ids": ids,
+            "labels": labels,
+            "position_ids": torch.from_numpy(position_ids[row, :length].astype(np.int64)),
+        }
+
+
+def collate_packed(features: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Flatten a batch of PackedDataset items into one (1, total_length) row, as
+    DataCollatorWithFlattening does. No attention_mask is returned, since an
+    all-ones mask would make flash_attention_2 skip the position_ids varlen path.
+    """
+    import torch
+
+    labels = []
+    for feature in features:
+        # The last token of one sequence must not be trained to predict the first of the next
+        item_labels = feature["labels"].clone()
+        item_labels[0] = IGNORE_INDEX
+        labels.append(item_labels)
+    return {
+        "input_ids": torch.cat([feature["input_ids"] for feature in features]).unsqueeze(0),
+        "labels": torch.cat(labels).unsqueeze(0),
+        "position_ids": torch.cat([feature["position_ids"] for feature in features]).unsqueeze(0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile chat datasets into packed memory-mapped shards.")
+    parser.add_argument("sources", type=Path, nargs="+", help=".csv (Instruction/Output), .json or .jsonl files")
+    parser.add_argument("--tokenizer", required=True, help="tokenizer name or path (chat template included)")
+    parser.add_argument("--output", type=Path, required=True, help="directory for the shards and manifest")
+    parser.add_argument("--max-length", type=int, default=2048)
+    parser.add_argument("--system-prompt-file", type=Path, help="prepend this system prompt to every conversation")
+    parser.add_argument("--instruction-part", default=INSTRUCTION_PART)
+    parser.add_argument("--response-part", default=RESPONSE_PART)
+    parser.add_argument("--shard-size", type=int, default=4096, help="sequences per shard")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the output is up to date")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    system_prompt = args.system_prompt_file.read_text(encoding="utf-8").strip() if args.system_prompt_file else None
+    compile_dataset(tokenizer, args.sources, args.output, args.max_length, system_prompt,
+                    args.instruction_part, args.response_part, args.shard_size, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
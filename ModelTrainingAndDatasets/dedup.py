@@ -0,0 +1,318 @@
+"""
+Near-duplicate detection for the Singlish and persona corpora with MinHash/LSH.
+
+Replies that only differ in emoji, punctuation, letter stretching ("wahhh") or
+particles ("lah"/"lor"/"leh") count as duplicates. Texts are normalised, cut into
+character 5-gram shingles and summarised by a MinHash signature; LSH bands over
+the signatures find candidate matches, which are confirmed by their estimated
+Jaccard similarity. The stage is a single streaming pass:
+
+- each turn is compared only against the cluster representatives that share one
+  of its LSH buckets, so time grows linearly with the corpus and memory with the
+  number of distinct turns;
+- eval references (e.g. reference_answers_xmm) are indexed first, and training
+  turns that match one are reported as train/eval overlap;
+- the report lists the duplicate clusters and overlaps, and --output writes the
+  deduplicated conversations as JSONL (which compile_dataset.py reads):
+  conversations with a turn that matches an eval reference are dropped, and
+  duplicate turns are cut out of the rest together with the exchange they
+  belong to (the prompt of a reply, the reply to a prompt).
+
+    python dedup.py "SinglishBase_Iteration 2-4/singlish_pairs_1500.csv" Personas/Datasets/*.json \\
+        --eval xmm_references.json --report dedup_report.json --output deduped.jsonl
+"""
+import argparse
+import collections
+import json
+import re
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from compile_dataset import read_conversations
+
+PARTICLES = {"lah", "la", "lor", "leh", "meh", "sia", "hor", "mah", "ah", "eh", "liao", "one", "nia", "bah"}
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+_STRETCHED = re.compile(r"(.)\1{2,}")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop emoji/punctuation/particles and squeeze stretched letters."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _NON_WORD.sub(" ", text)
+    text = _STRETCHED.sub(r"\1", text)
+    return " ".join(word for word in text.split() if word not in PARTICLES)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the character n-grams of a normalised text."""
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def collision_probability(similarity: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """Chance that two texts with this Jaccard similarity share at least one LSH band."""
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def choose_bands(num_perm: int, threshold: float, false_negative_weight: float = 0.9) -> Tuple[int, int]:
+    """
+    The (bands, rows) split with the lowest weighted share of missed pairs above
+    `threshold` and of candidate pairs below it. Misses weigh more, since
+    candidates are checked against the threshold anyway and only cost time;
+    this puts the LSH threshold (1/bands)^(1/rows) below `threshold`
+    (16 bands x 8 rows, about 0.71, for 128 permutations at 0.8).
+    """
+    below = np.linspace(0, threshold, 201)
+    above = np.linspace(threshold, 1, 201)
+
+    def cost(option: Tuple[int, int]) -> float:
+        false_positives = collision_probability(below, *option).mean() * threshold
+        false_negatives = (1 - collision_probability(above, *option)).mean() * (1 - threshold)
+        return (1 - false_negative_weight) * false_positives + false_negative_weight * false_negatives
+
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(options, key=cost)
+
+
+class MinHashIndex:
+    """
+    LSH index over MinHash signatures of the texts added to it.
+
+    `query` returns the best match above `threshold` among indexed texts that
+    share a band with the query; `add` indexes a text as a new representative.
+    Only representatives are stored.
+    """
+
+    def __init__(self, num_perm: int = 128, threshold: float = 0.8, seed: int = 1):
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [collections.defaultdict(list) for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(normalize(text))
+        if hashes.size == 0:
+            hashes = np.zeros(1, dtype=np.uint64)
+        # Universal hashing per permutation; uint64 wrap-around is part of the scheme
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        """(representative id, estimated Jaccard similarity) of the closest match, or None."""
+        seen = set()
+        best = None
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+        return best
+
+    def add(self, signature: np.ndarray) -> int:
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].append(index)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+# ============================================================================
+# SOURCES
+# ============================================================================
+
+def iter_turns(sources: Sequence[Path], roles: Sequence[str]) -> Iterator[Tuple[str, List[Dict[str, str]], List[int]]]:
+    """Yield (conversation id, messages, indices of the turns to check) for every conversation."""
+    for path in sources:
+        for i, messages in enumerate(read_conversations(path)):
+            turns = [j for j, message in enumerate(messages) if message["role"] in roles and message["content"].strip()]
+            yield f"{path.stem}_{i:05d}", messages, turns
+
+
+def load_references(path: Path) -> List[str]:
+    """Eval texts from a .txt (one per line), a JSON list of strings or {"references": [...]}, or a conversation file."""
+    if path.suffix == ".txt":
+        return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if path.suffix == ".json":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(data, dict):
+            data = data.get("references", [])
+        if all(isinstance(item, str) for item in data):
+            return data
+    return [message["content"] for messages in read_conversations(path)
+            for message in messages if message["role"] == "assistant"]
+
+
+# ============================================================================
+# DEDUPLICATION
+# ============================================================================
+
+def without_turns(messages: List[Dict[str, str]], turns: Sequence[int]) -> List[Dict[str, str]]:
+    """
+    `messages` minus the given turns and the exchange each belongs to: the
+    messages leading up to an assistant turn (its prompt) or following any
+    other turn (its replies), up to the next turn of the same role or a system message.
+    """
+    dropped = set()
+    for j in turns:
+        dropped.add(j)
+        role = messages[j]["role"]
+        step = -1 if role == "assistant" else 1
+        k = j + step
+        while 0 <= k < len(messages) and messages[k]["role"] not in (role, "system"):
+            dropped.add(k)
+            k += step
+    return [message for k, message in enumerate(messages) if k not in dropped]
+
+
+def deduplicate(sources: Sequence[Path], eval_sources: Sequence[Path] = (), roles: Sequence[str] = ("assistant",),
+                num_perm: int = 128, threshold: float = 0.8, output: Optional[Path] = None) -> Dict[str, Any]:
+    """One pass over `sources`; returns the report (stats, clusters, eval overlap)."""
+    start = time.perf_counter()
+    eval_index = MinHashIndex(num_perm, threshold)
+    eval_texts: List[Tuple[str, str]] = []
+    for path in eval_sources:
+        for text in load_references(path):
+            eval_index.add(eval_index.signature(text))
+            eval_texts.append((path.name, text))
+
+    index = MinHashIndex(num_perm, threshold)
+    representatives: List[Dict[str, Any]] = []
+    duplicates: Dict[int, List[Dict[str, Any]]] = collections.defaultdict(list)
+    overlaps: List[Dict[str, Any]] = []
+    turns = conversations = kept = leaking = 0
+
+    writer = open(output, "w", encoding="utf-8") if output else None
+    try:
+        for conversation_id, messages, checked in iter_turns(sources, roles):
+            conversations += 1
+            turns += len(checked)
+            signatures = {j: index.signature(messages[j]["content"]) for j in checked}
+
+            # A conversation that leaks an eval reference is dropped whole, and
+            # none of its turns become representatives
+            leaked = False
+            if len(eval_index):
+                for j in checked:
+                    leak = eval_index.query(signatures[j])
+                    if leak is not None:
+                        source, reference = eval_texts[leak[0]]
+                        overlaps.append({"conversation": conversation_id, "turn": j, "text": messages[j]["content"],
+                                         "eval_source": source, "eval_text": reference,
+                                         "similarity": round(leak[1], 3)})
+                        leaked = True
+            if leaked:
+                leaking += 1
+                continue
+
+            repeated = []
+            for j in checked:
+                location = {"conversation": conversation_id, "turn": j, "text": messages[j]["content"]}
+                match = index.query(signatures[j])
+                if match is not None:
+                    duplicates[match[0]].append({**location, "similarity": round(match[1], 3)})
+                    repeated.append(j)
+                    continue
+                index.add(signatures[j])
+                representatives.append(location)
+
+            if len(repeated) < len(checked) or not checked:
+                kept += 1
+                if writer is not None:
+                    writer.write(json.dumps({"conversation_id": conversation_id,
+                                             "messages": without_turns(messages, repeated)},
+                                            ensure_ascii=False) + "\n")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    clusters = sorted(
+        ({"representative": representatives[rep], "duplicates": members, "size": len(members) + 1}
+         for rep, members in duplicates.items()),
+        key=lambda cluster: cluster["size"], reverse=True
+    )
+    duplicate_turns = sum(len(members) for members in duplicates.values())
+    return {
+        "stats": {
+            "conversations": conversations,
+            "turns": turns,
+            "unique_turns": len(representatives),
+            "duplicate_turns": duplicate_turns,
+            "duplicate_rate": round(duplicate_turns / turns, 4) if turns else 0.0,
+            "clusters": len(clusters),
+            "eval_references": len(eval_texts),
+            "eval_overlap_turns": len(overlaps),
+            "eval_references_leaked": len({(o["eval_source"], o["eval_text"]) for o in overlaps}),
+            "leaking_conversations": leaking,
+            "kept_conversations": kept,
+            "num_perm": num_perm,
+            "bands": index.bands,
+            "rows": index.rows,
+            "threshold": threshold,
+            "seconds": round(time.perf_counter() - start, 2),
+        },
+        "clusters": clusters,
+        "eval_overlap": overlaps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate detection for chat corpora.")
+    parser.add_argument("sources", type=Path, nargs="+", help=".csv (Instruction/Output), .json or .jsonl files")
+    parser.add_argument("--eval", type=Path, nargs="+", default=[], help="eval reference files to check for leakage")
+    parser.add_argument("--roles", nargs="+", default=["assistant"], help="which turns to compare")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity counted as a duplicate")
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--report", type=Path, help="write the full report as JSON")
+    parser.add_argument("--output", type=Path, help="write the deduplicated conversations as JSONL")
+    parser.add_argument("--show", type=int, default=10, help="clusters to print")
+    args = parser.parse_args()
+
+    report = deduplicate(args.sources, args.eval, args.roles, args.num_perm, args.threshold, args.output)
+    stats = report["stats"]
+    print(f"{stats['turns']} turns in {stats['conversations']} conversations, {stats['seconds']}s "
+          f"({stats['bands']} bands x {stats['rows']} rows)")
+    print(f"  duplicates: {stats['duplicate_turns']} ({stats['duplicate_rate']:.1%}) in {stats['clusters']} clusters")
+    if stats["eval_references"]:
+        print(f"  eval overlap: {stats['eval_overlap_turns']} training turns match "
+              f"{stats['eval_references_leaked']}/{stats['eval_references']} eval references "
+              f"({stats['leaking_conversations']} conversations dropped)")
+    print(f"  kept conversations: {stats['kept_conversations']}/{stats['conversations']}")
+
+    for cluster in report["clusters"][:args.show]:
+        print(f"\n[{cluster['size']}] {cluster['representative']['text'][:100]}")
+        for member in cluster["duplicates"][:3]:
+            print(f"      {member['similarity']:.2f} {member['text'][:100]}")
+
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from compile_dataset import IGNORE_INDEX, MANIFEST, PackedDataset, collate_packed, write_shards
+import json
+
+import numpy as np
+
+
+def compiled(tmp_path):
+    examples = [
+        ([5, 6, 7], np.array([0, 1, 1], dtype=np.uint8)),
+        ([8, 9], np.array([0, 1], dtype=np.uint8)),
+        ([10, 11, 12, 13], np.array([0, 0, 1, 1], dtype=np.uint8)),
+    ]
+    shards = write_shards(tmp_path, examples, [[0, 1], [2]], max_length=8, pad_token_id=0, shard_size=16)
+    (tmp_path / MANIFEST).write_text(json.dumps({"shards": shards}))
+    return PackedDataset(str(tmp_path))
+
+
+def test_items_are_cut_to_their_packed_length(tmp_path):
+    item = compiled(tmp_path)[0]
+    assert item["input_ids"].tolist() == [5, 6, 7, 8, 9]
+    assert item["labels"].tolist() == [IGNORE_INDEX, 6, 7, IGNORE_INDEX, 9]
+    assert item["position_ids"].tolist() == [0, 1, 2, 0, 1]
+
+
+def test_batch_is_flattened_into_one_row(tmp_path):
+    dataset = compiled(tmp_path)
+    batch = collate_packed([dataset[0], dataset[1]])
+
+    assert "attention_mask" not in batch
+    assert batch["input_ids"].tolist() == [[5, 6, 7, 8, 9, 10, 11, 12, 13]]
+    assert batch["position_ids"].tolist() == [[0, 1, 2, 0, 1, 0, 1, 2, 3]]
+    assert batch["labels"].tolist() == [[IGNORE_INDEX, 6, 7, IGNORE_INDEX, 9, IGNORE_INDEX, IGNORE_INDEX, 12, 13]]
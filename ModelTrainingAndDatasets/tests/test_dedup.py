@@ -0,0 +1,62 @@
+from dedup import choose_bands, deduplicate
+import json
+
+
+def write_jsonl(path, conversations):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, messages in enumerate(conversations):
+            f.write(json.dumps({"conversation_id": i, "messages": messages}) + "\n")
+
+
+def exchange(prompt, reply):
+    return [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["messages"] for line in f]
+
+
+def test_mixed_conversation_loses_only_its_duplicate_turns(tmp_path):
+    source = tmp_path / "train.jsonl"
+    write_jsonl(source, [
+        exchange("Where to eat?", "Go Maxwell food centre, the chicken rice there damn shiok"),
+        exchange("Lunch where?", "Go Maxwell food centre lah, the chicken rice there damn shiok!!")
+        + exchange("Then after that?", "Walk over to Chinatown complex and buy some kueh for tea break"),
+    ])
+    output = tmp_path / "out.jsonl"
+
+    report = deduplicate([source], output=output)
+
+    assert report["stats"]["duplicate_turns"] == 1
+    assert read_output(output) == [
+        exchange("Where to eat?", "Go Maxwell food centre, the chicken rice there damn shiok"),
+        exchange("Then after that?", "Walk over to Chinatown complex and buy some kueh for tea break"),
+    ]
+
+
+def test_conversation_with_leaking_turn_is_dropped(tmp_path):
+    source = tmp_path / "train.jsonl"
+    write_jsonl(source, [
+        exchange("Weekend plans?", "Going East Coast Park to cycle and makan at the hawker centre")
+        + exchange("Nice, with who?", "Bring the whole family along, confirm very happening one"),
+        exchange("Weather how?", "Today very humid, sweating like mad just walking to the MRT"),
+    ])
+    references = tmp_path / "eval.json"
+    references.write_text(json.dumps(["Bring the whole family along lor, confirm very happening one"]))
+    output = tmp_path / "out.jsonl"
+
+    report = deduplicate([source], eval_sources=[references], output=output)
+
+    assert report["stats"]["eval_overlap_turns"] == 1
+    assert report["stats"]["leaking_conversations"] == 1
+    assert report["stats"]["unique_turns"] == 1
+    assert read_output(output) == [
+        exchange("Weather how?", "Today very humid, sweating like mad just walking to the MRT"),
+    ]
+
+
+def test_lsh_threshold_sits_below_similarity_threshold():
+    bands, rows = choose_bands(128, 0.8)
+    assert (bands, rows) == (16, 8)
+    assert (1 / bands) ** (1 / rows) < 0.8